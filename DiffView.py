@@ -2,13 +2,16 @@ import sublime
 import sublime_plugin
 import os
 import codecs
+import itertools
 import threading
 import time
 import tempfile
 
 from .util.view_finder import ViewFinder
 from .util.constants import Constants
-from .util.vcs import NoVCSError
+from .util.vcs import NoVCSError, VCSTimeoutError
+from .util.cancel import DiffCancelled
+from .util.perf import PerfRun
 from .parser.diff_parser import DiffParser
 
 
@@ -18,10 +21,17 @@ class DiffView(sublime_plugin.WindowCommand):
     Asks for input for what to diff against; a Git SHA/branch/tag.
     """
     diff_args = ''
+    # Working copy diffs that are kept up to date as files are saved, keyed by window ID.
+    live_diffs = {}
 
     def _prepare(self):
         """Some preparation common to all subclasses."""
+        if hasattr(self.window, 'last_diff'):
+            # A new diff supersedes any that's still running.
+            self.window.last_diff.cancel()
         self.window.last_diff = self
+        # Set once the diff starts - it may never do so (e.g. if the input panel is dismissed).
+        self.parser = None
         self.last_hunk_index = 0
         self.settings = sublime.load_settings('DiffView.sublime-settings')
         self.debug = self.settings.get("debug", False)
@@ -34,7 +44,11 @@ class DiffView(sublime_plugin.WindowCommand):
             "ADD": self.settings.get("add_highlight_style", "support.class"),
             "MOD": self.settings.get("mod_highlight_style", "string"),
             "DEL": self.settings.get("del_highlight_style", "invalid"),
+            "WORD": self.settings.get("word_highlight_style", "string"),
             "LIST_SEL": self.settings.get("list_sel_highlight_style", "comment")}
+        self.prefetch_count = self.settings.get("prefetch_files", 5)
+        # Identifies the latest request for a file to be shown - see `when_file_ready`.
+        self.file_request = None
 
         # Set up the groups
         self.list_group = 0
@@ -92,6 +106,9 @@ class DiffView(sublime_plugin.WindowCommand):
             cwd: [optional] the [c]urrent [w]orking [d]irectory to open the diff in. If not present, this will default to the cwd of the currently open file
         """
         self.diff_args = diff_args
+        self.cancel()
+        self.orig_layout = None
+        DiffView.live_diffs.pop(self.window.id(), None)
 
         try:
             # Create the diff parser
@@ -101,18 +118,84 @@ class DiffView(sublime_plugin.WindowCommand):
                 self.diff_args,
                 cwd,
                 debug=self.debug,
-                get_diff_headers=self.collapse_diff_list)
+                get_diff_headers=self.collapse_diff_list,
+                cache_dir=os.path.join(sublime.cache_path(), 'DiffView'),
+                cache_size=self.settings.get("cache_size_mb", 200) * 1024 * 1024,
+                max_file_size=self.settings.get("max_file_size_kb", 5120) * 1024,
+                timeout=self.settings.get("vcs_timeout", 120) or None,
+                in_process=self.settings.get("read_git_objects_directly", True),
+                profile_dir=(os.path.join(sublime.cache_path(), 'DiffView', 'profiles')
+                             if self.settings.get("profile_diffs", False) else None),
+                cache_diffs=self.settings.get("cache_diffs", True))
         except NoVCSError:
             # No changes; say so
             sublime.message_dialog("This file does not appear to be under version control (Git, SVN or Bazaar).")
             return
 
+        # Run the diff in the background, showing changes as they're found.
+        self.changes_list_view = None
+        threading.Thread(target=self.run_parser, args=(self.parser,)).start()
+
+    def run_parser(self, parser):
+        """Run the diff parser, updating the list of changes as it goes.
+
+        Runs in a background thread.
+
+        Args:
+            parser: The `DiffParser` to run.
+        """
+        def on_file_parsed(changed_file):
+            if self.view_style == "persistent_list":
+                sublime.set_timeout(lambda: self.update_changed_hunks(parser), 0)
+
+        try:
+            parser.run(on_file_parsed)
+        except DiffCancelled:
+            # Superseded by another diff, or cancelled by the user - nothing to show.
+            return
+        except VCSTimeoutError as e:
+            sublime.set_timeout(lambda: sublime.error_message("DiffView: {}".format(e)), 0)
+            return
+        sublime.set_timeout(lambda: self.parser_finished(parser), 0)
+
+    def cancel(self):
+        """Cancel the diff, if it's still running."""
+        parser = getattr(self, 'parser', None)
+        if parser is not None:
+            parser.cancel()
+
+    def update_changed_hunks(self, parser):
+        """Show changed hunks that have been found since the list was last updated.
+
+        Args:
+            parser: The `DiffParser` that found the hunks.
+        """
+        if parser is not self.parser or parser.cancelled or not self.parser.changed_hunks:
+            # Stale update from an old or cancelled diff, or nothing to show yet.
+            return
+        if self.changes_list_view is None:
+            self.list_changed_hunks()
+        else:
+            self.append_changed_hunks()
+
+    def parser_finished(self, parser):
+        """Called once the diff parser has found all the changes.
+
+        Args:
+            parser: The `DiffParser` that has finished.
+        """
+        if parser is not self.parser or parser.cancelled:
+            return
+        if self.settings.get("live_update", True) and parser.is_live():
+            DiffView.live_diffs[self.window.id()] = self
         if not self.parser.changed_hunks:
             # No changes; say so
             sublime.message_dialog("No changes to report...")
-        else:
-            # Show the list of changed hunks
+        elif self.view_style == "quick_panel":
+            # The quick panel can't be added to once shown, so only show it once all changes are known.
             self.list_changed_hunks()
+        else:
+            self.update_changed_hunks(parser)
 
     def list_changed_hunks(self):
         """Show a list of changed hunks in a quick panel."""
@@ -125,28 +208,27 @@ class DiffView(sublime_plugin.WindowCommand):
         self.orig_layout = self.window.layout()
         self.window.set_layout(self.diff_layout)
 
+        # Get the files around the first change to be shown ready, while the list is set up.
+        self.prefetch_files(self.last_hunk_index)
+
         if self.view_style == "quick_panel":
             # Start listening for the quick panel creation, then create it.
             ViewFinder.instance().start_listen(self.quick_panel_found)
+            with self.parser.perf.span('list'):
+                descriptions = [h.description for h in self.parser.changed_hunks]
             self.window.show_quick_panel(
-                [h.description for h in self.parser.changed_hunks],
+                descriptions,
                 self.show_hunk_diff,
                 sublime.MONOSPACE_FONT | sublime.KEEP_OPEN_ON_FOCUS_LOST,
                 self.last_hunk_index,
                 self.preview_hunk)
         else:
             # Put the hunks list in the top panel
+            self.listed_hunks = len(self.parser.changed_hunks)
+            self.fold_regions = []
             self.changes_list_file = tempfile.mkstemp()[1]
             with codecs.open(self.changes_list_file, 'w', 'utf-8') as f:
-                def get_prefix(hunk):
-                    # Prefix with indent if not a header and using headers
-                    if self.collapse_diff_list and not hasattr(hunk, 'n_changes'):
-                        return "  "
-                    return ""
-
-                changes_list = " \n".join(
-                    [get_prefix(h) + h.oneline_description for h in self.parser.changed_hunks])
-                f.write(changes_list + " ")
+                f.write(self.changes_list_text(self.parser.changed_hunks[:self.listed_hunks]))
             self.changes_list_view = self.window.open_file(
                 self.changes_list_file,
                 flags=sublime.TRANSIENT |
@@ -170,31 +252,7 @@ class DiffView(sublime_plugin.WindowCommand):
 
                 # Add folding regions if configured
                 if self.collapse_diff_list:
-                    # Arrange the changes into per-file collapsing regions
-                    n_hunks = len(self.parser.changed_hunks)
-                    line = 0
-                    regions = []
-                    while line < n_hunks:
-                        header = self.parser.changed_hunks[line]
-                        file_hunks = header.n_changes
-                        fold_region = sublime.Region(
-                            self.changes_list_view.text_point(line + 1, 0) - 1,
-                            self.changes_list_view.text_point(line + file_hunks + 1, 0) - 1)
-                        regions.append(fold_region)
-
-                        # For simplicity, give each hunk in the file a reference to the region.
-                        next_header = line + file_hunks + 1
-                        while line < next_header:
-                            self.parser.changed_hunks[line].fold_region = fold_region
-                            line += 1
-
-                    # Add the regions to the view and fold them by default
-                    self.changes_list_view.add_regions(
-                        Constants.ADD_REGION_KEY,
-                        regions,
-                        "string",
-                        flags=sublime.HIDDEN)
-                    self.changes_list_view.fold(regions)
+                    self.add_fold_regions(0, listed_hunks)
 
             # Listen for changes to this view's selection.
             DiffViewEventListner.instance().start_listen(
@@ -203,8 +261,183 @@ class DiffView(sublime_plugin.WindowCommand):
                 self)
 
             # Choose the last selected change, when the view's ready
+            listed_hunks = self.listed_hunks
             threading.Thread(target=select_latest_diff_when_ready, args=(self.changes_list_view,)).start()
 
+    def changes_list_text(self, hunks):
+        """Get the text for some of the lines in the persistent list of changes.
+
+        Args:
+            hunks: The changed hunks to get the text for.
+
+        Returns:
+            The text of the lines, with no trailing newline.
+        """
+        return "\n".join(self.changes_list_lines(hunks))
+
+    def changes_list_lines(self, hunks):
+        """Get some of the lines in the persistent list of changes.
+
+        Args:
+            hunks: The changed hunks to get the lines for.
+
+        Returns:
+            A list of the lines, without newlines.
+        """
+        def get_prefix(hunk):
+            # Prefix with indent if not a header and using headers
+            if self.collapse_diff_list and not hasattr(hunk, 'n_changes'):
+                return "  "
+            return ""
+
+        with self.parser.perf.span('list'):
+            return [get_prefix(h) + h.oneline_description + " " for h in hunks]
+
+    def append_changed_hunks(self):
+        """Add any newly found changes to the end of the persistent list of changes."""
+        view = self.changes_list_view
+        if view.window() is None:
+            # The list has been closed - it'll be up to date when it's next shown.
+            return
+        if view.is_loading():
+            # Try again once the initial list has loaded.
+            sublime.set_timeout(lambda: self.update_changed_hunks(self.parser), 50)
+            return
+
+        new_hunks = self.parser.changed_hunks[self.listed_hunks:]
+        if not new_hunks:
+            return
+        first_new_line = self.listed_hunks
+        self.listed_hunks += len(new_hunks)
+        view.run_command("diff_list_append", args={'text': "\n" + self.changes_list_text(new_hunks)})
+
+        if self.collapse_diff_list:
+            self.add_fold_regions(first_new_line, self.listed_hunks)
+
+    def add_fold_regions(self, first_line, end_line, fold=True):
+        """Arrange the changes into per-file collapsing regions, and fold them by default.
+
+        Args:
+            first_line: The first line in the changes list that needs folding regions adding.
+            end_line: The line after the last one that needs folding regions adding.
+            fold: [optional] Whether to fold the new regions.
+        """
+        line = first_line
+        new_regions = []
+        while line < end_line:
+            header = self.parser.changed_hunks[line]
+            file_hunks = header.n_changes
+            fold_region = sublime.Region(
+                self.changes_list_view.text_point(line + 1, 0) - 1,
+                self.changes_list_view.text_point(line + file_hunks + 1, 0) - 1)
+            new_regions.append(fold_region)
+
+            # For simplicity, give each hunk in the file a reference to the region.
+            next_header = line + file_hunks + 1
+            while line < next_header:
+                self.parser.changed_hunks[line].fold_region = fold_region
+                line += 1
+
+        # Add the regions to the view and fold them by default
+        self.fold_regions += new_regions
+        self.changes_list_view.add_regions(
+            Constants.ADD_REGION_KEY,
+            self.fold_regions,
+            "string",
+            flags=sublime.HIDDEN)
+        if fold:
+            self.changes_list_view.fold(new_regions)
+
+    def file_saved(self, abs_filename):
+        """Update a live diff after a file has been saved.
+
+        Runs in a background thread.
+
+        Args:
+            abs_filename: The absolute path of the saved file.
+        """
+        parser = self.parser
+        try:
+            change = parser.rediff_file(abs_filename)
+            if change is None:
+                return
+            # Set up the re-diffed file here, so its changes can be highlighted in the saved view.
+            for file_diff in set(h.file_diff for h in change[2]):
+                if file_diff.abs_filename == abs_filename:
+                    parser.ensure_file_ready(file_diff)
+        except (DiffCancelled, VCSTimeoutError):
+            return
+        sublime.set_timeout(lambda: self.update_live_changes(parser, abs_filename, change), 0)
+
+    def update_live_changes(self, parser, abs_filename, change):
+        """Show the changes to a file that has been re-diffed, keeping the same change selected.
+
+        Args:
+            parser: The `DiffParser` that re-diffed the file.
+            abs_filename: The absolute path of the file.
+            change: The `(start, old_count, new_hunks)` tuple returned by `DiffParser.rediff_file`.
+        """
+        if parser is not self.parser:
+            return
+        (start, old_count, new_hunks) = change
+        end = start + old_count
+
+        def adjust_index(index):
+            # Move the index to the same change - or the nearest one if its change has gone.
+            if index >= end:
+                return index + len(new_hunks) - old_count
+            if index >= start:
+                index = min(index, start + len(new_hunks) - 1) if new_hunks else start
+            return max(0, min(index, len(self.parser.changed_hunks) - 1))
+
+        self.last_hunk_index = adjust_index(self.last_hunk_index)
+
+        view = self.changes_list_view
+        if self.view_style != "persistent_list" or view is None or view.window() is None or view.is_loading():
+            # No list to update - it'll be up to date when it's next shown.
+            return
+
+        # Replace just the lines for the re-diffed file.
+        lines = self.changes_list_lines(new_hunks)
+        if end < self.listed_hunks:
+            region = sublime.Region(view.text_point(start, 0), view.text_point(end, 0))
+            text = "".join(line + "\n" for line in lines)
+        elif start == 0:
+            region = sublime.Region(0, view.size())
+            text = "\n".join(lines)
+        else:
+            # The last lines, so the newline before them goes instead of the one after.
+            begin = view.text_point(start, 0) - 1 if start < self.listed_hunks else view.size()
+            region = sublime.Region(begin, view.size())
+            text = "".join("\n" + line for line in lines)
+        view.run_command("diff_list_replace", args={'begin': region.a, 'end': region.b, 'text': text})
+        self.listed_hunks += len(new_hunks) - old_count
+
+        if self.collapse_diff_list:
+            # Everything after the change has moved, so work out the regions again - only folding the new ones.
+            self.fold_regions = []
+            self.add_fold_regions(0, self.listed_hunks, fold=False)
+            view.fold([h.fold_region for h in new_hunks if hasattr(h, 'n_changes')])
+
+        listener = DiffViewEventListner.instance()
+        if listener._listening and listener.view == view:
+            # Keep the selection on the same change, without previewing it again.
+            listener.current_row = adjust_index(listener.current_row)
+            view.run_command(
+                "show_diff_list",
+                args={'last_selected': listener.current_row,
+                      'style': self.styles['LIST_SEL']})
+
+            # Refresh the highlighting in the saved file, if it's open.
+            saved_view = self.window.find_open_file(abs_filename)
+            if saved_view is not None:
+                for key in [Constants.ADD_REGION_KEY, Constants.MOD_REGION_KEY, Constants.DEL_REGION_KEY,
+                            Constants.WORD_REGION_KEY]:
+                    saved_view.erase_regions(key)
+                for file_diff in set(h.file_diff for h in new_hunks):
+                    if file_diff.abs_filename == abs_filename and parser.is_file_ready(file_diff):
+                        file_diff.add_new_regions(saved_view, self.styles)
+
     def show_hunk_diff(self, hunk_index):
         """Open the location of the selected hunk.
 
@@ -218,6 +451,7 @@ class DiffView(sublime_plugin.WindowCommand):
             view.erase_regions(Constants.ADD_REGION_KEY)
             view.erase_regions(Constants.MOD_REGION_KEY)
             view.erase_regions(Constants.DEL_REGION_KEY)
+            view.erase_regions(Constants.WORD_REGION_KEY)
 
         if hunk_index == -1:
             self.reset_window()
@@ -230,8 +464,12 @@ class DiffView(sublime_plugin.WindowCommand):
 
         self.last_hunk_index = hunk_index
         hunk = self.parser.changed_hunks[hunk_index]
-        (_, new_filespec) = hunk.filespecs()
-        self.window.open_file(new_filespec, sublime.ENCODED_POSITION)
+
+        def open_file():
+            (_, new_filespec) = hunk.filespecs()
+            self.window.open_file(new_filespec, sublime.ENCODED_POSITION)
+
+        self.when_file_ready(hunk.file_diff, open_file)
 
     def preview_hunk(self, hunk_index):
         """Show a preview of the selected hunk.
@@ -240,12 +478,26 @@ class DiffView(sublime_plugin.WindowCommand):
             hunk_index: the selected index in the changed hunks list.
         """
         hunk = self.parser.changed_hunks[hunk_index]
+        if hunk.file_diff.skip_reason:
+            # The contents of this file aren't shown.
+            sublime.status_message("{}: {}".format(hunk.file_diff.filename, hunk.file_diff.skip_reason))
+            return
+        self.when_file_ready(hunk.file_diff, lambda: self.open_previews(hunk))
+        self.prefetch_files(hunk_index)
+
+    def open_previews(self, hunk):
+        """Show the old and new versions of a hunk's file side by side, with the changes highlighted.
+
+        Args:
+            hunk: The hunk to show.
+        """
         (old_filespec, new_filespec) = hunk.filespecs()
 
         def highlight_when_ready(view, highlight_fn):
             while view.is_loading():
                 time.sleep(0.1)
-            highlight_fn(view, self.styles)
+            with self.parser.perf.span('regions'):
+                highlight_fn(view, self.styles)
 
         def open_preview(filespec, group, highlight_fn):
             view = self.window.open_file(
@@ -265,6 +517,79 @@ class DiffView(sublime_plugin.WindowCommand):
             # Keep the focus in the quick panel
             self.window.focus_view(self.qpanel)
 
+    def when_file_ready(self, file_diff, callback):
+        """Call a function once a changed file's versions have been set up, so it can be shown.
+
+        If the file isn't ready yet, it's set up in the background, then the function is called on the main thread -
+        unless another file has been asked for in the meantime.
+
+        Args:
+            file_diff: The `FileDiff` for the file.
+            callback: The function to call.
+        """
+        parser = self.parser
+        self.file_request = request = object()
+        if parser.is_file_ready(file_diff):
+            callback()
+            return
+
+        def set_up_file():
+            try:
+                parser.ensure_file_ready(file_diff)
+            except DiffCancelled:
+                return
+            except VCSTimeoutError as e:
+                sublime.set_timeout(lambda: sublime.error_message("DiffView: {}".format(e)), 0)
+                return
+            sublime.set_timeout(lambda: callback() if self.file_request is request else None, 0)
+
+        sublime.status_message("Getting {}...".format(file_diff.filename))
+        threading.Thread(target=set_up_file).start()
+
+    def prefetch_files(self, hunk_index):
+        """Start setting up the files of the changes after a change in the list, so they're ready to show.
+
+        Args:
+            hunk_index: The index of the change in the changed hunks list.
+        """
+        changed_files = self.parser.changed_files
+        try:
+            file_index = changed_files.index(self.parser.changed_hunks[hunk_index].file_diff)
+        except (IndexError, ValueError):
+            return
+        # The change's own file is the one being shown, so it's set up (if needed) by `when_file_ready`.  Files with no
+        # contents to get don't count towards the limit.
+        file_diffs = (f for f in itertools.islice(changed_files, file_index + 1, None)
+                      if f.content_changed and not f.skip_reason)
+        self.parser.prefetch_files(list(itertools.islice(file_diffs, self.prefetch_count)))
+
+    def goto_adjacent_hunk(self, forward):
+        """Move the cursor in the active view to the next or previous change in its file.
+
+        Uses the file's index of changes, so nothing needs to be shown again.
+
+        Args:
+            forward: Whether to go to the next change, rather than the previous one.
+        """
+        view = self.window.active_view()
+        if view is None or view.file_name() is None:
+            return
+        (file_diff, old) = self.parser.find_file(view.file_name())
+        if file_diff is None:
+            sublime.status_message("This file isn't part of the diff")
+            return
+
+        (row, _) = view.rowcol(view.sel()[0].begin())
+        hunk = file_diff.find_adjacent_hunk(row + 1, forward, old)
+        if hunk is None:
+            sublime.status_message("No more changes in this file")
+            return
+        line = hunk.old_line_focus if old else hunk.new_line_focus
+        point = view.text_point(line - 1, 0)
+        view.sel().clear()
+        view.sel().add(sublime.Region(point, point))
+        view.show_at_center(point)
+
     def list_toggle_fold(self, hunk_index):
         hunk = self.parser.changed_hunks[hunk_index]
         fold_region = hunk.fold_region
@@ -276,7 +601,12 @@ class DiffView(sublime_plugin.WindowCommand):
 
 
     def reset_window(self):
-        """Reset the window to its original state."""
+        """Reset the window to its original state, cancelling the diff if it's still running."""
+        self.cancel()
+        if getattr(self, 'orig_layout', None) is None:
+            # The changes haven't been shown yet, so the window hasn't changed.
+            return
+
         if self.view_style == "persistent_list":
             self.changes_list_view.close()
         self.window.set_layout(self.orig_layout)
@@ -290,6 +620,9 @@ class DiffView(sublime_plugin.WindowCommand):
         DiffViewEventListner.instance().stop()
         self.qpanel = None
 
+        # Stop any background VCS processes
+        self.parser.vcs_helper.close()
+
     def quick_panel_found(self, view):
         """Callback to store the quick panel when found.
 
@@ -299,14 +632,30 @@ class DiffView(sublime_plugin.WindowCommand):
         self.qpanel = view
 
 
+def active_diff(window):
+    """Get a window's latest diff, if it has started and hasn't been cancelled.
+
+    Args:
+        window: The window.
+
+    Returns:
+        The `DiffView` command that ran the diff, or `None`.
+    """
+    diff = getattr(window, 'last_diff', None)
+    if diff is None or getattr(diff, 'parser', None) is None or diff.parser.cancelled:
+        return None
+    return diff
+
+
 class DiffHunksList(sublime_plugin.WindowCommand):
     def run(self):
         """Resume the previous diff.
 
         Displays the list of changed hunks starting from the last hunk viewed.
         """
-        if hasattr(self.window, 'last_diff'):
-            self.window.last_diff.list_changed_hunks()
+        diff = active_diff(self.window)
+        if diff is not None:
+            diff.list_changed_hunks()
 
 
 class DiffCancel(sublime_plugin.WindowCommand):
@@ -316,6 +665,32 @@ class DiffCancel(sublime_plugin.WindowCommand):
             self.window.last_diff.reset_window()
 
 
+class DiffNextHunkCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        """Go to the next change in the current file."""
+        diff = active_diff(self.window)
+        if diff is not None:
+            diff.goto_adjacent_hunk(True)
+
+
+class DiffPrevHunkCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        """Go to the previous change in the current file."""
+        diff = active_diff(self.window)
+        if diff is not None:
+            diff.goto_adjacent_hunk(False)
+
+
+class DiffPerfReportCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        """Show where the time went in the most recent diffs."""
+        view = self.window.new_file()
+        view.set_name("Diff View performance report")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": PerfRun.history_report() + "\n"})
+        view.set_read_only(True)
+
+
 class DiffShowSelected(sublime_plugin.WindowCommand):
     def run(self):
         """Show the change that's curently selected by this view."""
@@ -363,6 +738,38 @@ class ShowDiffListCommand(sublime_plugin.TextCommand):
             flags=Constants.SELECTED_CHANGE_FLAGS)
 
 
+class DiffListReplaceCommand(sublime_plugin.TextCommand):
+    """Command to replace some of the text in the (read-only) diff list."""
+
+    def run(self, edit, begin, end, text):
+        """Entry point for running the command.
+
+        Args:
+            edit: The edit for this `TextCommand`.
+            begin: The start of the text to replace.
+            end: The end of the text to replace.
+            text: The replacement text.
+        """
+        self.view.set_read_only(False)
+        self.view.replace(edit, sublime.Region(begin, end), text)
+        self.view.set_read_only(True)
+
+
+class DiffListAppendCommand(sublime_plugin.TextCommand):
+    """Command to add text to the end of the (read-only) diff list."""
+
+    def run(self, edit, text):
+        """Entry point for running the command.
+
+        Args:
+            edit: The edit for this `TextCommand`.
+            text: The text to append.
+        """
+        self.view.set_read_only(False)
+        self.view.insert(edit, self.view.size(), text)
+        self.view.set_read_only(True)
+
+
 class DiffViewEventListner(sublime_plugin.EventListener):
     """Helper class for catching events during a diff."""
     _instance = None
@@ -400,6 +807,21 @@ class DiffViewEventListner(sublime_plugin.EventListener):
                     self.diff.styles["LIST_SEL"],
                     flags=Constants.SELECTED_CHANGE_FLAGS)
 
+    def on_post_save_async(self, view):
+        """Called when a file has been saved.
+
+        Keeps a live working copy diff in the view's window up to date with the saved file.
+
+        Args:
+            view: The view that's been saved.
+        """
+        window = view.window()
+        if window is None or view.file_name() is None:
+            return
+        diff = DiffView.live_diffs.get(window.id())
+        if diff is not None:
+            diff.file_saved(view.file_name())
+
     def on_query_context(self, view, key, operator, operand, match_all):
         """Context queries mean someone is trying to work out whether to override key bindings.
 
@@ -0,0 +1,107 @@
+"""Benchmark getting the old versions of changed files from Git, with and without the in-process object reader.
+
+For each of `--files`, creates a packed repo with that many changed files, then times getting the old version of every
+file in a diff of the last commit by blob ID through `GitHelper.write_version_content` (as `DiffParser` does) - writing
+it to `os.devnull`, to time just reading it, and then to disk - using `git cat-file` and then the in-process reader.
+Each timing includes starting `git cat-file` where it's used, but not finding the changed files.
+
+Once `git cat-file` is running, reading a blob by ID costs about the same either way - the in-process reader saves
+starting it, which is most of the time for the small diffs that are most common (and for live re-diffs of single
+files).
+
+Usage: python benchmarks/bench_git_objects.py [--files N [N ...]] [--repeat N]
+"""
+import argparse
+import importlib
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from bench_util import load_diffview
+
+DIFF_ARGS = 'HEAD~1..HEAD'
+
+
+def git(repo, *args):
+    return subprocess.check_output(('git',) + args, cwd=repo)
+
+
+def make_repo(num_files):
+    repo = tempfile.mkdtemp()
+    git(repo, 'init', '-q')
+    git(repo, 'config', 'user.email', 'bench@example.com')
+    git(repo, 'config', 'user.name', 'Bench')
+    filenames = [os.path.join('src', 'dir{}'.format(i % 20), 'file{}.py'.format(i)) for i in range(num_files)]
+    for version in range(3):
+        for (i, filename) in enumerate(filenames):
+            path = os.path.join(repo, filename)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # Each version changes a few lines, like a typical edit.
+            rand = random.Random(i)
+            lines = ['    value_{} = compute({}, {})\n'.format(rand.randint(0, 10 ** 6), i, line)
+                     for line in range(400)]
+            for line in range(version * 7, 400, 97):
+                lines[line] = '    changed = {}\n'.format(version)
+            with open(path, 'w') as f:
+                f.write(''.join(lines))
+        git(repo, 'add', '-A')
+        git(repo, 'commit', '-q', '-m', 'Version {}'.format(version))
+    git(repo, 'gc', '-q')
+    return (repo, filenames)
+
+
+def get_changed_files(vcs, repo):
+    helper = vcs.GitHelper(repo)
+    try:
+        context = vcs.VCSContext()
+        (old_ver, _) = helper.get_file_versions(DIFF_ARGS, context)
+        return (old_ver, helper.get_changed_files(DIFF_ARGS, context=context))
+    finally:
+        helper.close()
+
+
+def materialize(vcs, repo, old_ver, changed_files, in_process, write):
+    out_dir = tempfile.mkdtemp()
+    helper = vcs.GitHelper(repo)
+    context = vcs.VCSContext(in_process=in_process)
+    try:
+        start = time.perf_counter()
+        for (i, changed_file) in enumerate(changed_files):
+            path = os.path.join(out_dir, str(i)) if write else os.devnull
+            helper.write_version_content(changed_file, old_ver, True, path, context)
+        return time.perf_counter() - start
+    finally:
+        helper.close()
+        shutil.rmtree(out_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', type=int, nargs='+', default=[1, 10, 100, 500],
+                        help='Numbers of changed files to get')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of times to repeat each timing')
+    args = parser.parse_args()
+
+    load_diffview()
+    vcs = importlib.import_module('DiffView.util.vcs')
+    for num_files in args.files:
+        (repo, _) = make_repo(num_files)
+        try:
+            (old_ver, changed_files) = get_changed_files(vcs, repo)
+            # Reading on its own, then writing to disk as well - which is often the bigger cost.
+            for (operation, write) in [('read', False), ('read + write', True)]:
+                for (name, in_process) in [('git cat-file', False), ('in-process', True)]:
+                    best = min(materialize(vcs, repo, old_ver, changed_files, in_process, write)
+                               for _ in range(args.repeat))
+                    print('{:>5} files {:<13} {:<13} {:8.1f} ms total {:8.3f} ms/file'.format(
+                        num_files, operation, name, best * 1000, best * 1000 / len(changed_files)))
+        finally:
+            shutil.rmtree(repo)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark the memory used by a parsed diff.
+
+Parses diffs with increasing numbers of hunks and uses `tracemalloc` to measure the memory the parsed `FileDiff` (and
+its hunks and regions) keeps hold of, and the peak while parsing.  The diff text itself is counted as part of what's
+kept, since the VCS output isn't otherwise referenced once it's been split into files.
+
+Usage: python benchmarks/bench_memory.py [--hunks N [N ...]]
+"""
+import argparse
+import gc
+import importlib
+import tracemalloc
+
+from bench_util import load_diffview
+from bench_parse import make_diff
+
+
+def measure(file_diff_module, num_hunks):
+    """Parse a diff with `num_hunks` hunks.
+
+    Returns:
+        A tuple of `(retained, peak)` - the bytes still allocated once the diff is parsed, and the most allocated at
+        any point while it was being parsed.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        diff = file_diff_module.FileDiff('data.txt', '/path/to/data.txt', make_diff(num_hunks))
+        hunks = diff.get_hunks()
+        assert len(hunks) == num_hunks
+        # Everything the list views and region highlighting use.
+        for hunk in hunks:
+            hunk.filespecs()
+        gc.collect()
+        (retained, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (retained, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hunks', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Numbers of hunks to parse')
+    args = parser.parse_args()
+
+    load_diffview()
+    file_diff = importlib.import_module('DiffView.parser.file_diff')
+
+    print('{:>8} {:>14} {:>14} {:>16}'.format('hunks', 'retained (MB)', 'peak (MB)', 'bytes per hunk'))
+    for num_hunks in args.hunks:
+        (retained, peak) = measure(file_diff, num_hunks)
+        print('{:8} {:14.1f} {:14.1f} {:16,.0f}'.format(
+            num_hunks, retained / 1e6, peak / 1e6, retained / num_hunks))
+
+
+if __name__ == '__main__':
+    main()
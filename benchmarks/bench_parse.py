@@ -0,0 +1,83 @@
+"""Benchmark parsing a single file's diff into hunks.
+
+Generates diffs with increasing numbers of hunks (as for generated code, lockfiles or data fixtures) and times listing
+them - `FileDiff.get_hunks`, and each hunk's list description - then getting all the hunks' regions.  Listing is linear
+in the number of hunks, so the time per hunk should stay flat as the number of hunks grows, and shouldn't grow much
+with `--lines` (the number of changed lines per hunk).  `--context` adds context lines to each hunk, as SVN and Bzr
+diffs have.
+
+Usage: python benchmarks/bench_parse.py [--hunks N [N ...]] [--lines N] [--context N] [--repeat N]
+"""
+import argparse
+import importlib
+import time
+
+from bench_util import load_diffview
+
+
+def make_diff(num_hunks, num_lines=2, num_context=0):
+    """Make the diff for a file with `num_hunks` hunks, each replacing `num_lines` lines with `num_context` lines of
+    context either side.
+    """
+    parts = ['diff --git a/data.txt b/data.txt\nindex 1234567..89abcde 100644\n--- a/data.txt\n+++ b/data.txt\n']
+    hunk_len = num_lines + 2 * num_context
+    context = ''.join(' context {}\n'.format(i) for i in range(num_context))
+    for i in range(num_hunks):
+        line = i * (hunk_len + 10) + 1
+        parts.append('@@ -{0},{1} +{0},{1} @@ section {2}\n'.format(line, hunk_len, i))
+        parts.append(context)
+        parts.append('-old {}\n'.format(i) * num_lines)
+        parts.append('+new {}\n'.format(i) * num_lines)
+        parts.append(context)
+    return ''.join(parts)
+
+
+def time_it(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hunks', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Numbers of hunks to parse')
+    parser.add_argument('--lines', type=int, default=2, help='Number of lines changed in each hunk')
+    parser.add_argument('--context', type=int, default=0, help='Number of context lines either side of each change')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to repeat each timing')
+    args = parser.parse_args()
+
+    load_diffview()
+    file_diff = importlib.import_module('DiffView.parser.file_diff')
+
+    print('{:>8} {:>10} {:>12} {:>14} {:>12} {:>14}'.format(
+        'hunks', 'lines', 'list (s)', 'us per hunk', 'regions (s)', 'us per hunk'))
+    for num_hunks in args.hunks:
+        diff_text = make_diff(num_hunks, args.lines, args.context)
+
+        def list_hunks():
+            diff = file_diff.FileDiff('data.txt', '/path/to/data.txt', diff_text)
+            hunks = diff.get_hunks()
+            assert len(hunks) == num_hunks
+            for hunk in hunks:
+                hunk.oneline_description
+            return hunks
+
+        def get_regions():
+            for hunk in list_hunks():
+                hunk.old_regions
+                hunk.new_regions
+
+        list_time = time_it(list_hunks, args.repeat)
+        regions_time = time_it(get_regions, args.repeat)
+        print('{:8} {:10} {:12.3f} {:14.2f} {:12.3f} {:14.2f}'.format(
+            num_hunks, diff_text.count('\n'), list_time, list_time * 1e6 / num_hunks, regions_time,
+            regions_time * 1e6 / num_hunks))
+
+
+if __name__ == '__main__':
+    main()
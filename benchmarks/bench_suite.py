@@ -0,0 +1,175 @@
+"""Benchmark the diff parser on synthetic diffs, and compare the results against a baseline.
+
+Runs each scenario from `synthetic.py` through the same steps as a diff against the working copy, without running a VCS:
+splitting the diff into files, `DiffParser.prepare_file` (parsing hunks), building the list of changes, and working out
+the changed regions.  Reports throughput (diff lines and hunks per second) and the peak memory
+used, measured with `tracemalloc` in a separate run.
+
+Results are compared against `baseline.json` - a scenario regresses if its throughput drops, or its peak memory grows,
+by more than `--tolerance`.  The exit status is 1 if anything regressed.  Throughput depends on the machine, so save a
+baseline (`--save-baseline`) on the machine that will run the comparisons.
+
+Usage: python benchmarks/bench_suite.py [--scenario NAME [NAME ...]] [--repeat N] [--tolerance F] [--save-baseline]
+"""
+import argparse
+import collections
+import gc
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_util import load_diffview
+import synthetic
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SCENARIOS = collections.OrderedDict([
+    ('many_files', synthetic.many_files),
+    ('huge_file', synthetic.huge_file),
+    ('tiny_hunks', synthetic.tiny_hunks),
+    ('long_lines', synthetic.long_lines),
+])
+
+
+class Runner(object):
+    """Runs diffs through the parser, in a dummy repo so no VCS is needed."""
+
+    def __init__(self):
+        load_diffview()
+        self.diff_parser = importlib.import_module('DiffView.parser.diff_parser')
+        self.file_diff = importlib.import_module('DiffView.parser.file_diff')
+        self.vcs = importlib.import_module('DiffView.util.vcs')
+        self.repo = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.repo, '.git'))
+
+    def close(self):
+        shutil.rmtree(self.repo)
+
+    def run(self, diff_text):
+        """Parse a diff, as `DiffParser.run` does for a diff against the working copy.
+
+        Returns:
+            The number of hunks.
+        """
+        parser = self.diff_parser.DiffParser('', self.repo, cache_dir=os.path.join(self.repo, 'cache'))
+        parser.versions = ('', '')
+        helper = parser.vcs_helper
+        for file_text in helper.split_diff(diff_text.splitlines(True), helper.DIFF_FILE_START):
+            filename = file_text[len(helper.DIFF_FILE_START):].split('\n', 1)[0].split(' b/', 1)[1]
+            changed_file = self.file_diff.FileDiff(filename, os.path.join(self.repo, filename), file_text)
+            parser.changed_files.append(changed_file)
+            parser.changed_hunks.extend(parser.prepare_file(changed_file))
+
+        # The list of changes, and the regions highlighted when each file is shown.
+        '\n'.join(h.oneline_description for h in parser.changed_hunks)
+        for hunk in parser.changed_hunks:
+            hunk.old_regions
+            hunk.new_regions
+        return len(parser.changed_hunks)
+
+
+def measure(runner, diff_text, repeat):
+    """Time parsing a diff, then measure its peak memory.
+
+    Returns:
+        A dict of results.
+    """
+    num_lines = diff_text.count('\n')
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        num_hunks = runner.run(diff_text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        runner.run(diff_text)
+        (_, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'lines': num_lines,
+        'hunks': num_hunks,
+        'seconds': best,
+        'lines_per_second': num_lines / best,
+        'hunks_per_second': num_hunks / best,
+        'peak_mb': peak / 1e6,
+    }
+
+
+def compare(name, result, baseline, tolerance):
+    """Compare a scenario's results with its baseline.
+
+    Returns:
+        A list of descriptions of any regressions.
+    """
+    regressions = []
+    if result['lines_per_second'] < baseline['lines_per_second'] * (1 - tolerance):
+        regressions.append('{}: throughput {:,.0f} lines/s, baseline {:,.0f}'.format(
+            name, result['lines_per_second'], baseline['lines_per_second']))
+    if result['peak_mb'] > baseline['peak_mb'] * (1 + tolerance):
+        regressions.append('{}: peak memory {:.1f} MB, baseline {:.1f} MB'.format(
+            name, result['peak_mb'], baseline['peak_mb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help='Scenarios to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to repeat each timing')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Fraction by which results may be worse than the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline')
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+
+    runner = Runner()
+    results = {}
+    regressions = []
+    try:
+        print('{:12} {:>9} {:>8} {:>9} {:>12} {:>10} {:>10} {:>12}'.format(
+            'scenario', 'lines', 'hunks', 'time (s)', 'lines/s', 'hunks/s', 'peak (MB)', 'vs baseline'))
+        for name in args.scenario:
+            result = measure(runner, SCENARIOS[name](), args.repeat)
+            results[name] = result
+            if name in baselines:
+                vs_baseline = '{:+.0%}'.format(result['lines_per_second'] / baselines[name]['lines_per_second'] - 1)
+                regressions.extend(compare(name, result, baselines[name], args.tolerance))
+            else:
+                vs_baseline = '-'
+            print('{:12} {:9} {:8} {:9.3f} {:12,.0f} {:10,.0f} {:10.1f} {:>12}'.format(
+                name, result['lines'], result['hunks'], result['seconds'], result['lines_per_second'],
+                result['hunks_per_second'], result['peak_mb'], vs_baseline))
+    finally:
+        runner.close()
+
+    if args.save_baseline:
+        baselines.update(results)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved baseline to {}'.format(BASELINE_FILE))
+    elif regressions:
+        print('\nRegressions:')
+        for regression in regressions:
+            print('  ' + regression)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
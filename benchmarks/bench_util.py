@@ -0,0 +1,39 @@
+"""Helpers for running benchmarks outside Sublime Text.
+
+The plugin's modules import `sublime`, so this provides a minimal stand-in and loads the package as `DiffView`.
+"""
+import os
+import sys
+import types
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_diffview():
+    """Import the DiffView package from this checkout, with a stub `sublime` module if the real one isn't available.
+
+    Returns:
+        The `DiffView` package module.
+    """
+    if 'sublime' not in sys.modules:
+        sublime = types.ModuleType('sublime')
+        for (i, flag) in enumerate(['DRAW_EMPTY', 'HIDE_ON_MINIMAP', 'DRAW_EMPTY_AS_OVERWRITE', 'DRAW_NO_FILL',
+                                    'HIDDEN', 'TRANSIENT', 'FORCE_GROUP', 'ENCODED_POSITION', 'MONOSPACE_FONT',
+                                    'KEEP_OPEN_ON_FOCUS_LOST']):
+            setattr(sublime, flag, 1 << i)
+
+        class Region(object):
+            def __init__(self, a, b=None):
+                self.a = a
+                self.b = a if b is None else b
+
+        sublime.Region = Region
+        sys.modules['sublime'] = sublime
+        sys.modules['sublime_plugin'] = types.ModuleType('sublime_plugin')
+
+    if 'DiffView' not in sys.modules:
+        package = types.ModuleType('DiffView')
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules['DiffView'] = package
+    return sys.modules['DiffView']
@@ -0,0 +1,68 @@
+"""Generators for synthetic Git diffs, for benchmarking the parser.
+
+Each generator returns the text of a multi-file diff, as `git diff -U0 -M` would output it.
+"""
+import random
+
+
+def file_header(filename):
+    return 'diff --git a/{0} b/{0}\nindex 1234567..89abcde 100644\n--- a/{0}\n+++ b/{0}\n'.format(filename)
+
+
+def make_lines(rand, line_len, count=1000):
+    """Make a pool of `count` random lines of about `line_len` characters, to pick changed lines from."""
+    words = max(1, line_len // 8)
+    return [' '.join('w{:06d}'.format(rand.randint(0, 999999)) for _ in range(words)) for _ in range(count)]
+
+
+def hunk(rand, lines, line, num_old, num_new):
+    """Make a hunk replacing `num_old` lines at `line` with `num_new` lines picked from `lines`."""
+    parts = ['@@ -{},{} +{},{} @@ def function_{}():\n'.format(line, num_old, line, num_new, line)]
+    for (prefix, count) in [('-', num_old), ('+', num_new)]:
+        for _ in range(count):
+            parts.append(prefix + rand.choice(lines) + '\n')
+    return ''.join(parts)
+
+
+def many_files(num_files=2000, hunks_per_file=3):
+    """Lots of files with a few small changes each, like a large refactoring."""
+    rand = random.Random(1)
+    lines = make_lines(rand, 40)
+    parts = []
+    for i in range(num_files):
+        parts.append(file_header('src/module{}/file{}.py'.format(i % 50, i)))
+        for j in range(hunks_per_file):
+            parts.append(hunk(rand, lines, j * 30 + 1, rand.randint(0, 3), rand.randint(1, 3)))
+    return ''.join(parts)
+
+
+def huge_file(num_hunks=2000, lines_per_hunk=100):
+    """A single file with big blocks of changed lines, like regenerated code."""
+    rand = random.Random(2)
+    lines = make_lines(rand, 40)
+    parts = [file_header('generated/schema.py')]
+    for i in range(num_hunks):
+        parts.append(hunk(rand, lines, i * (lines_per_hunk + 10) + 1, lines_per_hunk, lines_per_hunk))
+    return ''.join(parts)
+
+
+def tiny_hunks(num_hunks=100000):
+    """A single file with a one-line change every few lines, like a lockfile or data fixture."""
+    rand = random.Random(3)
+    lines = make_lines(rand, 24)
+    parts = [file_header('package-lock.json')]
+    for i in range(num_hunks):
+        parts.append(hunk(rand, lines, i * 5 + 1, 1, 1))
+    return ''.join(parts)
+
+
+def long_lines(num_hunks=1000, line_len=5000):
+    """Files with very long changed lines, like minified code."""
+    rand = random.Random(4)
+    lines = make_lines(rand, line_len, count=100)
+    parts = []
+    for i in range(num_hunks // 10):
+        parts.append(file_header('dist/bundle{}.min.js'.format(i)))
+        for j in range(10):
+            parts.append(hunk(rand, lines, j * 3 + 1, 1, 1))
+    return ''.join(parts)
@@ -1,8 +1,15 @@
+import collections
 import os
-import codecs
 import tempfile
+import threading
+import time
 
-from ..util.vcs import VCSHelper
+from ..util.vcs import VCSContext, VCSHelper, VCSTimeoutError
+from ..util.blob_cache import BlobCache
+from ..util.diff_cache import DiffCache
+from ..util.cancel import CancelToken, DiffCancelled
+from ..util.perf import PerfRun
+from .file_diff import FileDiff
 
 
 class DiffParser(object):
@@ -11,58 +18,480 @@ class DiffParser(object):
     This class represents the entire diff.
     """
 
-    def __init__(self, diff_args, cwd, debug=False, get_diff_headers=False):
+    DEFAULT_MAX_FILE_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, diff_args, cwd, debug=False, get_diff_headers=False, cache_dir=None,
+                 cache_size=BlobCache.DEFAULT_MAX_SIZE, max_file_size=DEFAULT_MAX_FILE_SIZE, timeout=None,
+                 in_process=True, profile_dir=None, cache_diffs=True):
         """Constructor.
 
+        Finds the VCS for the diff, but doesn't run it - call `run` to do that.
+
         Args:
             diff_args: The arguments to be used for the Git diff.
             cwd: The working directory.
             get_diff_headers: Whether we want per-file header hunks for this diff.
+            cache_dir: [optional] The directory to cache file contents in.  Defaults to one in the temp directory.
+            cache_size: [optional] The maximum size of the file contents cache, in bytes.
+            max_file_size: [optional] Files larger than this (in bytes) are listed, but their contents aren't shown.
+            timeout: [optional] The maximum time (in seconds) any VCS command may take.
+            in_process: [optional] Whether to read file contents directly from the repo where possible, rather than
+                running the VCS.
+            profile_dir: [optional] If set, `run` is profiled with `cProfile`, and the stats are written to a `.prof`
+                file in this directory.
+            cache_diffs: [optional] Whether to keep the parsed diff in the cache, and use the cached result when the
+                same diff is run again (with the same versions, and any working copy files unchanged).
         """
         self.diff_args = diff_args
         self.cwd = cwd
-        self.temp_dir = tempfile.mkdtemp()
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), 'DiffView')
+        self.blob_cache = BlobCache(cache_dir, max_size=cache_size, debug=debug)
+        self.diff_cache = DiffCache(cache_dir, debug=debug) if cache_diffs else None
+        self.temp_dir = None
+        self.max_file_size = max_file_size
         self.debug = debug
-        self.vcs_helper = VCSHelper.get_helper(self.cwd, debug=self.debug)
-        self.changed_files = self.vcs_helper.get_changed_files(self.diff_args)
+        self.get_diff_headers = get_diff_headers
+        self.cancel_token = CancelToken()
+        self.perf = PerfRun("'{}' in {}".format(diff_args, cwd))
+        self.profile_path = None
+        if profile_dir is not None:
+            self.profile_path = os.path.join(profile_dir, time.strftime('diff-%Y%m%d-%H%M%S.prof'))
+        # The helper is shared with other diffs in the repo - this diff's own settings go with each call to it.
+        self.vcs_context = VCSContext(
+            debug=self.debug, cancel_token=self.cancel_token, timeout=timeout, in_process=in_process, perf=self.perf)
+        with self.perf.span('detect'):
+            self.vcs_helper = VCSHelper.get_helper(self.cwd)
+        self.changed_files = []
         self.changed_hunks = []
-        for f in self.changed_files:
-            self.changed_hunks += f.get_hunks(include_headers=get_diff_headers)
+        self.finished = False
+        self.versions = None
+        # `(mtime, size)` of working copy files when they were last diffed.
+        self.stamps = {}
+        self.rediff_lock = threading.Lock()
+        # Changed files by the paths of their old and new versions - see `find_file`.
+        self.files_by_path = {}
+        self.files_indexed = 0
+        self.index_lock = threading.Lock()
+        # Files whose old and new versions have been set up - see `ensure_file_ready`.
+        self.ready_files = set()
+        self.setup_lock = threading.Lock()
+        # Files waiting to be set up in the background - see `prefetch_files`.
+        self.prefetch_queue = collections.deque()
+        self.prefetch_thread = None
+        self.prefetch_lock = threading.Lock()
 
-        self.setup_files()
+    def run(self, on_file_parsed=None):
+        """Run the diff, and parse it into changed files and hunks.
 
-    def setup_files(self):
-        """Create all the files needed to show the diffs."""
-        (old_ver, new_ver) = self.vcs_helper.get_file_versions(self.diff_args)
+        Files are parsed as soon as the VCS outputs their diff, so `changed_files` and `changed_hunks` grow while this
+        runs.  Their old/new versions aren't set up until they're needed - see `ensure_file_ready`.
 
-        for changed_file in self.changed_files:
-            if old_ver == '':
-                # Old file is working copy
-                changed_file.old_file = changed_file.abs_filename
-            else:
-                # Get the old file contents in the temporary dir.
-                changed_file.old_file = os.path.join(self.temp_dir, 'old', changed_file.filename)
-                old_dir = os.path.dirname(changed_file.old_file)
-
-                if not os.path.exists(old_dir):
-                    os.makedirs(old_dir)
-                with codecs.open(changed_file.old_file, 'w', 'utf-8') as f:
-                    old_file_content = self.vcs_helper.get_file_content(changed_file.filename, old_ver)
-                    f.write(old_file_content.replace('\r\n', '\n'))
-
-            if new_ver == '':
-                # New file is working copy
-                changed_file.new_file = changed_file.abs_filename
+        Args:
+            on_file_parsed: [optional] Callback, called with each `FileDiff` once its hunks have been added to
+                `changed_hunks`.
+
+        Raises:
+            `DiffCancelled` if `cancel` is called while this runs.  Any changes found so far are discarded.
+        """
+        with self.perf.profile(self.profile_path), self.perf.span('total'):
+            try:
+                with self.perf.span('versions'):
+                    self.versions = self.vcs_helper.get_file_versions(self.diff_args, self.vcs_context)
+                with self.perf.span('cache load'):
+                    (cache_key, cache_state, cached_files) = self.load_cached_diff()
+                if cached_files is not None:
+                    changed_files = cached_files
+                else:
+                    # Time spent waiting for the VCS's diff output (including any `stat` it needs first).
+                    changed_files = self.perf.timed(
+                        'diff', self.vcs_helper.iter_changed_files(self.diff_args, context=self.vcs_context))
+                for changed_file in changed_files:
+                    self.cancel_token.check()
+                    hunks = self.prepare_file(changed_file, cached=(cached_files is not None))
+                    self.cancel_token.check()
+                    self.changed_files.append(changed_file)
+                    self.changed_hunks.extend(hunks)
+                    if on_file_parsed:
+                        on_file_parsed(changed_file)
+                self.cancel_token.check()
+            except DiffCancelled:
+                self.changed_files = []
+                self.changed_hunks = []
+                raise
+            self.finished = True
+
+            if cache_key is not None and cached_files is None:
+                with self.perf.span('cache store'):
+                    self.diff_cache.store(
+                        cache_key, [changed_file.to_cache() for changed_file in self.changed_files], cache_state)
+
+            # Keep the cache within its size limit.
+            with self.perf.span('evict'):
+                self.blob_cache.evict()
+        self.perf.count('files', len(self.changed_files))
+        self.perf.count('hunks', len(self.changed_hunks))
+        if self.debug:
+            print("\n".join(self.perf.report()))
+
+    def load_cached_diff(self):
+        """Get the result of this diff from the cache, if it's there.
+
+        Returns:
+            A tuple of `(key, state, changed_files)` - the diff's cache key and working copy state (see `DiffCache`),
+            and the cached `FileDiff`s.  The key is `None` if the diff can't be cached, and the files are `None` if they
+            weren't in the cache.
+        """
+        if self.diff_cache is None:
+            return (None, None, None)
+        key = self.vcs_helper.get_diff_cache_key(self.diff_args, self.versions, self.vcs_context)
+        if key is None:
+            return (None, None, None)
+        # Results depend on which files are too large to show, as well as on the diff.
+        key.append(self.max_file_size)
+
+        state = None
+        if '' in self.versions:
+            # Get the state before running the diff, so any changes while it runs make the cached result out of date.
+            state = self.vcs_helper.get_working_copy_state(self.diff_args, self.vcs_context)
+        data = self.diff_cache.get(key, state)
+        if data is None:
+            return (key, state, None)
+        self.perf.count('files from cache', len(data))
+        repo_base = self.vcs_helper.repo_base
+        changed_files = [FileDiff.from_cache(repo_base, file_data, include_headers=self.get_diff_headers)
+                         for file_data in data]
+        return (key, state, changed_files)
+
+    def prepare_file(self, changed_file, cached=False):
+        """Parse a changed file's hunks.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+            cached: [optional] Whether the file came from the cache, so has already been parsed.
+
+        Returns:
+            The file's hunks.
+        """
+        (old_ver, new_ver) = self.versions
+        if not cached:
+            with self.perf.span('skip check'):
+                changed_file.skip_reason = self.get_skip_reason(changed_file, old_ver, new_ver)
+        with self.perf.span('parse'):
+            hunks = changed_file.get_hunks(include_headers=self.get_diff_headers)
+        if new_ver == '':
+            self.stamps[changed_file.abs_filename] = self.get_stamp(changed_file.abs_filename)
+        return hunks
+
+    def is_live(self):
+        """Whether this diff can be kept up to date as files change - i.e. it has finished, and is against the working
+        copy.
+        """
+        return self.finished and not self.cancelled and self.versions[1] == ''
+
+    def rediff_file(self, abs_filename):
+        """Re-diff a working copy file after it's been saved, and splice the result into the changes.
+
+        Only the one file is diffed again.  Nothing is done if the file hasn't changed since it was last diffed.
+
+        Args:
+            abs_filename: The absolute path of the file.
+
+        Returns:
+            A tuple of `(start, old_count, new_hunks)` - the index in `changed_hunks` of the first hunk that changed,
+            how many hunks were replaced there, and the hunks that replaced them.  `None` if nothing changed.
+        """
+        if not self.is_live():
+            return None
+        try:
+            filename = os.path.relpath(abs_filename, self.vcs_helper.repo_base)
+        except ValueError:
+            # On a different drive, so not in this repo.
+            return None
+        if filename.startswith(os.pardir):
+            # Not in this repo.
+            return None
+        filename = filename.replace(os.sep, '/')
+
+        with self.rediff_lock:
+            stamp = self.get_stamp(abs_filename)
+            if abs_filename in self.stamps and self.stamps[abs_filename] == stamp:
+                return None
+            self.stamps[abs_filename] = stamp
+
+            # Find the file's current entry (if any), and where its hunks are.
+            index = len(self.changed_files)
+            start = len(self.changed_hunks)
+            old_file = None
+            hunk_index = 0
+            for (i, changed_file) in enumerate(self.changed_files):
+                if changed_file.filename == filename:
+                    (index, start, old_file) = (i, hunk_index, changed_file)
+                    break
+                if changed_file.filename > filename and index == len(self.changed_files):
+                    # Not currently changed - new entries go in filename order, as the VCS lists them.
+                    (index, start) = (i, hunk_index)
+                hunk_index += len(changed_file.hunks)
+            if old_file is None and not self.vcs_helper.is_in_diff(self.diff_args, filename):
+                # Outside the paths the user limited the diff to.
+                return None
+
+            # Include the old name of a renamed file, so it's still diffed as a rename.
+            paths = [filename]
+            if old_file is not None and old_file.old_filename != filename:
+                paths.append(old_file.old_filename)
+            # Other files the user's diff args name may be diffed too - keep just this one.
+            new_files = [changed_file for changed_file in self.perf.timed(
+                'diff', self.vcs_helper.iter_changed_files(self.diff_args, paths, self.vcs_context))
+                if changed_file.filename in paths or changed_file.old_filename in paths]
+            new_hunks = []
+            for changed_file in new_files:
+                new_hunks.extend(self.prepare_file(changed_file))
+            if old_file is None and not new_files:
+                return None
+
+            old_count = len(old_file.hunks) if old_file is not None else 0
+            with self.index_lock:
+                self.changed_files[index:index + (old_file is not None)] = new_files
+                self.changed_hunks[start:start + old_count] = new_hunks
+                if index < self.files_indexed:
+                    # Already indexed - swap the file's entries, rather than indexing everything again.
+                    if old_file is not None:
+                        for (key, _) in self._version_paths(old_file):
+                            entry = self.files_by_path.get(key)
+                            if entry is not None and entry[0] is old_file:
+                                del self.files_by_path[key]
+                    for changed_file in new_files:
+                        self._index_file(changed_file)
+                    self.files_indexed += len(new_files) - (old_file is not None)
+            return (start, old_count, new_hunks)
+
+    def is_file_ready(self, changed_file):
+        """Whether a changed file's old and new versions have been set up, so it can be shown.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+        """
+        return changed_file in self.ready_files
+
+    def ensure_file_ready(self, changed_file):
+        """Set up a changed file's old and new versions (see `setup_file`), unless that's already been done.
+
+        Getting the contents can take a while (and run the VCS), so a file is only set up when it's first shown, or
+        when it's prefetched.  Safe to call from any thread.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+
+        Raises:
+            `DiffCancelled` if the diff is cancelled, or `VCSTimeoutError` if the VCS takes too long.
+        """
+        if self.temp_dir is not None:
+            # Its files are about to be shown.
+            self.blob_cache.touch_session(self.temp_dir)
+        with self.setup_lock:
+            if changed_file in self.ready_files:
+                return
+            (old_ver, new_ver) = self.versions
+            # Getting the old/new contents, and writing them to the cache or temporary files.
+            with self.perf.span('fetch'):
+                self.setup_file(changed_file, old_ver, new_ver)
+            with self.index_lock:
+                self.ready_files.add(changed_file)
+                # The file may have been indexed before its versions' paths were known.
+                self._index_file(changed_file)
+
+    def prefetch_files(self, changed_files):
+        """Set up changed files' old and new versions in the background, so they're ready to show.
+
+        Files are set up in order, one at a time.  Any files still waiting from an earlier call are dropped, so the
+        latest request (e.g. for the files after the selected change) is handled next.
+
+        Args:
+            changed_files: The `FileDiff`s for the files.
+        """
+        with self.prefetch_lock:
+            self.prefetch_queue = collections.deque(f for f in changed_files if f not in self.ready_files)
+            if self.prefetch_queue and self.prefetch_thread is None:
+                self.prefetch_thread = threading.Thread(target=self._prefetch)
+                self.prefetch_thread.daemon = True
+                self.prefetch_thread.start()
+
+    def _prefetch(self):
+        while True:
+            with self.prefetch_lock:
+                if not self.prefetch_queue or self.cancelled:
+                    self.prefetch_thread = None
+                    return
+                changed_file = self.prefetch_queue.popleft()
+            try:
+                self.ensure_file_ready(changed_file)
+                self.perf.count('files prefetched')
+            except (DiffCancelled, VCSTimeoutError, IOError, OSError) as e:
+                # It'll be tried again if it's shown.
+                if self.debug:
+                    print("** Failed to prefetch {}: {}".format(changed_file.filename, e))
+
+    def find_file(self, path):
+        """Find the changed file that a file shows a version of.
+
+        Args:
+            path: The path of the file, e.g. as shown in a view.
+
+        Returns:
+            A tuple of `(changed_file, old)` - the `FileDiff`, and whether the path is its old version.  `(None, False)`
+            if the path isn't part of the diff.
+        """
+        with self.index_lock:
+            # Index any files found since this was last called - files set up later are indexed as they're set up.
+            for changed_file in self.changed_files[self.files_indexed:]:
+                self._index_file(changed_file)
+            self.files_indexed = len(self.changed_files)
+            return self.files_by_path.get(os.path.normcase(os.path.abspath(path)), (None, False))
+
+    def _index_file(self, changed_file):
+        # Called with `index_lock` held.
+        for (key, old) in self._version_paths(changed_file):
+            if key not in self.files_by_path:
+                self.files_by_path[key] = (changed_file, old)
+
+    def _version_paths(self, changed_file):
+        if changed_file in self.ready_files:
+            version_paths = [(changed_file.new_file, False), (changed_file.old_file, True)]
+        else:
+            # Only working copy versions are known before the file is set up.
+            (old_ver, new_ver) = self.versions
+            version_paths = [(changed_file.abs_filename, old)
+                             for (version, old) in [(new_ver, False), (old_ver, True)] if version == '']
+        return [(os.path.normcase(os.path.abspath(path)), old) for (path, old) in version_paths]
+
+    @staticmethod
+    def get_stamp(path):
+        """Get a stamp for a file that changes whenever the file does.
+
+        Args:
+            path: The path of the file.
+
+        Returns:
+            A tuple of `(mtime, size)`, or `None` if the file doesn't exist.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def cancel(self):
+        """Cancel the diff, if it's still running.
+
+        Safe to call from any thread.  Any VCS commands running for the diff are killed, and `run` stops as soon as it
+        can.  Files waiting to be prefetched are dropped, even if the diff has finished.
+        """
+        with self.prefetch_lock:
+            self.prefetch_queue.clear()
+        if not self.finished:
+            self.cancel_token.cancel()
+
+    @property
+    def cancelled(self):
+        """Whether the diff was cancelled before it finished."""
+        return self.cancel_token.cancelled
+
+    def get_skip_reason(self, changed_file, old_ver, new_ver):
+        """Check whether a changed file's contents shouldn't be shown, before getting them.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+            old_ver: The old version, as returned by `get_file_versions`.
+            new_ver: The new version, as returned by `get_file_versions`.
+
+        Returns:
+            A description of why the contents won't be shown, or `None` if they should be.
+        """
+        if changed_file.unmerged:
+            return "Unmerged file - resolve its conflicts to see the changes"
+
+        if not changed_file.content_changed:
+            return None
+
+        if changed_file.is_binary():
+            return "Binary file changed"
+
+        lfs_size = changed_file.get_lfs_object_size()
+        if lfs_size is not None:
+            return "Git LFS object changed ({:,} bytes)".format(lfs_size)
+
+        for (version, old) in [(old_ver, True), (new_ver, False)]:
+            if version == '':
+                try:
+                    size = os.path.getsize(changed_file.abs_filename)
+                except OSError:
+                    size = None
             else:
-                # Get the new file contents in the temporary dir.
-                changed_file.new_file = os.path.join(
-                    self.temp_dir,
-                    'new',
-                    changed_file.filename)
-                new_dir = os.path.dirname(changed_file.new_file)
-
-                if not os.path.exists(new_dir):
-                    os.makedirs(new_dir)
-                with codecs.open(changed_file.new_file, 'w', 'utf-8') as f:
-                    new_file_content = self.vcs_helper.get_file_content(changed_file.filename, new_ver)
-                    f.write(new_file_content.replace('\r\n', '\n'))
+                size = self.vcs_helper.get_file_size(changed_file, version, old, self.vcs_context)
+            if size is not None and size > self.max_file_size:
+                return "File too large to show ({:,} bytes)".format(size)
+
+        return None
+
+    def setup_file(self, changed_file, old_ver, new_ver):
+        """Create the files needed to show the diffs for a changed file.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+            old_ver: The old version, as returned by `get_file_versions`.
+            new_ver: The new version, as returned by `get_file_versions`.
+        """
+        if not changed_file.content_changed or changed_file.skip_reason:
+            # Nothing to show for pure renames or mode changes (or contents that won't be shown), so don't get the
+            # contents.
+            changed_file.old_file = changed_file.abs_filename
+            changed_file.new_file = changed_file.abs_filename
+            return
+
+        if old_ver == '':
+            # Old file is working copy
+            changed_file.old_file = changed_file.abs_filename
+        else:
+            changed_file.old_file = self.get_version_file(changed_file, changed_file.old_filename, old_ver, True)
+
+        if new_ver == '':
+            # New file is working copy
+            changed_file.new_file = changed_file.abs_filename
+        else:
+            changed_file.new_file = self.get_version_file(changed_file, changed_file.filename, new_ver, False)
+
+    def get_version_file(self, changed_file, filename, version, old):
+        """Get a file containing the contents of a changed file at a specific version.
+
+        Uses the contents cache if possible, otherwise gets the contents from the VCS.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+            filename: The name of the file in this version.
+            version: The version.
+            old: Whether this is the old version of the file.
+
+        Returns:
+            The path of the file.
+        """
+        def write_content(path):
+            self.vcs_helper.write_version_content(changed_file, version, old, path, self.vcs_context)
+
+        key = self.vcs_helper.get_content_key(changed_file, version, old)
+        if key is not None:
+            path = self.blob_cache.get(key, filename)
+            if path is None:
+                path = self.blob_cache.store(key, filename, write_content)
+            return path
+
+        # Can't be cached - put it in the temporary dir.
+        if self.temp_dir is None:
+            self.temp_dir = self.blob_cache.new_session_dir()
+        path = os.path.join(self.temp_dir, 'old' if old else 'new', filename)
+        file_dir = os.path.dirname(path)
+        if not os.path.exists(file_dir):
+            os.makedirs(file_dir)
+        write_content(path)
+        self.blob_cache.touch_session(self.temp_dir)
+        return path
@@ -1,6 +1,9 @@
 class DiffRegion(object):
     """Class representing a region that's changed."""
 
+    # There's one of these per changed region, so keep them small.
+    __slots__ = ('diff_type', 'start_line', 'start_col', 'end_line', 'end_col')
+
     def __init__(self, diff_type, start_line, start_col, end_line, end_col):
         """Constructor.
 
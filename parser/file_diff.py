@@ -1,6 +1,13 @@
+import bisect
+import os
 import re
+import sublime
+import threading
+import time
 
-from .hunk_diff import HunkDiff, DummyHunkDiff
+from .hunk_diff import HunkDiff, DummyHunkDiff, MetaHunkDiff
+from .line_index import LineIndex, read_text
+from .word_diff import WordDiff
 from ..util.constants import Constants
 
 
@@ -8,6 +15,17 @@ class FileDiff(object):
     """Representation of a single file's diff."""
 
     HUNK_MATCH = re.compile('\r?\n@@ \-(\d+),?(\d*) \+(\d+),?(\d*) @@')
+    # Lines reporting a binary file, from Git/Bzr and SVN respectively.
+    BINARY_MATCH = re.compile('^(Binary files .* differ|Cannot display: file marked as a binary type\.)\r?$',
+                              re.MULTILINE)
+    # Changed lines in a Git LFS pointer file, and the size of the new object.
+    LFS_POINTER_MATCH = re.compile('^[+-](version https://git-lfs\.github\.com/spec/|oid sha256:[0-9a-f]{64}\r?$)',
+                                   re.MULTILINE)
+    LFS_SIZE_MATCH = re.compile('^\+size (\d+)\r?$', re.MULTILINE)
+    # LFS pointer files are tiny - don't look for them in longer diffs.
+    LFS_MAX_DIFF_LEN = 4096
+    # The longest to spend finding changed words in a file each time it's shown, in seconds.
+    WORD_DIFF_TIME_BUDGET = 0.2
 
     def __init__(self, filename, abs_filename, diff_text):
         """Constructor.
@@ -21,31 +39,186 @@ class FileDiff(object):
         self.abs_filename = abs_filename
         self.old_file = 'UNDEFINED'
         self.new_file = 'UNDEFINED'
+        # The text of the diff - `None` once it's been parsed.
         self.diff_text = diff_text
         self.hunks = []
+        self.lfs_object_size = None
+        self.word_diff_lock = threading.Lock()
+        # The focus lines of the hunks, and the hunks, for each version - see `find_adjacent_hunk`.
+        self.hunk_index = {}
+
+        # Details of the change, for VCSs that provide them.
+        # - The filename in the old version (different for renames and copies).
+        self.old_filename = filename
+        # - The VCS's IDs for the old and new content, or `None` if not known.
+        self.old_blob = None
+        self.new_blob = None
+        # - Whether the file is binary.
+        self.binary = False
+        # - The numbers of lines added and deleted, or `None` if not known (see `get_line_counts`).
+        self.added_lines = None
+        self.deleted_lines = None
+        # - Whether the content has changed - false for pure renames and mode changes.
+        self.content_changed = True
+        # - Whether the file has merge conflicts.
+        self.unmerged = False
+
+        # Why this file's contents won't be shown (e.g. it's binary or too large), or `None` to show them.
+        self.skip_reason = None
+
+    @classmethod
+    def from_cache(cls, repo_base, data, include_headers=False):
+        """Create a parsed file from the details saved by `to_cache`.
+
+        Args:
+            repo_base: The base directory of the repo.
+            data: The saved details.
+            include_headers: [optional] Whether to add a header hunk for the file.
+
+        Returns:
+            The `FileDiff`, with its hunks.
+        """
+        file_diff = cls(data['filename'], os.path.join(repo_base, data['filename']), None)
+        file_diff.old_filename = data['old_filename']
+        file_diff.old_blob = data['old_blob']
+        file_diff.new_blob = data['new_blob']
+        file_diff.binary = data['binary']
+        file_diff.added_lines = data['added_lines']
+        file_diff.deleted_lines = data['deleted_lines']
+        file_diff.content_changed = data['content_changed']
+        file_diff.lfs_object_size = data['lfs_object_size']
+        file_diff.skip_reason = data['skip_reason']
+        if file_diff.skip_reason:
+            file_diff.hunks.append(MetaHunkDiff(file_diff, file_diff.skip_reason))
+        else:
+            file_diff.hunks.extend(HunkDiff.from_cache(file_diff, hunk) for hunk in data['hunks'])
+        if include_headers:
+            file_diff.hunks.insert(0, DummyHunkDiff(file_diff, len(file_diff.hunks)))
+        return file_diff
+
+    def to_cache(self):
+        """Get the details of this file that are needed to recreate it with `from_cache`, once it's been parsed.
+
+        Returns:
+            The details, as a JSON-serializable dict.
+        """
+        return {
+            'filename': self.filename,
+            'old_filename': self.old_filename,
+            'old_blob': self.old_blob,
+            'new_blob': self.new_blob,
+            'binary': self.is_binary(),
+            'added_lines': self.added_lines,
+            'deleted_lines': self.deleted_lines,
+            'content_changed': self.content_changed,
+            'lfs_object_size': self.get_lfs_object_size(),
+            'skip_reason': self.skip_reason,
+            # Header and skipped file hunks are made again from the other details.
+            'hunks': [h.to_cache() for h in self.hunks if type(h) is HunkDiff],
+        }
 
     def get_hunks(self, include_headers=False):
         """Get the changed hunks for this file.
 
-        Wrapper to force parsing only once, and only when the hunks are required.
+        Wrapper to force parsing only once, and only when the hunks are required.  The diff text is released once
+        it's been parsed.
         """
-        if not self.hunks:
+        if self.diff_text is not None:
             self.parse_diff(include_headers=include_headers)
+            self.release_diff_text()
         return self.hunks
 
+    def find_adjacent_hunk(self, line, forward, old=False):
+        """Find the nearest hunk before or after a line.
+
+        Args:
+            line: The line number, counting from 1.
+            forward: Whether to find the next hunk after the line, rather than the previous one before it.
+            old: [optional] Whether the line is in the old version of the file, rather than the new one.
+
+        Returns:
+            The `HunkDiff`, or `None` if there isn't one.
+        """
+        if old not in self.hunk_index:
+            def focus(hunk):
+                return hunk.old_line_focus if old else hunk.new_line_focus
+
+            # Headers and hunks without changes have nowhere to go to.
+            hunks = sorted((h for h in self.hunks if hasattr(h, 'hunk_type') and focus(h) != -1), key=focus)
+            self.hunk_index[old] = ([focus(h) for h in hunks], hunks)
+        (lines, hunks) = self.hunk_index[old]
+
+        if forward:
+            i = bisect.bisect_right(lines, line)
+        else:
+            i = bisect.bisect_left(lines, line) - 1
+        return hunks[i] if 0 <= i < len(hunks) else None
+
+    def release_diff_text(self):
+        """Drop the text of the diff, keeping the details that are worked out from it."""
+        self.is_binary()
+        self.lfs_object_size = self.get_lfs_object_size()
+        self.diff_text = None
+
+    def is_binary(self):
+        """Whether this is a binary file - either known by the VCS, or reported in the diff."""
+        if not self.binary and self.diff_text is not None:
+            header = self.diff_text.split('\n@@', 1)[0]
+            self.binary = bool(self.BINARY_MATCH.search(header))
+        return self.binary
+
+    def get_line_counts(self):
+        """Get the numbers of lines added and deleted in this file - either known by the VCS, or counted from the hunks.
+
+        Returns:
+            A tuple of `(added, deleted)`.  `None` for binary files, or if the VCS doesn't give the counts and the diff
+            hasn't been parsed yet (see `get_hunks`).
+        """
+        if self.is_binary():
+            return None
+        if self.added_lines is None:
+            if self.diff_text is not None:
+                return None
+            hunks = [h for h in self.hunks if type(h) is HunkDiff]
+            self.added_lines = sum(h.add_lines for h in hunks)
+            self.deleted_lines = sum(h.del_lines for h in hunks)
+        return (self.added_lines, self.deleted_lines)
+
+    def get_lfs_object_size(self):
+        """Get the size of the object for a Git LFS pointer file.
+
+        Returns:
+            The size of the new object in bytes (or 0 if there isn't a new one), or `None` if this isn't an LFS pointer.
+        """
+        if self.diff_text is None:
+            return self.lfs_object_size
+        if len(self.diff_text) > self.LFS_MAX_DIFF_LEN or not self.LFS_POINTER_MATCH.search(self.diff_text):
+            return None
+        match = self.LFS_SIZE_MATCH.search(self.diff_text)
+        return int(match.group(1)) if match else 0
+
     def parse_diff(self, include_headers=False):
         """Run the Git diff command, and parse the diff for this file into hunks.
 
         Do not call directly - use `get_hunks` instead.
         """
-        hunks = self.HUNK_MATCH.split(self.diff_text)
+        if self.skip_reason:
+            # Just a single entry describing the change.
+            self.hunks.append(MetaHunkDiff(self, self.skip_reason))
+            if include_headers:
+                self.hunks.insert(0, DummyHunkDiff(self, len(self.hunks)))
+            return
 
-        # First item is the diff header - drop it
-        hunks.pop(0)
-        match_len = 5
-        while len(hunks) >= match_len:
-            self.hunks.append(HunkDiff(self, hunks[:match_len]))
-            hunks = hunks[match_len:]
+        # Walk the hunk headers in one pass - each hunk's body runs from the end of its header to the start of the
+        # next one (or the end of the diff).  Anything before the first header is the diff header, so is dropped.
+        text = self.diff_text
+        header = None
+        for match in self.HUNK_MATCH.finditer(text):
+            if header is not None:
+                self.hunks.append(HunkDiff(self, header.groups() + (text[header.end():match.start()],)))
+            header = match
+        if header is not None:
+            self.hunks.append(HunkDiff(self, header.groups() + (text[header.end():],)))
 
         # This file has changes, add a dummy 'hunk' for the header, which is just
         # the start of the file.
@@ -72,10 +245,7 @@ class FileDiff(object):
             styles: A map of styles for the diff region types.
         """
         if not hasattr(view, "old_regions"):
-            regions = {}
-            for sel in ["ADD", "MOD", "DEL"]:
-                regions[sel] = [r for h in self.hunks for r in h.get_old_regions(view) if h.hunk_type == sel]
-            self.add_regions(view, regions, styles)
+            self.add_file_regions(view, True, styles)
         view.old_regions = True
 
     def add_new_regions(self, view, styles):
@@ -86,8 +256,97 @@ class FileDiff(object):
             styles: A map of styles for the diff region types.
         """
         if not hasattr(view, "new_regions"):
-            regions = {}
-            for sel in ["ADD", "MOD", "DEL"]:
-                regions[sel] = [r for h in self.hunks for r in h.get_new_regions(view) if h.hunk_type == sel]
-            self.add_regions(view, regions, styles)
+            self.add_file_regions(view, False, styles)
         view.new_regions = True
+
+    def add_file_regions(self, view, old, styles):
+        """Work out all the highlighted regions for one version of this file, then add them to the view in one go.
+
+        Positions come from an index of the file's lines where possible, rather than asking the view for each one.
+
+        Args:
+            view: The view to add regions to.
+            old: Whether the view shows the old version of the file.
+            styles: A map of styles for the diff region types.
+        """
+        text = read_text(self.old_file if old else self.new_file)
+        line_index = LineIndex(text) if text is not None else None
+        if line_index is not None and line_index.size != view.size():
+            # The view doesn't hold the file's text as it is on disk (e.g. it has unsaved changes).
+            line_index = None
+
+        regions = {"ADD": [], "MOD": [], "DEL": []}
+        for hunk in self.hunks:
+            if old:
+                hunk_regions = hunk.get_old_regions(view, line_index)
+            else:
+                hunk_regions = hunk.get_new_regions(view, line_index)
+            if hunk_regions:
+                regions[hunk.hunk_type].extend(hunk_regions)
+        sublime.set_timeout(lambda: self.add_regions(view, regions, styles), 0)
+
+        if styles.get("WORD") and line_index is not None:
+            # Then the changed words, which take longer to find.
+            if old:
+                changed_words = [r for (old_regions, _) in self.get_word_regions(old_text=text) for r in old_regions]
+            else:
+                changed_words = [r for (_, new_regions) in self.get_word_regions(new_text=text) for r in new_regions]
+            word_regions = [sublime.Region(
+                line_index.text_point(r.start_line - 1, r.start_col),
+                line_index.text_point(r.end_line - 1, r.end_col))
+                for r in changed_words]
+            sublime.set_timeout(lambda: view.add_regions(
+                Constants.WORD_REGION_KEY, word_regions, styles["WORD"], flags=Constants.WORD_REGION_FLAGS), 0)
+
+    def get_word_regions(self, old_text=None, new_text=None):
+        """Find the changed words in each hunk that modifies lines.
+
+        The results are kept on each hunk.  Once `WORD_DIFF_TIME_BUDGET` is used up, the remaining hunks are left until
+        the file is next shown - until then, they're just highlighted by line.
+
+        Args:
+            old_text: [optional] The text of the old file, if it's already been read.
+            new_text: [optional] The text of the new file, if it's already been read.
+
+        Returns:
+            A list of `(old_regions, new_regions)` tuples, for the hunks whose changed words are known.
+        """
+        with self.word_diff_lock:
+            deadline = time.time() + self.WORD_DIFF_TIME_BUDGET
+            (old_lines, new_lines) = (None, None)
+            results = []
+            for hunk in self.hunks:
+                if not (hunk.old_regions and hunk.new_regions):
+                    # Lines are only added or removed (or this is a header).
+                    continue
+                if hunk.word_regions is None and time.time() < deadline:
+                    if old_lines is None:
+                        if old_text is None:
+                            old_text = read_text(self.old_file)
+                        if new_text is None:
+                            new_text = read_text(self.new_file)
+                        if old_text is None or new_text is None:
+                            break
+                        (old_lines, new_lines) = (old_text.split('\n'), new_text.split('\n'))
+                    hunk.word_regions = WordDiff(
+                        self.get_region_lines(hunk.old_regions, old_lines),
+                        self.get_region_lines(hunk.new_regions, new_lines)).get_regions() or False
+                if hunk.word_regions:
+                    results.append(hunk.word_regions)
+            return results
+
+    @staticmethod
+    def get_region_lines(regions, lines):
+        """Get the lines in some changed regions.
+
+        Args:
+            regions: The `DiffRegion`s.
+            lines: The lines of the file.
+
+        Returns:
+            A list of `(line_number, text)` tuples.
+        """
+        return [(line_number, lines[line_number - 1])
+                for r in regions
+                for line_number in range(r.start_line, r.end_line)
+                if 0 < line_number <= len(lines)]
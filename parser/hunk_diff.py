@@ -1,3 +1,4 @@
+import itertools
 import re
 import sublime
 
@@ -10,19 +11,24 @@ class HunkDiff(object):
     NEWLINE_MATCH = re.compile('\r?\n')
     ADD_LINE_MATCH = re.compile('^\+(.*)')
     DEL_LINE_MATCH = re.compile('^\-(.*)')
+    # Maximum width of the bar graph of changed lines in the quick panel.
+    GRAPH_WIDTH = 50
+
+    # There's one of these per hunk, so keep them small.
+    __slots__ = ('file_diff', 'old_line_focus', 'new_line_focus', 'old_line_start', 'old_hunk_len', 'new_line_start',
+                 'new_hunk_len', 'context', 'add_lines', 'del_lines', 'hunk_type', '_body', '_old_regions',
+                 '_new_regions', '_description', '_oneline_description', 'fold_region', 'word_regions')
 
     def __init__(self, file_diff, match):
         """Constructor.
 
+        Only scans the hunk for what's needed to list it - the changed regions are worked out when they're first used.
+
         Args:
             file_diff: The parent `FileDiff` object.
             match: The match parts of the hunk header.
         """
         self.file_diff = file_diff
-        self.old_regions = []
-        self.new_regions = []
-        self.old_line_focus = -1
-        self.new_line_focus = -1
 
         # Matches' meanings are:
         # - 0: start line in old file
@@ -38,38 +44,190 @@ class HunkDiff(object):
         if len(match[3]) > 0:
             self.new_hunk_len = int(match[3])
         # - 4: the remainder of the hunk, after the header
-        self.context = self.NEWLINE_MATCH.split(match[4])[0]
-        self.hunk_diff_lines = self.NEWLINE_MATCH.split(match[4])[1:]
+        body = match[4]
+        context_end = body.find('\n')
+        if context_end == -1:
+            (self.context, body) = (body, '')
+        else:
+            self.context = body[:context_end - 1] if body.startswith('\r', context_end - 1) else body[:context_end]
+            # Every line of the body now starts with a newline.
+            body = body[context_end:]
 
-        # Parse the diff
-        self.add_lines = 0
-        self.del_lines = 0
-        self.parse_diff()
+        # Count the changes, without splitting the body into lines.
+        self.add_lines = body.count('\n+')
+        self.del_lines = body.count('\n-')
         if self.del_lines == 0:
             self.hunk_type = "ADD"
-            plus_minus = "{}+".format(self.add_lines)
         elif self.add_lines == 0:
             self.hunk_type = "DEL"
-            plus_minus = "{}-".format(self.del_lines)
         else:
             self.hunk_type = "MOD"
-            plus_minus = "{}+/{}-".format(self.add_lines, self.del_lines)
 
-        # Create the hunk description that will appear in the change list view
-        self.oneline_description = "{:40} {:60} {}".format(
+        # The focus is the first line that isn't context.
+        (self.old_line_focus, self.new_line_focus) = (-1, -1)
+        (pos, leading_context) = (0 if body else -1, 0)
+        while pos != -1 and body.startswith(' ', pos + 1):
+            leading_context += 1
+            pos = body.find('\n', pos + 1)
+        if pos != -1:
+            self.old_line_focus = self.old_line_start + leading_context
+            self.new_line_focus = self.new_line_start + leading_context
+
+        num_lines = body.count('\n') - body.endswith('\n')
+        if (num_lines == self.add_lines + self.del_lines and
+                (not self.add_lines or body.rfind('\n-') < body.find('\n+'))):
+            # No context (e.g. `-U0`), just removed lines followed by added ones, so the regions follow from the
+            # header.
+            self._body = None
+            self._old_regions = []
+            self._new_regions = []
+            if self.del_lines:
+                self._old_regions.append(
+                    DiffRegion("DEL", self.old_line_start, 0, self.old_line_start + self.del_lines, 0))
+            if self.add_lines:
+                self._new_regions.append(
+                    DiffRegion("ADD", self.new_line_start, 0, self.new_line_start + self.add_lines, 0))
+        else:
+            # Keep the body until the regions are needed.
+            self._body = body
+            self._old_regions = None
+            self._new_regions = None
+
+        # The changed words in modified lines, worked out by `FileDiff` when the file is shown.
+        self.word_regions = None
+
+        # The descriptions are only built when a list view first needs them.
+        self._description = None
+        self._oneline_description = None
+
+    @classmethod
+    def from_cache(cls, file_diff, data):
+        """Create a hunk from the details saved by `to_cache`, without parsing the diff again.
+
+        Args:
+            file_diff: The parent `FileDiff` object.
+            data: The saved details.
+
+        Returns:
+            The `HunkDiff`.
+        """
+        hunk = cls.__new__(cls)
+        hunk.file_diff = file_diff
+        (hunk.old_line_start, hunk.old_hunk_len, hunk.new_line_start, hunk.new_hunk_len, hunk.context,
+         hunk.add_lines, hunk.del_lines, hunk.old_line_focus, hunk.new_line_focus, old_lines, new_lines) = data
+        if hunk.del_lines == 0:
+            hunk.hunk_type = "ADD"
+        elif hunk.add_lines == 0:
+            hunk.hunk_type = "DEL"
+        else:
+            hunk.hunk_type = "MOD"
+        hunk._body = None
+        hunk._old_regions = [DiffRegion("DEL", old_lines[i], 0, old_lines[i + 1], 0)
+                             for i in range(0, len(old_lines), 2)]
+        hunk._new_regions = [DiffRegion("ADD", new_lines[i], 0, new_lines[i + 1], 0)
+                             for i in range(0, len(new_lines), 2)]
+        hunk.word_regions = None
+        hunk._description = None
+        hunk._oneline_description = None
+        return hunk
+
+    def to_cache(self):
+        """Get the details of this hunk that are needed to recreate it with `from_cache`.
+
+        Returns:
+            The details, as a JSON-serializable list.
+        """
+        # Removed regions are always "DEL" and added ones "ADD", covering whole lines - so just keep their lines.
+        old_lines = []
+        for region in self.old_regions:
+            old_lines.extend((region.start_line, region.end_line))
+        new_lines = []
+        for region in self.new_regions:
+            new_lines.extend((region.start_line, region.end_line))
+        return [self.old_line_start, self.old_hunk_len, self.new_line_start, self.new_hunk_len, self.context,
+                self.add_lines, self.del_lines, self.old_line_focus, self.new_line_focus, old_lines, new_lines]
+
+    @property
+    def description(self):
+        """The hunk description that will appear in the quick panel, as a list of rows."""
+        if self._description is None:
+            self._description = self.get_description()
+        return self._description
+
+    @property
+    def oneline_description(self):
+        """The hunk description that will appear in the change list view."""
+        if self._oneline_description is None:
+            self._oneline_description = self.get_oneline_description()
+        return self._oneline_description
+
+    def get_description(self):
+        """Create the hunk description that will appear in the quick panel.
+
+        Returns:
+            The rows of the description.
+        """
+        return [
             "{} : {}".format(self.file_diff.filename, self.new_line_focus),
             self.context,
-            plus_minus)
-        # Create the hunk description that will appear in the quick_panel
-        self.description = [
+            "{} | {}".format(self.add_lines + self.del_lines, self.graph())]
+
+    def get_oneline_description(self):
+        """Create the hunk description that will appear in the change list view.
+
+        Returns:
+            The description.
+        """
+        if self.hunk_type == "ADD":
+            plus_minus = "{}+".format(self.add_lines)
+        elif self.hunk_type == "DEL":
+            plus_minus = "{}-".format(self.del_lines)
+        else:
+            plus_minus = "{}+/{}-".format(self.add_lines, self.del_lines)
+        return "{:40} {:60} {}".format(
             "{} : {}".format(self.file_diff.filename, self.new_line_focus),
             self.context,
-            "{} | {}{}".format(self.add_lines + self.del_lines,
-                               "+" * self.add_lines,
-                               "-" * self.del_lines)]
+            plus_minus)
+
+    def graph(self):
+        """Create a bar graph of the added and removed lines, like `diffstat`'s.
+
+        Large hunks are scaled down to fit in `GRAPH_WIDTH` characters, always showing at least one `+` or `-` for
+        added or removed lines.
+
+        Returns:
+            The bar graph.
+        """
+        total = self.add_lines + self.del_lines
+        factor = max(1, -(-total // self.GRAPH_WIDTH))
+        graph = ""
+        if self.add_lines > 0:
+            graph += "+" * max(self.add_lines // factor, 1)
+        if self.del_lines > 0:
+            graph += "-" * max(self.del_lines // factor, 1)
+        return graph
+
+    @property
+    def old_regions(self):
+        """The changed regions in the old file, as `DiffRegion`s."""
+        if self._old_regions is None:
+            self.parse_diff()
+        return self._old_regions
+
+    @property
+    def new_regions(self):
+        """The changed regions in the new file, as `DiffRegion`s."""
+        if self._new_regions is None:
+            self.parse_diff()
+        return self._new_regions
 
     def parse_diff(self):
-        """Generate representations of the changed regions."""
+        """Generate representations of the changed regions.
+
+        The body of the hunk isn't needed once it's parsed, so isn't kept.
+        """
+        old_regions = []
+        new_regions = []
         old_cur_line = self.old_line_start
         new_cur_line = self.new_line_start
         new_add_start = 0
@@ -77,41 +235,38 @@ class HunkDiff(object):
         in_add = False
         in_del = False
 
-        # Add a dummy blank line to catch regions going right to the end of the hunk.
-        for line in self.hunk_diff_lines + [' ']:
+        # Skip the empty string before the body's first newline, and add a dummy blank line to catch regions going
+        # right to the end of the hunk.
+        lines = self.NEWLINE_MATCH.split(self._body)
+        for line in itertools.chain(itertools.islice(lines, 1, None), [' ']):
             if in_add and not line.startswith('+'):
                 # ADD region ends.
-                self.new_regions.append(DiffRegion("ADD", new_add_start, 0, new_cur_line, 0))
+                new_regions.append(DiffRegion("ADD", new_add_start, 0, new_cur_line, 0))
                 in_add = False
             if in_del and not line.startswith('-'):
                 # DEL region ends.
-                self.old_regions.append(DiffRegion("DEL", old_del_start, 0, old_cur_line, 0))
+                old_regions.append(DiffRegion("DEL", old_del_start, 0, old_cur_line, 0))
                 in_del = False
 
             if line.startswith('+'):
-                self.add_lines += 1
                 if not in_add:
                     new_add_start = new_cur_line
                     in_add = True
             elif line.startswith('-'):
-                self.del_lines += 1
                 if not in_del:
                     old_del_start = old_cur_line
                     in_del = True
 
-            # If we've just found the first interesting part, that's where the focus should be for this hunk.
-            if not line.startswith(' '):
-                if self.old_line_focus == -1:
-                    self.old_line_focus = old_cur_line
-                if self.new_line_focus == -1:
-                    self.new_line_focus = new_cur_line
-
             # End of that line.
             if not line.startswith('+'):
                 old_cur_line += 1
             if not line.startswith('-'):
                 new_cur_line += 1
 
+        self._old_regions = old_regions
+        self._new_regions = new_regions
+        self._body = None
+
     def filespecs(self):
         """Get the portion of code that this hunk refers to in the format
         `("old_filename:old_line", "new_filename:new_line")`.
@@ -120,26 +275,30 @@ class HunkDiff(object):
         new_filespec = "{}:{}".format(self.file_diff.new_file, self.new_line_focus)
         return (old_filespec, new_filespec)
 
-    def get_old_regions(self, view):
+    def get_old_regions(self, view, line_index=None):
         """Create a `sublime.Region` for each (old) part of this hunk.
 
         Args:
             view: The view to get the regions for.
+            line_index: [optional] A `LineIndex` for the view's text, to use instead of asking the view.
         """
+        text_point = line_index.text_point if line_index else view.text_point
         return [sublime.Region(
-            view.text_point(r.start_line - 1, r.start_col),
-            view.text_point(r.end_line - 1, r.end_col))
+            text_point(r.start_line - 1, r.start_col),
+            text_point(r.end_line - 1, r.end_col))
             for r in self.old_regions]
 
-    def get_new_regions(self, view):
+    def get_new_regions(self, view, line_index=None):
         """Create a `sublime.Region` for each (new) part of this hunk.
 
         Args:
             view: The view to get the regions for.
+            line_index: [optional] A `LineIndex` for the view's text, to use instead of asking the view.
         """
+        text_point = line_index.text_point if line_index else view.text_point
         return [sublime.Region(
-            view.text_point(r.start_line - 1, r.start_col),
-            view.text_point(r.end_line - 1, r.end_col))
+            text_point(r.start_line - 1, r.start_col),
+            text_point(r.end_line - 1, r.end_col))
             for r in self.new_regions]
 
 
@@ -152,12 +311,48 @@ class DummyHunkDiff(HunkDiff):
         n_changes: The number of changes in this file.
     """
 
+    __slots__ = ('n_changes',)
+
     def __init__(self, file_diff, n_changes):
         self.file_diff = file_diff
-        self.old_regions = []
-        self.new_regions = []
+        self._old_regions = []
+        self._new_regions = []
         self.old_line_focus = 0
         self.new_line_focus = 0
         self.n_changes = n_changes
-        self.oneline_description = "{:40} {} changes".format(file_diff.filename, n_changes)
-        self.description = ["========", "", ""]
+        self._description = None
+        self._oneline_description = None
+
+    def get_description(self):
+        return ["========", "", ""]
+
+    def get_oneline_description(self):
+        return "{:40} {} changes".format(self.file_diff.filename, self.n_changes)
+
+
+class MetaHunkDiff(HunkDiff):
+
+    """Hunk describing a file whose contents aren't shown (e.g. binary files).
+
+    Args:
+        file_diff: The parent `FileDiff` object.
+        reason: Why the contents aren't shown.
+    """
+
+    __slots__ = ('reason',)
+
+    def __init__(self, file_diff, reason):
+        self.file_diff = file_diff
+        self._old_regions = []
+        self._new_regions = []
+        self.old_line_focus = 0
+        self.new_line_focus = 0
+        self.reason = reason
+        self._description = None
+        self._oneline_description = None
+
+    def get_description(self):
+        return [self.file_diff.filename, self.reason, ""]
+
+    def get_oneline_description(self):
+        return "{:40} {}".format(self.file_diff.filename, self.reason)
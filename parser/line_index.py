@@ -0,0 +1,63 @@
+import itertools
+from array import array
+
+
+class LineIndex(object):
+    """Offsets of the start of each line in a file.
+
+    Lets positions in a view of the file be worked out without asking the view for each one - every `view.text_point`
+    call is a round trip to Sublime Text.
+    """
+
+    def __init__(self, text):
+        """Constructor.
+
+        Args:
+            text: The text of the file, with `\\n` line endings (as a view holds it).
+        """
+        self.size = len(text)
+        self.line_starts = array('l', [0])
+        self.line_starts.extend(itertools.accumulate(len(line) + 1 for line in text.split('\n')[:-1]))
+
+    def text_point(self, row, col):
+        """Convert a row and column to a position in the text, like `view.text_point`.
+
+        Args:
+            row: The row, counting from 0.
+            col: The column, counting from 0.
+
+        Returns:
+            The position, limited to the size of the text.
+        """
+        if row < 0:
+            row = 0
+        if row >= len(self.line_starts):
+            return self.size
+        return min(self.line_starts[row] + col, self.size)
+
+
+def read_text(path):
+    """Read a file's text as a view would hold it.
+
+    Args:
+        path: The path of the file.
+
+    Returns:
+        The text, with `\n` line endings.  `None` if the file can't be read, isn't UTF-8, or has line endings a view
+        might not hold the same way.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return None
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+        if '\r' in text:
+            # Old Mac or mixed line endings.
+            return None
+    return text
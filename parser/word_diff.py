@@ -0,0 +1,86 @@
+import difflib
+import re
+
+from .diff_region import DiffRegion
+
+
+class WordDiff(object):
+    """Works out which words have changed within a hunk's changed lines.
+
+    The cost of diffing words grows with the product of the old and new word counts, so hunks above `MAX_COST` aren't
+    diffed - they're just highlighted by line.
+    """
+
+    # Words, runs of whitespace, and single punctuation characters.
+    TOKEN_MATCH = re.compile(r'\w+|\s+|[^\w\s]')
+    MAX_COST = 250000
+
+    def __init__(self, old_lines, new_lines, max_cost=MAX_COST):
+        """Constructor.
+
+        Args:
+            old_lines: The removed lines, as a list of `(line_number, text)` tuples.
+            new_lines: The added lines, as a list of `(line_number, text)` tuples.
+            max_cost: [optional] The most work to do, as the product of the old and new word counts.
+        """
+        self.old_tokens = self.tokenize(old_lines)
+        self.new_tokens = self.tokenize(new_lines)
+        self.max_cost = max_cost
+
+    def tokenize(self, lines):
+        """Split lines into words.
+
+        Args:
+            lines: The lines, as a list of `(line_number, text)` tuples.
+
+        Returns:
+            A list of `(word, line_number, start_col, end_col)` tuples.  Lines are separated by `None` words, so changes
+            can't be matched across line ends.
+        """
+        tokens = []
+        for (line_number, text) in lines:
+            if tokens:
+                tokens.append((None, line_number, 0, 0))
+            for match in self.TOKEN_MATCH.finditer(text):
+                tokens.append((match.group(0), line_number, match.start(), match.end()))
+        return tokens
+
+    def get_regions(self):
+        """Get the changed words, unless that would cost too much.
+
+        Returns:
+            A tuple of `(old_regions, new_regions)` - lists of `DiffRegion`s covering the changed words in each version.
+            `None` if the lines are too long to diff.
+        """
+        if len(self.old_tokens) * len(self.new_tokens) > self.max_cost:
+            return None
+        matcher = difflib.SequenceMatcher(
+            None, [t[0] for t in self.old_tokens], [t[0] for t in self.new_tokens], autojunk=False)
+        old_regions = []
+        new_regions = []
+        for (tag, i1, i2, j1, j2) in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            old_regions.extend(self.make_regions(self.old_tokens[i1:i2]))
+            new_regions.extend(self.make_regions(self.new_tokens[j1:j2]))
+        return (old_regions, new_regions)
+
+    @staticmethod
+    def make_regions(tokens):
+        """Make regions covering a run of changed words, with one region per line.
+
+        Args:
+            tokens: The changed words, as returned by `tokenize`.
+
+        Returns:
+            A list of `DiffRegion`s.
+        """
+        regions = []
+        for (word, line_number, start_col, end_col) in tokens:
+            if word is None:
+                continue
+            if regions and regions[-1].start_line == line_number:
+                regions[-1].end_col = end_col
+            else:
+                regions.append(DiffRegion("MOD", line_number, start_col, line_number, end_col))
+        return regions
@@ -0,0 +1,10 @@
+"""Helpers shared by the DiffView tests."""
+import subprocess
+
+
+def git_available():
+    try:
+        subprocess.check_output(['git', '--version'])
+        return True
+    except (IOError, OSError):
+        return False
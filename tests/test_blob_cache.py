@@ -0,0 +1,95 @@
+import sys
+import os
+import stat
+import time
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+diffview = sys.modules["DiffView"]
+BlobCache = diffview.util.blob_cache.BlobCache
+
+
+class test_BlobCache(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = BlobCache(self.cache_dir, max_size=10)
+
+    def tearDown(self):
+        self.cache.max_size = 0
+        self.cache.evict()
+        shutil.rmtree(self.cache_dir)
+
+    def write_fn(self, content):
+        def write(path):
+            with open(path, 'w') as f:
+                f.write(content)
+        return write
+
+    def test_store_and_get(self):
+        self.assertIsNone(self.cache.get('abcdef', 'dir/file.py'))
+        path = self.cache.store('abcdef', 'dir/file.py', self.write_fn('hello'))
+        self.assertEqual(os.path.basename(path), 'file.py')
+        with open(path) as f:
+            self.assertEqual(f.read(), 'hello')
+        self.assertEqual(self.cache.get('abcdef', 'dir/file.py'), path)
+
+        # Cached files are read-only.
+        self.assertFalse(os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+    def test_failed_store(self):
+        def fail(path):
+            raise IOError("Failed")
+        with self.assertRaises(IOError):
+            self.cache.store('abcdef', 'file.py', fail)
+        self.assertIsNone(self.cache.get('abcdef', 'file.py'))
+
+    def test_evict_least_recently_used(self):
+        old_path = self.cache.store('aaaaaa', 'old.py', self.write_fn('12345'))
+        used_path = self.cache.store('bbbbbb', 'used.py', self.write_fn('12345'))
+        new_path = self.cache.store('cccccc', 'new.py', self.write_fn('12345'))
+        now = time.time()
+        os.utime(old_path, (now - 30, now - 30))
+        os.utime(used_path, (now - 20, now - 20))
+        os.utime(new_path, (now - 10, now - 10))
+
+        # Using an entry makes it the most recently used.
+        self.cache.get('bbbbbb', 'used.py')
+        self.cache.max_size = 5
+        self.cache.evict()
+        self.assertIsNone(self.cache.get('aaaaaa', 'old.py'))
+        self.assertIsNone(self.cache.get('cccccc', 'new.py'))
+        self.assertEqual(self.cache.get('bbbbbb', 'used.py'), used_path)
+
+    def test_evict_keeps_total_size(self):
+        self.cache.store('aaaaaa', 'a.py', self.write_fn('12345'))
+        with patch.object(os, 'walk', wraps=os.walk) as walk:
+            self.cache.evict()
+            self.assertEqual(walk.call_count, 1)
+            # The size is kept up to date, so the contents are only looked through again once it's too big.
+            self.cache.store('bbbbbb', 'b.py', self.write_fn('12345'))
+            self.cache.evict()
+            self.assertEqual(walk.call_count, 1)
+            self.cache.store('cccccc', 'c.py', self.write_fn('12345'))
+            self.cache.evict()
+            self.assertEqual(walk.call_count, 2)
+        self.assertIsNone(self.cache.get('aaaaaa', 'a.py'))
+        self.assertEqual(BlobCache._sizes[self.cache.blob_dir], 10)
+
+    def test_abandoned_sessions_removed(self):
+        old_session = self.cache.new_session_dir()
+        then = time.time() - BlobCache.SESSION_MAX_AGE - 1
+        os.utime(old_session, (then, then))
+        new_session = self.cache.new_session_dir()
+        self.assertFalse(os.path.exists(old_session))
+        self.assertTrue(os.path.isdir(new_session))
+
+    def test_used_sessions_kept(self):
+        session = self.cache.new_session_dir()
+        then = time.time() - BlobCache.SESSION_MAX_AGE - 1
+        os.utime(session, (then, then))
+        self.cache.touch_session(session)
+        self.cache.new_session_dir()
+        self.assertTrue(os.path.isdir(session))
@@ -1,4 +1,5 @@
 import sys
+import io
 import subprocess
 from unittest import TestCase
 from unittest.mock import patch
@@ -14,7 +15,7 @@ class test_BzrHelper(TestCase):
 
     def test_init(self):
         bzr_helper = BzrHelper('/repo/base')
-        self.assertFalse(bzr_helper.got_changed_files)
+        self.assertEqual(bzr_helper.repo_base, '/repo/base')
 
     @patch('subprocess.Popen')
     def test_file_versions(self, mocked_Popen):
@@ -35,6 +36,39 @@ class test_BzrHelper(TestCase):
             bzr_helper.get_file_versions('..other_branch_name'),
             ('', 'other_branch_name'))
 
+    @patch('subprocess.Popen')
+    def test_get_changed_files(self, mocked_Popen):
+        bzr_helper = BzrHelper('/repo/base')
+        mocked_Popen.return_value = self.dummy_process
+        self.dummy_process.stdout = io.BytesIO(
+            b"=== added directory 'dir'\n" +
+            b"=== modified file 'dir/a.py'\n" +
+            b"--- dir/a.py\t2016-01-01 12:00:00 +0000\n" +
+            b"+++ dir/a.py\t2016-01-02 12:00:00 +0000\n" +
+            b"@@ -1,2 +1,3 @@\n" +
+            b" unchanged\n" +
+            b"+added\n" +
+            b" unchanged\n" +
+            b"=== renamed file 'old name' => 'new name'\n" +
+            b"--- old name\t2016-01-01 12:00:00 +0000\n" +
+            b"+++ new name\t2016-01-02 12:00:00 +0000\n" +
+            b"@@ -1 +1 @@\n" +
+            b"-old\n" +
+            b"+new\n")
+        files = bzr_helper.get_changed_files('-r1')
+
+        # All files come from a single diff command.
+        self.assertEqual(mocked_Popen.call_count, 1)
+        self.assertEqual(mocked_Popen.call_args[0][0], ['bzr', '--no-aliases', 'diff', '-r1'])
+        self.assertEqual([f.filename for f in files], ['dir/a.py', 'new name'])
+        self.assertEqual(files[1].abs_filename, '/repo/base/new name')
+        self.assertEqual(len(files[0].get_hunks()), 1)
+        self.assertEqual(files[0].get_hunks()[0].add_lines, 1)
+        self.assertEqual(len(files[1].get_hunks()), 1)
+
+        # Bzr doesn't give the counts - they come from the parsed hunks.
+        self.assertEqual([f.get_line_counts() for f in files], [(1, 0), (1, 1)])
+
 
 class DummyProcess(object):
     """Dummy process to return values from `communicate()`.
@@ -43,3 +77,9 @@ class DummyProcess(object):
     """
     def communicate(self, *args, **kwargs):
         return self.ret_vals.pop(0)
+
+    def poll(self):
+        return 0
+
+    def wait(self, *args, **kwargs):
+        return 0
@@ -0,0 +1,42 @@
+import sys
+import subprocess
+from unittest import TestCase
+
+diffview = sys.modules["DiffView"]
+CancelToken = diffview.util.cancel.CancelToken
+DiffCancelled = diffview.util.cancel.DiffCancelled
+
+
+def sleeping_process():
+    return subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+
+
+class test_CancelToken(TestCase):
+
+    def test_check(self):
+        token = CancelToken()
+        token.check()
+        token.cancel()
+        with self.assertRaises(DiffCancelled):
+            token.check()
+
+    def test_cancel_kills_processes(self):
+        token = CancelToken()
+        running = sleeping_process()
+        finished = sleeping_process()
+        token.register(running)
+        token.register(finished)
+        token.unregister(finished)
+
+        token.cancel()
+        self.assertIsNotNone(running.wait(timeout=5))
+        self.assertIsNone(finished.poll())
+        finished.kill()
+        finished.wait()
+
+    def test_register_after_cancel(self):
+        token = CancelToken()
+        token.cancel()
+        process = sleeping_process()
+        token.register(process)
+        self.assertIsNotNone(process.wait(timeout=5))
@@ -0,0 +1,57 @@
+import sys
+import os
+import time
+import shutil
+import tempfile
+from unittest import TestCase
+
+diffview = sys.modules["DiffView"]
+DiffCache = diffview.util.diff_cache.DiffCache
+
+
+class test_DiffCache(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = DiffCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_store_and_get(self):
+        key = ['git', '/repo', 'a..b', 'a' * 40, 'b' * 40]
+        self.assertIsNone(self.cache.get(key))
+        self.cache.store(key, [{'filename': 'a.txt', 'hunks': [[1, 2, 3, 4]]}])
+        self.assertEqual(self.cache.get(key), [{'filename': 'a.txt', 'hunks': [[1, 2, 3, 4]]}])
+        self.assertIsNone(self.cache.get(key[:-1] + ['c' * 40]))
+
+    def test_working_copy_state(self):
+        key = ['git', '/repo', '', 'a' * 40, '']
+        state = [('a.txt', 'a.txt', 'a' * 40, None, True, (1234.5, 10))]
+        self.cache.store(key, [], state)
+        self.assertEqual(self.cache.get(key, state), [])
+        # Only used while the files are unchanged.
+        self.assertIsNone(self.cache.get(key, [('a.txt', 'a.txt', 'a' * 40, None, True, (1234.6, 10))]))
+        self.assertIsNone(self.cache.get(key))
+
+    def test_corrupt_entry(self):
+        self.cache.store(['key'], [])
+        (name,) = os.listdir(self.cache.diff_dir)
+        with open(os.path.join(self.cache.diff_dir, name), 'wb') as f:
+            f.write(b'not compressed')
+        self.assertIsNone(self.cache.get(['key']))
+
+    def test_evict_least_recently_used(self):
+        for key in ['old', 'used', 'new']:
+            self.cache.store([key], key)
+        now = time.time()
+        for (age, key) in [(30, 'old'), (20, 'used'), (10, 'new')]:
+            os.utime(self.cache._path([key]), (now - age, now - age))
+
+        # Using an entry makes it the most recently used.
+        self.assertEqual(self.cache.get(['used']), 'used')
+        self.cache.max_entries = 2
+        self.cache.evict()
+        self.assertIsNone(self.cache.get(['old']))
+        self.assertEqual(self.cache.get(['used']), 'used')
+        self.assertEqual(self.cache.get(['new']), 'new')
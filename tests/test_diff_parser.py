@@ -0,0 +1,253 @@
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase, skipUnless
+
+from diffview_test_helpers import git_available
+
+diffview = sys.modules["DiffView"]
+DiffParser = diffview.parser.diff_parser.DiffParser
+VCSHelper = diffview.util.vcs.VCSHelper
+
+
+@skipUnless(git_available(), "Git is not installed")
+class test_DiffParser_live(TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        VCSHelper._helpers = {}
+        for cmd in [['init', '-q'],
+                    ['config', 'user.email', 'test@example.com'],
+                    ['config', 'user.name', 'Test']]:
+            subprocess.check_call(['git'] + cmd, cwd=self.repo)
+        for filename in ['a.txt', 'b.txt', 'c.txt']:
+            self.write(filename, ''.join('line {}\n'.format(i) for i in range(20)))
+        subprocess.check_call(['git', 'add', '-A'], cwd=self.repo)
+        subprocess.check_call(['git', 'commit', '-q', '-m', 'Initial'], cwd=self.repo)
+
+        self.write('a.txt', 'new first line\n' + ''.join('line {}\n'.format(i) for i in range(20)))
+        self.write('c.txt', ''.join('line {}\n'.format(i) for i in range(19)))
+        self.parser = DiffParser('', self.repo, cache_dir=self.cache_dir)
+        self.parser.run()
+
+    def tearDown(self):
+        self.parser.vcs_helper.close()
+        VCSHelper._helpers = {}
+        shutil.rmtree(self.repo)
+        shutil.rmtree(self.cache_dir)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.repo, filename), 'w') as f:
+            f.write(content)
+
+    def descriptions(self):
+        return [(h.file_diff.filename, h.hunk_type) for h in self.parser.changed_hunks]
+
+    def test_initial_diff(self):
+        self.assertTrue(self.parser.is_live())
+        self.assertEqual(self.descriptions(), [('a.txt', 'ADD'), ('c.txt', 'DEL')])
+
+    def test_perf(self):
+        perf = self.parser.perf
+        for span in ['detect', 'versions', 'diff', 'stat', 'skip check', 'parse', 'total']:
+            self.assertIn(span, perf.spans)
+        self.assertEqual(perf.spans['parse'][1], 2)
+        self.assertGreater(perf.counters['VCS processes'], 0)
+        self.assertGreater(perf.counters['bytes read from VCS'], 0)
+        self.assertEqual(perf.counters['hunks'], 2)
+
+    def test_find_file(self):
+        a_file = os.path.join(self.repo, 'a.txt')
+        (changed_file, old) = self.parser.find_file(a_file)
+        self.assertEqual((changed_file.filename, old), ('a.txt', False))
+        # Old versions are found once they've been set up.
+        self.parser.ensure_file_ready(self.parser.changed_files[1])
+        (changed_file, old) = self.parser.find_file(self.parser.changed_files[1].old_file)
+        self.assertEqual((changed_file.filename, old), ('c.txt', True))
+        self.assertEqual(self.parser.find_file(os.path.join(self.repo, 'b.txt')), (None, False))
+
+        # Files that change later are found too.
+        self.write('b.txt', 'changed\n')
+        self.parser.rediff_file(os.path.join(self.repo, 'b.txt'))
+        (changed_file, old) = self.parser.find_file(os.path.join(self.repo, 'b.txt'))
+        self.assertEqual((changed_file.filename, old), ('b.txt', False))
+
+        # As are the new entries for files that change again.
+        self.write('a.txt', 'changed again\n')
+        self.parser.rediff_file(a_file)
+        self.assertIs(self.parser.find_file(a_file)[0], self.parser.changed_files[0])
+        self.assertIs(self.parser.find_file(os.path.join(self.repo, 'c.txt'))[0], self.parser.changed_files[2])
+
+    def test_files_set_up_when_needed(self):
+        changed_file = self.parser.changed_files[1]
+        self.assertFalse(self.parser.is_file_ready(changed_file))
+        self.assertNotIn('fetch', self.parser.perf.spans)
+
+        self.parser.ensure_file_ready(changed_file)
+        self.assertTrue(self.parser.is_file_ready(changed_file))
+        with open(changed_file.old_file) as f:
+            self.assertEqual(f.read(), ''.join('line {}\n'.format(i) for i in range(20)))
+        self.assertEqual(changed_file.new_file, os.path.join(self.repo, 'c.txt'))
+
+        # Only set up once.
+        self.parser.ensure_file_ready(changed_file)
+        self.assertEqual(self.parser.perf.spans['fetch'][1], 1)
+
+    def test_prefetch_files(self):
+        self.parser.prefetch_files(self.parser.changed_files)
+        thread = self.parser.prefetch_thread
+        if thread is not None:
+            thread.join()
+        self.assertTrue(all(self.parser.is_file_ready(f) for f in self.parser.changed_files))
+        self.assertEqual(self.parser.perf.counters['files prefetched'], 2)
+
+        # Nothing to do once they're ready.
+        self.parser.prefetch_files(self.parser.changed_files)
+        self.assertIsNone(self.parser.prefetch_thread)
+
+    def test_file_changed_again(self):
+        self.write('a.txt', 'new first line\n' + ''.join('line {}\n'.format(i) for i in range(20)) + 'last\n')
+        (start, old_count, new_hunks) = self.parser.rediff_file(os.path.join(self.repo, 'a.txt'))
+        self.assertEqual((start, old_count, len(new_hunks)), (0, 1, 2))
+        self.assertEqual(self.descriptions(), [('a.txt', 'ADD'), ('a.txt', 'ADD'), ('c.txt', 'DEL')])
+        self.assertIs(self.parser.changed_files[0], new_hunks[0].file_diff)
+
+        # Saved again without changes.
+        self.assertIsNone(self.parser.rediff_file(os.path.join(self.repo, 'a.txt')))
+
+    def test_newly_changed_file(self):
+        self.write('b.txt', 'changed\n')
+        (start, old_count, new_hunks) = self.parser.rediff_file(os.path.join(self.repo, 'b.txt'))
+        self.assertEqual((start, old_count, len(new_hunks)), (1, 0, 1))
+        self.assertEqual(self.descriptions(), [('a.txt', 'ADD'), ('b.txt', 'MOD'), ('c.txt', 'DEL')])
+        self.assertEqual([f.filename for f in self.parser.changed_files], ['a.txt', 'b.txt', 'c.txt'])
+
+    def test_file_reverted(self):
+        self.write('c.txt', ''.join('line {}\n'.format(i) for i in range(20)))
+        self.assertEqual(self.parser.rediff_file(os.path.join(self.repo, 'c.txt')), (1, 1, []))
+        self.assertEqual(self.descriptions(), [('a.txt', 'ADD')])
+
+    def test_unrelated_files(self):
+        # Saved without being changed.
+        self.assertIsNone(self.parser.rediff_file(os.path.join(self.repo, 'b.txt')))
+        # Not in the repo.
+        self.assertIsNone(self.parser.rediff_file(os.path.join(self.cache_dir, 'a.txt')))
+        self.assertEqual(len(self.parser.changed_hunks), 2)
+
+    def test_restricted_to_paths(self):
+        parser = DiffParser('-- a.txt c.txt', self.repo, cache_dir=self.cache_dir)
+        parser.run()
+        self.write('b.txt', 'changed\n')
+        self.assertIsNone(parser.rediff_file(os.path.join(self.repo, 'b.txt')))
+        self.write('c.txt', 'changed\n')
+        (start, old_count, new_hunks) = parser.rediff_file(os.path.join(self.repo, 'c.txt'))
+        self.assertEqual((start, old_count), (1, 1))
+        self.assertEqual([f.filename for f in parser.changed_files], ['a.txt', 'c.txt'])
+
+        parser = DiffParser('-- . :!b.txt', self.repo, cache_dir=self.cache_dir)
+        parser.run()
+        self.assertIsNone(parser.rediff_file(os.path.join(self.repo, 'b.txt')))
+        self.assertEqual([f.filename for f in parser.changed_files], ['a.txt', 'c.txt'])
+
+    def test_not_live_for_commits(self):
+        parser = DiffParser('HEAD..HEAD', self.repo, cache_dir=self.cache_dir)
+        parser.run()
+        self.assertFalse(parser.is_live())
+        self.assertIsNone(parser.rediff_file(os.path.join(self.repo, 'a.txt')))
+
+    def test_cached_working_copy_diff(self):
+        parser = DiffParser('', self.repo, cache_dir=self.cache_dir)
+        parser.run()
+        self.assertEqual(parser.perf.counters['files from cache'], 2)
+        self.assertNotIn('diff', parser.perf.spans)
+        self.assertEqual([(h.file_diff.filename, h.hunk_type) for h in parser.changed_hunks],
+                         [('a.txt', 'ADD'), ('c.txt', 'DEL')])
+        self.assertEqual(parser.changed_hunks[0].new_regions[0].start_line, 1)
+        self.assertEqual([f.get_line_counts() for f in parser.changed_files], [(1, 0), (0, 1)])
+        parser.ensure_file_ready(parser.changed_files[0])
+        self.assertEqual(parser.changed_files[0].new_file, os.path.join(self.repo, 'a.txt'))
+        self.assertTrue(parser.is_live())
+
+        # Not used once another file changes.
+        self.write('b.txt', 'changed\n')
+        parser = DiffParser('', self.repo, cache_dir=self.cache_dir)
+        parser.run()
+        self.assertNotIn('files from cache', parser.perf.counters)
+        self.assertEqual([f.filename for f in parser.changed_files], ['a.txt', 'b.txt', 'c.txt'])
+
+    def test_cached_commit_diff(self):
+        subprocess.check_call(['git', 'commit', '-q', '-a', '-m', 'Change'], cwd=self.repo)
+        parser = DiffParser('HEAD~1..HEAD', self.repo, cache_dir=self.cache_dir, get_diff_headers=True)
+        parser.run()
+        self.assertNotIn('files from cache', parser.perf.counters)
+        descriptions = [h.oneline_description for h in parser.changed_hunks]
+
+        parser = DiffParser('HEAD~1..HEAD', self.repo, cache_dir=self.cache_dir, get_diff_headers=True)
+        parser.run()
+        self.assertEqual(parser.perf.counters['files from cache'], 2)
+        self.assertEqual([h.oneline_description for h in parser.changed_hunks], descriptions)
+
+        # Not used once the revisions refer to different commits.
+        self.write('b.txt', 'changed\n')
+        subprocess.check_call(['git', 'commit', '-q', '-a', '-m', 'Change again'], cwd=self.repo)
+        parser = DiffParser('HEAD~1..HEAD', self.repo, cache_dir=self.cache_dir)
+        parser.run()
+        self.assertNotIn('files from cache', parser.perf.counters)
+        self.assertEqual([f.filename for f in parser.changed_files], ['b.txt'])
+
+    def test_merge_base_remembered(self):
+        first = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=self.repo).decode().strip()
+        subprocess.check_call(['git', 'commit', '-q', '-a', '-m', 'Change'], cwd=self.repo)
+        helper = self.parser.vcs_helper
+        context = self.parser.vcs_context
+        self.assertEqual(helper.get_file_versions(first + '...HEAD', context), (first, 'HEAD'))
+        processes = context.perf.counters['VCS processes']
+        self.assertEqual(helper.get_file_versions(first + '...HEAD', context), (first, 'HEAD'))
+        self.assertEqual(context.perf.counters['VCS processes'], processes)
+
+    def test_diffs_share_helper(self):
+        parser = DiffParser('', self.repo, cache_dir=self.cache_dir, cache_diffs=False, in_process=False)
+        parser.run()
+        other = DiffParser('HEAD', self.repo, cache_dir=self.cache_dir)
+        self.assertIs(other.vcs_helper, parser.vcs_helper)
+
+        # Cancelling one diff doesn't stop another's VCS commands, and each diff's work is counted in its own run.
+        other.cancel()
+        requests = parser.perf.counters['git cat-file requests']
+        parser.ensure_file_ready(parser.changed_files[1])
+        with open(parser.changed_files[1].old_file) as f:
+            self.assertEqual(f.read(), ''.join('line {}\n'.format(i) for i in range(20)))
+        self.assertEqual(parser.perf.counters['git cat-file requests'], requests + 1)
+        self.assertNotIn('git cat-file requests', other.perf.counters)
+
+    def test_cached_contents_match_blob(self):
+        self.check_cached_contents_match_blob(in_process=True)
+
+    def test_cached_contents_match_blob_cat_file(self):
+        self.check_cached_contents_match_blob(in_process=False)
+
+    def check_cached_contents_match_blob(self, in_process):
+        staged = 'staged\n' + ''.join('line {}\n'.format(i) for i in range(20))
+        self.write('b.txt', staged)
+        subprocess.check_call(['git', 'add', 'b.txt'], cwd=self.repo)
+        self.write('b.txt', staged + 'unstaged\n')
+
+        # A plain diff is against the index, so the old version is the staged one.
+        parser = DiffParser('', self.repo, cache_dir=self.cache_dir, in_process=in_process)
+        parser.run()
+        changed_file = [f for f in parser.changed_files if f.filename == 'b.txt'][0]
+        parser.ensure_file_ready(changed_file)
+        with open(changed_file.old_file) as f:
+            self.assertEqual(f.read(), staged)
+
+        # Once it's committed, diffing against HEAD uses the same blob - and must not get the stale contents.
+        subprocess.check_call(['git', 'commit', '-q', '-m', 'Stage'], cwd=self.repo)
+        parser = DiffParser('HEAD', self.repo, cache_dir=self.cache_dir, in_process=in_process)
+        parser.run()
+        changed_file = [f for f in parser.changed_files if f.filename == 'b.txt'][0]
+        parser.ensure_file_ready(changed_file)
+        with open(changed_file.old_file) as f:
+            self.assertEqual(f.read(), staged)
@@ -1,8 +1,31 @@
 import sys
+import os
+import tempfile
 from unittest import TestCase
 
 diffview = sys.modules["DiffView"]
 FileDiff = diffview.parser.file_diff.FileDiff
+Constants = diffview.util.constants.Constants
+
+
+class FakeView(object):
+    """Just enough of a view to add regions to."""
+
+    def __init__(self, text):
+        self.text = text
+        self.regions = {}
+        self.text_point_calls = 0
+
+    def size(self):
+        return len(self.text)
+
+    def text_point(self, row, col):
+        self.text_point_calls += 1
+        lines = self.text.split('\n')
+        return min(sum(len(line) + 1 for line in lines[:row]) + col, len(self.text))
+
+    def add_regions(self, key, regions, scope, flags=0):
+        self.regions[key] = [(r.a, r.b) for r in regions]
 
 
 class test_FileDiff(TestCase):
@@ -25,3 +48,195 @@ class test_FileDiff(TestCase):
         file_diff = FileDiff('test.html', '/path/to/test.html', diff_output)
         hunks = file_diff.get_hunks()
         self.assertEquals(1, len(hunks))
+
+    def test_multiple_hunks(self):
+        file_diff = FileDiff('test.txt', '/path/to/test.txt', """diff --git a/test.txt b/test.txt
+--- a/test.txt
++++ b/test.txt
+@@ -1 +1 @@ first
+-a
++b
+@@ -10,0 +11,2 @@ second
++c
++d
+@@ -20,2 +22 @@
+-e
+-f
++g
+""")
+        hunks = file_diff.get_hunks()
+        self.assertEqual([h.hunk_type for h in hunks], ['MOD', 'ADD', 'MOD'])
+        self.assertEqual([h.context for h in hunks], [' first', ' second', ''])
+        self.assertEqual([(h.add_lines, h.del_lines) for h in hunks], [(1, 1), (2, 0), (1, 2)])
+        self.assertEqual([h.new_line_focus for h in hunks], [1, 11, 22])
+
+    def test_diff_text_released(self):
+        file_diff = FileDiff('video.mp4', '/path/to/video.mp4', """diff --git a/video.mp4 b/video.mp4
+--- a/video.mp4
++++ b/video.mp4
+@@ -2,2 +2,2 @@ version https://git-lfs.github.com/spec/v1
+-oid sha256:""" + "a" * 64 + """
+-size 1234
++oid sha256:""" + "b" * 64 + """
++size 56789
+""")
+        hunks = file_diff.get_hunks()
+        self.assertIsNone(file_diff.diff_text)
+        self.assertIs(file_diff.get_hunks(), hunks)
+        self.assertEqual(1, len(hunks))
+        # Details from the diff are still known.
+        self.assertEqual(file_diff.get_lfs_object_size(), 56789)
+        self.assertFalse(file_diff.is_binary())
+
+    def test_find_adjacent_hunk(self):
+        file_diff = FileDiff('test.txt', '/path/to/test.txt', """--- a/test.txt
++++ b/test.txt
+@@ -1 +1 @@
+-a
++b
+@@ -10,0 +11,2 @@
++c
++d
+@@ -20,2 +22 @@
+-e
+-f
++g
+""")
+        hunks = file_diff.get_hunks(include_headers=True)
+        (first, second, third) = hunks[1:]
+        self.assertIs(file_diff.find_adjacent_hunk(1, True), second)
+        self.assertIs(file_diff.find_adjacent_hunk(11, True), third)
+        self.assertIsNone(file_diff.find_adjacent_hunk(22, True))
+        self.assertIs(file_diff.find_adjacent_hunk(22, False), second)
+        self.assertIs(file_diff.find_adjacent_hunk(15, False), second)
+        self.assertIsNone(file_diff.find_adjacent_hunk(1, False))
+
+        # Lines in the old version.
+        self.assertIs(file_diff.find_adjacent_hunk(11, True, old=True), third)
+        self.assertIs(file_diff.find_adjacent_hunk(20, False, old=True), second)
+
+    def test_binary_file(self):
+        file_diff = FileDiff('image.png', '/path/to/image.png', """diff --git a/image.png b/image.png
+index 88768ef..3e3315e 100644
+Binary files a/image.png and b/image.png differ
+""")
+        self.assertTrue(file_diff.is_binary())
+        file_diff = FileDiff('image.png', '/path/to/image.png', """Index: image.png
+===================================================================
+Cannot display: file marked as a binary type.
+svn:mime-type = application/octet-stream
+""")
+        self.assertTrue(file_diff.is_binary())
+        file_diff = FileDiff('test.txt', '/path/to/test.txt', """--- a/test.txt
++++ b/test.txt
+@@ -1 +1 @@
+-Binary files a/x and b/x differ
++Not a binary file
+""")
+        self.assertFalse(file_diff.is_binary())
+
+    def test_lfs_pointer(self):
+        file_diff = FileDiff('video.mp4', '/path/to/video.mp4', """diff --git a/video.mp4 b/video.mp4
+index 1234567..89abcde 100644
+--- a/video.mp4
++++ b/video.mp4
+@@ -2,2 +2,2 @@ version https://git-lfs.github.com/spec/v1
+-oid sha256:""" + "a" * 64 + """
+-size 1234
++oid sha256:""" + "b" * 64 + """
++size 56789
+""")
+        self.assertEqual(file_diff.get_lfs_object_size(), 56789)
+        file_diff = FileDiff('test.txt', '/path/to/test.txt', """--- a/test.txt
++++ b/test.txt
+@@ -1 +1 @@
+-size 1234
++size 56789
+""")
+        self.assertIsNone(file_diff.get_lfs_object_size())
+
+    def test_skipped_file(self):
+        file_diff = FileDiff('image.png', '/path/to/image.png', """diff --git a/image.png b/image.png
+index 88768ef..3e3315e 100644
+Binary files a/image.png and b/image.png differ
+""")
+        file_diff.skip_reason = 'Binary file changed'
+        hunks = file_diff.get_hunks(include_headers=True)
+        self.assertEqual(2, len(hunks))
+        self.assertEqual(1, hunks[0].n_changes)
+        self.assertEqual(hunks[1].description, ['image.png', 'Binary file changed', ''])
+        self.assertEqual(hunks[1].old_regions, [])
+        self.assertEqual(hunks[1].new_regions, [])
+
+        # The persistent list stores its folding region on each hunk.
+        for hunk in hunks:
+            hunk.fold_region = None
+
+    def test_add_regions(self):
+        file_diff = FileDiff('test.txt', '/path/to/test.txt', """--- a/test.txt
++++ b/test.txt
+@@ -1,0 +2 @@
++new
+@@ -3 +4 @@
+-old
++changed
+""")
+        file_diff.get_hunks(include_headers=True)
+        styles = {"ADD": "add", "MOD": "mod", "DEL": "del"}
+        text = 'one\nnew\ntwo\nchanged\n'
+        (fd, file_diff.new_file) = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+
+            # The positions come from the file, not the view.
+            view = FakeView(text)
+            file_diff.add_new_regions(view, styles)
+            self.assertEqual(view.text_point_calls, 0)
+            self.assertEqual(view.regions[Constants.ADD_REGION_KEY], [(4, 8)])
+            self.assertEqual(view.regions[Constants.MOD_REGION_KEY], [(12, 20)])
+            self.assertEqual(view.regions[Constants.DEL_REGION_KEY], [])
+
+            # The view has unsaved changes - ask it instead.
+            view = FakeView('new first line\n' + text)
+            file_diff.add_new_regions(view, styles)
+            self.assertEqual(view.text_point_calls, 4)
+            self.assertEqual(view.regions[Constants.ADD_REGION_KEY], [(15, 19)])
+        finally:
+            os.remove(file_diff.new_file)
+
+    def test_add_word_regions(self):
+        file_diff = FileDiff('test.txt', '/path/to/test.txt', """--- a/test.txt
++++ b/test.txt
+@@ -2 +2 @@
+-x = compute(a)
++x = compute(b)
+@@ -4 +4 @@
+-old
++new
+""")
+        file_diff.get_hunks()
+        styles = {"ADD": "add", "MOD": "mod", "DEL": "del", "WORD": "word"}
+        paths = []
+        try:
+            for text in ['one\nx = compute(a)\nthree\nold\n', 'one\nx = compute(b)\nthree\nnew\n']:
+                (fd, path) = tempfile.mkstemp()
+                paths.append(path)
+                with os.fdopen(fd, 'w') as f:
+                    f.write(text)
+            (file_diff.old_file, file_diff.new_file) = paths
+
+            view = FakeView('one\nx = compute(b)\nthree\nnew\n')
+            file_diff.add_new_regions(view, styles)
+            self.assertEqual(view.regions[Constants.MOD_REGION_KEY], [(4, 19), (25, 29)])
+            self.assertEqual(view.regions[Constants.WORD_REGION_KEY], [(16, 17), (25, 28)])
+            self.assertEqual(view.text_point_calls, 0)
+
+            # Lines that are too long to diff are just highlighted by line.
+            file_diff.hunks[0].word_regions = False
+            view = FakeView('one\nx = compute(a)\nthree\nold\n')
+            file_diff.add_old_regions(view, styles)
+            self.assertEqual(view.regions[Constants.WORD_REGION_KEY], [(25, 28)])
+        finally:
+            for path in paths:
+                os.remove(path)
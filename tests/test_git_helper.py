@@ -1,10 +1,18 @@
 import sys
+import io
+import os
+import shutil
 import subprocess
-from unittest import TestCase
+import tempfile
+from unittest import TestCase, skipUnless
 from unittest.mock import patch
 
+from diffview_test_helpers import git_available
+
 diffview = sys.modules["DiffView"]
 GitHelper = diffview.util.vcs.GitHelper
+GitCatFile = diffview.util.vcs.GitCatFile
+VCSContext = diffview.util.vcs.VCSContext
 
 
 class test_GitHelper(TestCase):
@@ -14,7 +22,8 @@ class test_GitHelper(TestCase):
 
     def test_init(self):
         git_helper = GitHelper('/repo/base')
-        self.assertFalse(git_helper.got_changed_files)
+        self.assertEqual(git_helper.repo_base, '/repo/base')
+        self.assertIsNone(git_helper.object_store)
 
     @patch('subprocess.Popen')
     def test_file_versions(self, mocked_Popen):
@@ -41,31 +50,331 @@ class test_GitHelper(TestCase):
         self.assertEquals(
             git_helper.get_file_versions('branch_a...branch_b'),
             ('merge_base_commit', 'branch_b'))
-        mocked_Popen.assert_called_with(
-            'git merge-base branch_a branch_b',
-            stdout=subprocess.PIPE,
-            shell=True,
-            cwd='/repo/base')
+        self.check_popen_args(mocked_Popen, ['merge-base', 'branch_a', 'branch_b'])
 
         self.dummy_process.ret_vals = [(b'merge_base_commit', b'')]
         self.assertEquals(
             git_helper.get_file_versions('branch_a...'),
             ('merge_base_commit', 'HEAD'))
-        mocked_Popen.assert_called_with(
-            'git merge-base branch_a HEAD',
-            stdout=subprocess.PIPE,
-            shell=True,
-            cwd='/repo/base')
+        self.check_popen_args(mocked_Popen, ['merge-base', 'branch_a', 'HEAD'])
 
         self.dummy_process.ret_vals = [(b'merge_base_commit', b'')]
         self.assertEquals(
             git_helper.get_file_versions('...branch_b'),
             ('merge_base_commit', 'branch_b'))
-        mocked_Popen.assert_called_with(
-            'git merge-base HEAD branch_b',
-            stdout=subprocess.PIPE,
-            shell=True,
-            cwd='/repo/base')
+        self.check_popen_args(mocked_Popen, ['merge-base', 'HEAD', 'branch_b'])
+
+    def check_popen_args(self, mocked_Popen, git_args):
+        """Check that Git was run directly with the expected args, and hermetic options."""
+        (args, kwargs) = mocked_Popen.call_args
+        self.assertEqual(args[0], ['git'] + GitHelper.GLOBAL_ARGS + git_args)
+        self.assertFalse(kwargs.get('shell', False))
+        self.assertEqual(kwargs['cwd'], '/repo/base')
+        self.assertEqual(kwargs['stdout'], subprocess.PIPE)
+        self.assertEqual(kwargs['env']['GIT_OPTIONAL_LOCKS'], '0')
+        self.assertNotIn('GIT_EXTERNAL_DIFF', kwargs['env'])
+
+    @patch('subprocess.Popen')
+    def test_get_changed_files(self, mocked_Popen):
+        git_helper = GitHelper('/repo/base')
+        mocked_Popen.return_value = self.dummy_process
+        sha_a = b'a' * 40
+        sha_b = b'b' * 40
+        sha_c = b'c' * 40
+        sha_0 = b'0' * 40
+        self.dummy_process.ret_vals = [(
+            b':100644 100644 ' + sha_a + b' ' + sha_b + b' M\0bin.dat\0' +
+            b':100644 100644 ' + sha_b + b' ' + sha_c + b' M\0f1\0' +
+            b':100644 000000 ' + sha_c + b' ' + sha_0 + b' D\0gone\0' +
+            b':100644 100644 ' + sha_a + b' ' + sha_a + b' R100\0mv_me\0moved \xe2\x98\x83\0' +
+            b'-\t-\tbin.dat\0' +
+            b'2\t1\tf1\0' +
+            b'0\t1\tgone\0' +
+            b'0\t0\t\0mv_me\0moved \xe2\x98\x83\0',
+            b'')]
+        self.dummy_process.stdout = io.BytesIO(
+            b'diff --git a/bin.dat b/bin.dat\n' +
+            b'index 88768ef..3e3315e 100644\n' +
+            b'Binary files a/bin.dat and b/bin.dat differ\n' +
+            b'diff --git a/f1 b/f1\n' +
+            b'index de98044..a7bc997 100644\n' +
+            b'--- a/f1\n' +
+            b'+++ b/f1\n' +
+            b'@@ -2 +2 @@ a\n' +
+            b'-b\n' +
+            b'+B\n' +
+            b'@@ -3,0 +4 @@ c\n' +
+            b'+d\n' +
+            b'diff --git a/gone b/gone\n' +
+            b'deleted file mode 100644\n' +
+            b'index 587be6b..0000000\n' +
+            b'--- a/gone\n' +
+            b'+++ /dev/null\n' +
+            b'@@ -1 +0,0 @@\n' +
+            b'--- a/not_a_header\n' +
+            b'diff --git a/mv_me "b/moved \\342\\230\\203"\n' +
+            b'similarity index 100%\n' +
+            b'rename from mv_me\n' +
+            b'rename to "moved \\342\\230\\203"\n')
+        context = VCSContext()
+        files = git_helper.get_changed_files('HEAD', context=context)
+
+        # Details come from one command, and all file diffs from another.
+        self.assertEqual(mocked_Popen.call_count, 2)
+        self.assertEqual(
+            mocked_Popen.call_args_list[0][0][0],
+            ['git'] + GitHelper.GLOBAL_ARGS +
+            ['diff', '--no-ext-diff', '--no-color', '--no-textconv',
+             '--raw', '--numstat', '-z', '-M', '--no-abbrev', 'HEAD'])
+        self.assertEqual(
+            mocked_Popen.call_args_list[1][0][0],
+            ['git'] + GitHelper.GLOBAL_ARGS +
+            ['diff', '--no-ext-diff', '--no-color', '--no-textconv', '-U0', '-M', '--src-prefix=a/', '--dst-prefix=b/',
+             'HEAD'])
+        self.assertEqual(
+            [f.filename for f in files],
+            ['bin.dat', 'f1', 'gone', 'moved \u2603'])
+        self.assertEqual(files[1].abs_filename, '/repo/base/f1')
+        self.assertEqual(len(files[0].get_hunks()), 0)
+        self.assertEqual(len(files[1].get_hunks()), 2)
+        self.assertEqual(len(files[2].get_hunks()), 1)
+        self.assertEqual(len(files[3].get_hunks()), 0)
+
+        self.assertEqual(
+            [f.binary for f in files],
+            [True, False, False, False])
+        self.assertEqual(
+            [f.content_changed for f in files],
+            [True, True, True, False])
+        self.assertEqual(
+            [f.get_line_counts() for f in files],
+            [None, (2, 1), (0, 1), (0, 0)])
+        self.assertEqual(files[3].old_filename, 'mv_me')
+        self.assertEqual(files[1].old_blob, 'b' * 40)
+        self.assertEqual(files[1].new_blob, 'c' * 40)
+        self.assertIsNone(files[2].new_blob)
+
+        # Only listed once per diff.
+        self.assertEqual(git_helper.get_changed_files('HEAD', context=context), [])
+        self.assertEqual(mocked_Popen.call_count, 2)
+
+        # Files are available before the diff command finishes.
+        self.dummy_process.ret_vals = [(
+            b':100644 100644 ' + sha_a + b' ' + sha_b + b' M\0f1\0' +
+            b':100644 100644 ' + sha_a + b' ' + sha_b + b' M\0f2\0' +
+            b'1\t1\tf1\0' +
+            b'1\t1\tf2\0',
+            b'')]
+        self.dummy_process.stdout = io.BytesIO(
+            b'diff --git a/f1 b/f1\n' +
+            b'--- a/f1\n' +
+            b'+++ b/f1\n' +
+            b'@@ -2 +2 @@ a\n' +
+            b'-b\n' +
+            b'+B\n' +
+            b'diff --git a/f2 b/f2\n' +
+            b'--- a/f2\n' +
+            b'+++ b/f2\n')
+        files = git_helper.iter_changed_files('HEAD')
+        self.assertEqual(next(files).filename, 'f1')
+        self.assertLess(self.dummy_process.stdout.tell(), len(self.dummy_process.stdout.getvalue()))
+
+
+    def test_find_header_file(self):
+        git_helper = GitHelper('/repo/base')
+        files_by_paths = {('a b/c', 'a b/c'): 0, ('old', 'new \u2603'): 1, ('tab\there', 'tab\there'): 2}
+        self.assertEqual(git_helper.find_header_file('diff --git a/a b/c b/a b/c\n', files_by_paths), 0)
+        self.assertEqual(
+            git_helper.find_header_file('diff --git a/old "b/new \\342\\230\\203"\n', files_by_paths), 1)
+        self.assertEqual(git_helper.find_header_file('diff --git "a/tab\\there" "b/tab\\there"\n', files_by_paths), 2)
+        self.assertIsNone(git_helper.find_header_file('diff --git a/other b/other\n', files_by_paths))
+        self.assertIsNone(git_helper.find_header_file('diff --cc a b/c\n', files_by_paths))
+
+    def test_is_in_diff(self):
+        git_helper = GitHelper('/repo/base')
+        self.assertTrue(git_helper.is_in_diff('HEAD', 'a/b.txt'))
+        self.assertTrue(git_helper.is_in_diff('HEAD -- .', 'a/b.txt'))
+        self.assertTrue(git_helper.is_in_diff('-- ./a/', 'a/b.txt'))
+        self.assertFalse(git_helper.is_in_diff('-- a', 'ab.txt'))
+        self.assertTrue(git_helper.is_in_diff('-- c a/b.txt', 'a/b.txt'))
+        self.assertTrue(git_helper.is_in_diff('-- *.txt', 'a/b.txt'))
+        self.assertFalse(git_helper.is_in_diff('-- :(literal)*.txt', 'a/b.txt'))
+        self.assertTrue(git_helper.is_in_diff('-- :(icase)A', 'a/b.txt'))
+        self.assertFalse(git_helper.is_in_diff('-- :!a', 'a/b.txt'))
+        self.assertTrue(git_helper.is_in_diff('-- :/^c', 'a/b.txt'))
+        self.assertFalse(git_helper.is_in_diff('-- . :(exclude,top)*.txt', 'a/b.txt'))
+        # Magic that isn't handled.
+        self.assertFalse(git_helper.is_in_diff('-- :(glob)**/*.txt', 'a/b.txt'))
+
+
+@skipUnless(git_available(), "Git is not installed")
+class test_GitHelper_live(TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.com')
+        self.git('config', 'user.name', 'Test')
+        for filename in ['conflict.txt', 'other.txt', 'typechange', 'zz.txt']:
+            self.write(filename, filename + '\n')
+        self.write('renamed_from.txt', ''.join('line {}\n'.format(i) for i in range(10)))
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', 'Initial')
+        self.git_helper = GitHelper(self.repo)
+
+    def tearDown(self):
+        self.git_helper.close()
+        shutil.rmtree(self.repo)
+
+    def git(self, *args):
+        return subprocess.check_output(('git',) + args, cwd=self.repo, stderr=subprocess.STDOUT)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.repo, filename), 'w') as f:
+            f.write(content)
+
+    def changes(self, diff_args):
+        return [(f.filename, f.unmerged, [(h.old_line_start, h.new_line_start, h.add_lines, h.del_lines)
+                                          for h in f.get_hunks()])
+                for f in self.git_helper.get_changed_files(diff_args)]
+
+    def test_conflicted_file(self):
+        self.git('checkout', '-q', '-b', 'side')
+        self.write('conflict.txt', 'side\n')
+        self.git('commit', '-q', '-a', '-m', 'Side')
+        self.git('checkout', '-q', '-')
+        self.write('conflict.txt', 'main\n')
+        self.git('commit', '-q', '-a', '-m', 'Main')
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.git('merge', '-q', 'side')
+        self.write('other.txt', 'changed\n')
+        self.write('zz.txt', 'changed\n')
+
+        # The conflicted file is listed once, without taking another file's diff.
+        self.assertEqual(self.changes(''), [
+            ('conflict.txt', True, []),
+            ('other.txt', False, [(1, 1, 1, 1)]),
+            ('zz.txt', False, [(1, 1, 1, 1)])])
+        # Against a commit, it's an ordinary change.
+        self.assertEqual([c[:2] for c in self.changes('HEAD')],
+                         [('conflict.txt', False), ('other.txt', False), ('zz.txt', False)])
+
+    def test_typechanged_file(self):
+        os.remove(os.path.join(self.repo, 'typechange'))
+        try:
+            os.symlink('zz.txt', os.path.join(self.repo, 'typechange'))
+        except (OSError, NotImplementedError):
+            self.skipTest("Can't create symlinks")
+        self.write('zz.txt', 'changed\n')
+
+        # Both of the typechanged file's sections are kept together, and the next file gets its own.
+        self.assertEqual(self.changes('HEAD'), [
+            ('typechange', False, [(1, 0, 0, 1), (0, 1, 1, 0)]),
+            ('zz.txt', False, [(1, 1, 1, 1)])])
+
+    def test_renamed_file(self):
+        self.git('mv', 'renamed_from.txt', 'renamed to.txt')
+        with open(os.path.join(self.repo, 'renamed to.txt'), 'a') as f:
+            f.write('added\n')
+        self.write('other.txt', 'changed\n')
+        self.git('add', '-A')
+
+        changes = self.changes('--cached')
+        self.assertEqual(changes, [
+            ('other.txt', False, [(1, 1, 1, 1)]),
+            ('renamed to.txt', False, [(10, 11, 1, 0)])])
+
+
+@skipUnless(git_available(), "Git is not installed")
+class test_GitCatFile(TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        for cmd in [['init', '-q'],
+                    ['config', 'user.email', 'test@example.com'],
+                    ['config', 'user.name', 'Test']]:
+            subprocess.check_call(['git'] + cmd, cwd=self.repo)
+        with open(os.path.join(self.repo, 'file one.txt'), 'wb') as f:
+            f.write(b'line 1\nline 2\n')
+        with open(os.path.join(self.repo, 'empty'), 'wb') as f:
+            pass
+        with open(os.path.join(self.repo, 'crlf.txt'), 'wb') as f:
+            f.write(b'line 1\r\nline 2\r\n' * 100000)
+        subprocess.check_call(['git', 'add', '-A'], cwd=self.repo)
+        subprocess.check_call(['git', 'commit', '-q', '-m', 'Initial'], cwd=self.repo)
+        self.cat_file = GitCatFile(GitHelper(self.repo))
+
+    def tearDown(self):
+        self.cat_file.close()
+        shutil.rmtree(self.repo)
+
+    def test_get_object(self):
+        self.assertEqual(self.cat_file.get_object('HEAD:file one.txt'), b'line 1\nline 2\n')
+        self.assertEqual(self.cat_file.get_object('HEAD:empty'), b'')
+        self.assertIsNone(self.cat_file.get_object('HEAD:not_there'))
+
+    def test_missing_name_with_spaces(self):
+        self.cat_file.get_object('HEAD:empty')
+        process = self.cat_file.process
+        # `<name> missing` has three fields when the name has one space.
+        self.assertIsNone(self.cat_file.get_object('HEAD:not there'))
+        self.assertIsNone(self.cat_file.get_object('HEAD:not blob there'))
+        self.assertEqual(self.cat_file.get_object('HEAD:file one.txt'), b'line 1\nline 2\n')
+        # The process didn't need restarting.
+        self.assertIs(self.cat_file.process, process)
+
+    def test_get_size(self):
+        cat_file_check = GitCatFile(GitHelper(self.repo), check_only=True)
+        try:
+            self.assertEqual(cat_file_check.get_size('HEAD:file one.txt'), 14)
+            self.assertEqual(cat_file_check.get_size('HEAD:empty'), 0)
+            self.assertIsNone(cat_file_check.get_size('HEAD:not_there'))
+        finally:
+            cat_file_check.close()
+
+    def test_per_diff_context(self):
+        (first, second) = (VCSContext(), VCSContext())
+        self.cat_file.get_object('HEAD:empty', first)
+        self.cat_file.get_object('HEAD:file one.txt', second)
+        self.assertEqual(first.perf.counters['git cat-file requests'], 1)
+        self.assertEqual(second.perf.counters['bytes read from VCS'], 14)
+
+        # Cancelling one diff doesn't affect another that shares the process.
+        first.cancel_token.cancel()
+        self.assertEqual(self.cat_file.get_object('HEAD:file one.txt', second), b'line 1\nline 2\n')
+
+    def test_process_reused(self):
+        self.cat_file.get_object('HEAD:empty')
+        process = self.cat_file.process
+        self.cat_file.get_object('HEAD:file one.txt')
+        self.assertIs(self.cat_file.process, process)
+
+    def test_restart_after_close(self):
+        self.cat_file.get_object('HEAD:empty')
+        self.cat_file.close()
+        self.assertIsNone(self.cat_file.process)
+        self.assertEqual(self.cat_file.get_object('HEAD:file one.txt'), b'line 1\nline 2\n')
+
+    def test_write_file_content(self):
+        git_helper = GitHelper(self.repo)
+        path = os.path.join(self.repo, 'written')
+        try:
+            git_helper.write_file_content('crlf.txt', 'HEAD', path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'line 1\nline 2\n' * 100000)
+            git_helper.write_file_content('not_there', 'HEAD', path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'')
+        finally:
+            git_helper.close()
+
+    def test_get_file_content(self):
+        git_helper = GitHelper(self.repo)
+        try:
+            self.assertEqual(git_helper.get_file_content('file one.txt', 'HEAD'), 'line 1\nline 2\n')
+            self.assertEqual(git_helper.get_file_content('not_there', 'HEAD'), '')
+        finally:
+            git_helper.close()
 
 
 class DummyProcess(object):
@@ -75,3 +384,9 @@ class DummyProcess(object):
     """
     def communicate(self, *args, **kwargs):
         return self.ret_vals.pop(0)
+
+    def poll(self):
+        return 0
+
+    def wait(self, *args, **kwargs):
+        return 0
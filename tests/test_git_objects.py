@@ -0,0 +1,149 @@
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase, skipUnless
+
+from diffview_test_helpers import git_available
+
+diffview = sys.modules["DiffView"]
+GitObjectStore = diffview.util.git_objects.GitObjectStore
+PathNotFoundError = diffview.util.git_objects.PathNotFoundError
+UnsupportedRepoError = diffview.util.git_objects.UnsupportedRepoError
+LRUCache = diffview.util.git_objects.LRUCache
+apply_delta = diffview.util.git_objects.apply_delta
+GitHelper = diffview.util.vcs.GitHelper
+VCSContext = diffview.util.vcs.VCSContext
+
+
+class test_apply_delta(TestCase):
+
+    def test_copy_and_insert(self):
+        base = b'0123456789'
+        # Sizes 10 -> 7, copy 4 bytes from offset 2, insert `abc`.
+        delta = bytes([10, 7, 0x80 | 0x01 | 0x10, 2, 4, 3]) + b'abc'
+        self.assertEqual(apply_delta(base, delta), b'2345abc')
+
+    def test_bad_base_size(self):
+        with self.assertRaises(ValueError):
+            apply_delta(b'short', bytes([10, 0]))
+
+
+class test_LRUCache(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(10)
+        cache.put('a', 'A', 4)
+        cache.put('b', 'B', 4)
+        self.assertEqual(cache.get('a'), 'A')
+        cache.put('c', 'C', 4)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(cache.get('c'), 'C')
+
+        # Too big to cache at all.
+        cache.put('d', 'D', 11)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.size, 8)
+
+
+@skipUnless(git_available(), "Git is not installed")
+class test_GitObjectStore(TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.com')
+        self.git('config', 'user.name', 'Test')
+        os.makedirs(os.path.join(self.repo, 'dir', 'sub'))
+
+        # Several versions of similar files, so packing them produces deltas.
+        for version in range(5):
+            for i in range(10):
+                self.write('dir/sub/file{}.txt'.format(i), ''.join(
+                    'file {} line {} version {}\n'.format(i, line, version if line % 10 == 0 else 0)
+                    for line in range(200)))
+            self.write('top.txt', 'version {}\r\n'.format(version))
+            self.git('add', '-A')
+            self.git('commit', '-q', '-m', 'Version {}'.format(version))
+            if version == 1:
+                self.git('tag', '-a', 'annotated', '-m', 'Tag')
+        self.git('tag', 'light', 'HEAD~2')
+        self.git('gc', '-q', '--aggressive')
+
+        # Something loose on top of the pack.
+        self.write('top.txt', 'loose\n')
+        self.git('commit', '-q', '-a', '-m', 'Loose')
+        self.store = GitObjectStore(os.path.join(self.repo, '.git'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.repo)
+
+    def git(self, *args):
+        return subprocess.check_output(('git',) + args, cwd=self.repo)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.repo, filename), 'wb') as f:
+            f.write(content.encode('utf-8'))
+
+    def test_read_blob_matches_git(self):
+        files = self.git('ls-tree', '-r', '--name-only', 'HEAD').decode('utf-8').split()
+        sha = self.git('rev-parse', 'HEAD~3').decode('utf-8').strip()
+        branch = self.git('symbolic-ref', '--short', 'HEAD').decode('utf-8').strip()
+        for rev in ['HEAD', branch, 'refs/heads/' + branch, 'annotated', 'light', sha]:
+            for filename in files:
+                expected = self.git('cat-file', 'blob', '{}:{}'.format(rev, filename))
+                self.assertEqual(self.store.read_blob(rev, filename), expected, (rev, filename))
+
+                blob = self.git('rev-parse', '{}:{}'.format(rev, filename)).decode('utf-8').strip()
+                self.assertEqual(self.store.get_size(blob), len(expected), (rev, filename))
+                self.assertEqual(self.store.get_blob(blob), expected, (rev, filename))
+
+    def test_unsupported_revs(self):
+        # Revision expressions and abbreviated SHAs are left to Git.
+        short_sha = self.git('rev-parse', '--short', 'HEAD').decode('utf-8').strip()
+        for rev in ['HEAD~1', 'HEAD^', 'HEAD@{1}', short_sha, 'no_such_branch']:
+            self.assertIsNone(self.store.read_blob(rev, 'top.txt'), rev)
+
+    def test_missing_path(self):
+        with self.assertRaises(PathNotFoundError):
+            self.store.read_blob('HEAD', 'not_there')
+        with self.assertRaises(PathNotFoundError):
+            self.store.read_blob('HEAD', 'top.txt/not_a_dir')
+        # Directories aren't files.
+        self.assertIsNone(self.store.read_blob('HEAD', 'dir/sub'))
+
+    def test_new_pack_found(self):
+        self.assertEqual(self.store.read_blob('HEAD', 'top.txt'), b'loose\n')
+        self.write('top.txt', 'repacked\n')
+        self.git('commit', '-q', '-a', '-m', 'Repacked')
+        self.git('repack', '-q', '-a', '-d')
+        self.git('prune-packed')
+        self.assertEqual(self.store.read_blob('HEAD', 'top.txt'), b'repacked\n')
+
+    def test_unsupported_repo(self):
+        self.git('config', 'extensions.objectFormat', 'sha256')
+        with self.assertRaises(UnsupportedRepoError):
+            GitObjectStore(os.path.join(self.repo, '.git'))
+
+    def test_git_helper(self):
+        git_helper = GitHelper(self.repo)
+        try:
+            # `HEAD~4` needs Git to resolve it, but the contents are still read in-process.
+            self.assertEqual(git_helper.read_blob('top.txt', 'HEAD~4'), b'version 1\r\n')
+            self.assertEqual(git_helper.get_file_content('top.txt', 'HEAD~4'), 'version 1\r\n')
+            self.assertEqual(git_helper.read_blob('not_there', 'HEAD'), b'')
+            self.assertIsNone(git_helper.read_blob('top.txt', 'HEAD~100'))
+
+            path = os.path.join(self.repo, 'written')
+            git_helper.write_file_content('top.txt', 'HEAD~4', path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'version 1\n')
+
+            context = VCSContext(in_process=False)
+            self.assertIsNone(git_helper.read_blob('top.txt', 'HEAD', context))
+            self.assertEqual(git_helper.get_file_content('top.txt', 'HEAD~4', context), 'version 1\r\n')
+        finally:
+            git_helper.close()
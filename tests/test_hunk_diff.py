@@ -1,3 +1,4 @@
+import json
 import sys
 from unittest import TestCase
 
@@ -191,6 +192,50 @@ class test_DiffRegion(TestCase):
              'some_function():',
              '5 | +++--'])
 
+    def test_regions_parsed_lazily(self):
+        # With context, the body is only parsed when the regions are needed.
+        match = ['10', '3', '10', '3', 'f():\n a\n-b\n+c\n d']
+        h = HunkDiff(self.file_diff, match)
+        self.assertEqual((h.old_line_focus, h.new_line_focus), (11, 11))
+        self.assertIsNone(h._old_regions)
+        self.check_region(h.old_regions[0], 'DEL', 11, 0, 12, 0)
+        self.check_region(h.new_regions[0], 'ADD', 11, 0, 12, 0)
+        self.assertIsNone(h._body)
+
+        # Without context, the regions follow from the header.
+        match = ['10', '2', '10', '1', 'f():\r\n-a\r\n-b\r\n+c\r\n']
+        h = HunkDiff(self.file_diff, match)
+        self.assertEqual(h.context, 'f():')
+        self.assertIsNone(h._body)
+        self.check_region(h.old_regions[0], 'DEL', 10, 0, 12, 0)
+        self.check_region(h.new_regions[0], 'ADD', 10, 0, 11, 0)
+
+    def test_large_hunk_description(self):
+        match = ['1', '100', '1', '300', 'big():\n' + '-old\n' * 100 + '+new\n' * 300]
+        h = HunkDiff(self.file_diff, match)
+        # Scaled to fit, like `diffstat`.
+        self.assertEqual(h.description[2], '400 | ' + '+' * 37 + '-' * 12)
+
+        match = ['1', '1', '1', '1000', 'big():\n' + '-old\n' + '+new\n' * 1000]
+        h = HunkDiff(self.file_diff, match)
+        # Always at least one of each.
+        self.assertEqual(h.description[2], '1001 | ' + '+' * 47 + '-')
+
+    def test_cache_round_trip(self):
+        match = ['116', '8', '119', '9', 'f():\n a\n-b\n+c\n+d\n e\n-f\n g']
+        h = HunkDiff(self.file_diff, match)
+        data = json.loads(json.dumps(h.to_cache()))
+        cached = HunkDiff.from_cache(self.file_diff, data)
+        self.assertEqual(cached.hunk_type, 'MOD')
+        self.assertEqual((cached.old_line_focus, cached.new_line_focus), (117, 120))
+        self.assertEqual(cached.description, h.description)
+        self.assertEqual(cached.oneline_description, h.oneline_description)
+        self.assertEqual(len(cached.old_regions), 2)
+        self.check_region(cached.old_regions[0], 'DEL', 117, 0, 118, 0)
+        self.check_region(cached.old_regions[1], 'DEL', 119, 0, 120, 0)
+        self.assertEqual(len(cached.new_regions), 1)
+        self.check_region(cached.new_regions[0], 'ADD', 120, 0, 122, 0)
+
     def check_region(self, r, diff_type,
                      start_line, start_col,
                      end_line, end_col):
@@ -0,0 +1,47 @@
+import sys
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+diffview = sys.modules["DiffView"]
+LineIndex = diffview.parser.line_index.LineIndex
+read_text = diffview.parser.line_index.read_text
+
+
+class test_LineIndex(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, content):
+        path = os.path.join(self.dir, 'file')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return read_text(path)
+
+    def test_text_point(self):
+        index = LineIndex('ab\n\ncdé\nf')
+        self.assertEqual(index.size, 9)
+        self.assertEqual([index.text_point(row, 0) for row in range(4)], [0, 3, 4, 8])
+        self.assertEqual(index.text_point(2, 2), 6)
+        # Out of range positions are limited to the text.
+        self.assertEqual(index.text_point(4, 0), 9)
+        self.assertEqual(index.text_point(3, 5), 9)
+        self.assertEqual(index.text_point(-1, 0), 0)
+
+    def test_read_text(self):
+        # Positions count characters, with line endings as a view holds them.
+        text = self.read('\ufeffé\r\nb\r\n'.encode('utf-8'))
+        self.assertEqual(text, 'é\nb\n')
+        index = LineIndex(text)
+        self.assertEqual(index.size, 4)
+        self.assertEqual([index.text_point(row, 0) for row in range(3)], [0, 2, 4])
+
+        # Things a view might hold differently.
+        self.assertIsNone(self.read('a\rb\r\nc'.encode('utf-8')))
+        self.assertIsNone(self.read('é'.encode('latin-1')))
+        self.assertIsNone(read_text(os.path.join(self.dir, 'missing')))
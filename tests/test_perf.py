@@ -0,0 +1,50 @@
+import sys
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+diffview = sys.modules["DiffView"]
+PerfRun = diffview.util.perf.PerfRun
+
+
+class test_PerfRun(TestCase):
+
+    def test_spans_and_counters(self):
+        run = PerfRun()
+        with run.span('fetch'):
+            pass
+        with run.span('fetch'):
+            pass
+        run.count('VCS processes')
+        run.count('bytes read from VCS', 100)
+        run.count('bytes read from VCS', 23)
+        self.assertEqual(run.spans['fetch'][1], 2)
+        self.assertEqual(run.counters, {'VCS processes': 1, 'bytes read from VCS': 123})
+        self.assertEqual(list(run.timed('diff', iter([1, 2]))), [1, 2])
+        self.assertEqual(run.spans['diff'][1], 3)
+
+        report = run.report()
+        self.assertEqual(len(report), 5)
+        self.assertIn('bytes read from VCS', report[4])
+        self.assertIn('123', report[4])
+
+    def test_history(self):
+        PerfRun()
+        first = PerfRun('first')
+        second = PerfRun('second')
+        self.assertEqual(list(PerfRun.history)[-2:], [first, second])
+        report = PerfRun.history_report()
+        self.assertLess(report.index('second'), report.index('first'))
+
+    def test_profile(self):
+        profile_dir = tempfile.mkdtemp()
+        try:
+            run = PerfRun()
+            path = os.path.join(profile_dir, 'profiles', 'diff.prof')
+            with run.profile(path):
+                sum(range(100))
+            self.assertTrue(os.path.exists(path))
+            self.assertIn('  Profile: ' + path, run.report())
+        finally:
+            shutil.rmtree(profile_dir)
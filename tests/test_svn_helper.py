@@ -1,5 +1,8 @@
 import sys
+import io
+import subprocess
 from unittest import TestCase
+from unittest.mock import patch
 
 diffview = sys.modules["DiffView"]
 SVNHelper = diffview.util.vcs.SVNHelper
@@ -9,7 +12,7 @@ class test_SVNHelper(TestCase):
 
     def test_init(self):
         svn_helper = SVNHelper('/repo/base')
-        self.assertFalse(svn_helper.got_changed_files)
+        self.assertEqual(svn_helper.repo_base, '/repo/base')
 
     def test_file_versions(self):
         svn_helper = SVNHelper('/repo/base')
@@ -37,3 +40,52 @@ class test_SVNHelper(TestCase):
         self.assertEquals(
             svn_helper.get_file_versions('--cl issue1234'),
             ('-r HEAD', ''))
+
+    @patch('subprocess.Popen')
+    def test_get_file_content(self, mocked_Popen):
+        svn_helper = SVNHelper('/repo/base')
+        mocked_Popen.return_value.communicate.return_value = (b'content', b'')
+        self.assertEqual(svn_helper.get_file_content('dir/some file', '-r 123'), 'content')
+        (args, kwargs) = mocked_Popen.call_args
+        self.assertEqual(args[0], ['svn', '--non-interactive', 'cat', '-r', '123', 'dir/some file'])
+        self.assertFalse(kwargs.get('shell', False))
+        self.assertEqual(kwargs['stdout'], subprocess.PIPE)
+
+    @patch('subprocess.Popen')
+    def test_get_changed_files(self, mocked_Popen):
+        svn_helper = SVNHelper('/repo/base')
+        mocked_Popen.return_value.stdout = io.BytesIO(
+            b'Index: dir\n' +
+            b'===================================================================\n' +
+            b'--- dir\t(revision 1)\n' +
+            b'+++ dir\t(working copy)\n' +
+            b'\n' +
+            b'Property changes on: dir\n' +
+            b'___________________________________________________________________\n' +
+            b'Added: svn:ignore\n' +
+            b'## -0,0 +1 ##\n' +
+            b'+ignored\n' +
+            b'Index: dir/some file.txt\n' +
+            b'===================================================================\n' +
+            b'--- dir/some file.txt\t(revision 1)\n' +
+            b'+++ dir/some file.txt\t(working copy)\n' +
+            b'@@ -1,2 +1,2 @@\n' +
+            b' unchanged\n' +
+            b'-old\n' +
+            b'+new\n' +
+            b'Index: image.png\n' +
+            b'===================================================================\n' +
+            b'Cannot display: file marked as a binary type.\n' +
+            b'svn:mime-type = application/octet-stream\n')
+        mocked_Popen.return_value.poll.return_value = 0
+        files = svn_helper.get_changed_files('-r 123')
+
+        # All files come from a single diff command, with no filesystem checks.
+        self.assertEqual(mocked_Popen.call_count, 1)
+        self.assertEqual(
+            mocked_Popen.call_args[0][0],
+            ['svn', '--non-interactive', 'diff', '--internal-diff', '-r', '123:HEAD'])
+        self.assertEqual([f.filename for f in files], ['dir/some file.txt', 'image.png'])
+        self.assertEqual(files[0].abs_filename, '/repo/base/dir/some file.txt')
+        self.assertEqual(len(files[0].get_hunks()), 1)
+        self.assertEqual(len(files[1].get_hunks()), 0)
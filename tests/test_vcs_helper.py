@@ -1,4 +1,10 @@
 import sys
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
 from unittest import TestCase
 from unittest.mock import patch
 
@@ -6,53 +12,161 @@ diffview = sys.modules["DiffView"]
 VCSHelper = diffview.util.vcs.VCSHelper
 GitHelper = diffview.util.vcs.GitHelper
 SVNHelper = diffview.util.vcs.SVNHelper
+BzrHelper = diffview.util.vcs.BzrHelper
+CRLFConverter = diffview.util.vcs.CRLFConverter
+VCSTimeoutError = diffview.util.vcs.VCSTimeoutError
+VCSContext = diffview.util.vcs.VCSContext
+CancelToken = diffview.util.cancel.CancelToken
+DiffCancelled = diffview.util.cancel.DiffCancelled
 
 
 class test_VCSHelper(TestCase):
 
     def setUp(self):
-        self.dummy_process = DummyProcess()
+        self.base = tempfile.mkdtemp()
+        VCSHelper._helpers = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+        VCSHelper._helpers = {}
+
+    def make_dirs(self, *parts):
+        path = os.path.join(self.base, *parts)
+        os.makedirs(path)
+        return path
 
     @patch('subprocess.Popen')
     def test_get_helper_no_vcs(self, mocked_Popen):
-        mocked_Popen.return_value = self.dummy_process
-        # Errors for both Git and SVN commands
-        self.dummy_process.ret_vals = [
-            (b'output ignored', b'error in Git command'),
-            (b'output ignored', b'error in SVN command')
-        ]
-        with self.assertRaises(diffview.util.vcs.NoVCSError):
-            VCSHelper.get_helper('.')
+        cwd = self.make_dirs('not', 'a', 'repo')
+        with patch.object(VCSHelper, 'find_repo', side_effect=diffview.util.vcs.NoVCSError):
+            with self.assertRaises(diffview.util.vcs.NoVCSError):
+                VCSHelper.get_helper(cwd)
+        self.assertFalse(mocked_Popen.called)
 
     @patch('subprocess.Popen')
     def test_get_helper_git(self, mocked_Popen):
-        mocked_Popen.return_value = self.dummy_process
-        # No error in Git command
-        self.dummy_process.ret_vals = [
-            (b'/some/magic/dir', b''),
-            (b'output ignored', b'error in SVN command')
-        ]
-        helper = VCSHelper.get_helper('.')
+        self.make_dirs('repo', '.git')
+        cwd = self.make_dirs('repo', 'some', 'dir')
+        helper = VCSHelper.get_helper(cwd)
         self.assertIsInstance(helper, GitHelper)
-        self.assertEquals(helper.repo_base, '/some/magic/dir')
+        self.assertEqual(helper.repo_base, os.path.join(self.base, 'repo'))
+        self.assertFalse(mocked_Popen.called)
+
+    @patch('subprocess.Popen')
+    def test_get_helper_git_worktree(self, mocked_Popen):
+        git_dir = self.make_dirs('main', '.git', 'worktrees', 'wt')
+        worktree = self.make_dirs('wt')
+        with open(os.path.join(worktree, '.git'), 'w') as f:
+            f.write('gitdir: {}\n'.format(git_dir))
+        helper = VCSHelper.get_helper(worktree)
+        self.assertIsInstance(helper, GitHelper)
+        self.assertEqual(helper.repo_base, worktree)
+        self.assertEqual(diffview.util.vcs.read_gitfile(os.path.join(worktree, '.git')), git_dir)
+
+    @patch('subprocess.Popen')
+    def test_get_helper_invalid_gitfile(self, mocked_Popen):
+        self.make_dirs('repo', '.bzr')
+        sub_dir = self.make_dirs('repo', 'sub')
+        with open(os.path.join(sub_dir, '.git'), 'w') as f:
+            f.write('not a gitfile\n')
+        helper = VCSHelper.get_helper(sub_dir)
+        self.assertIsInstance(helper, BzrHelper)
+        self.assertEqual(helper.repo_base, os.path.join(self.base, 'repo'))
 
     @patch('subprocess.Popen')
     def test_get_helper_svn(self, mocked_Popen):
-        mocked_Popen.return_value = self.dummy_process
-        # Error in Git command, SVN command OK
-        self.dummy_process.ret_vals = [
-            (b'/some/magic/dir', b'...but I failed...'),
-            (b'some\nthings\nThen a Root Path: /dir/to/svn  \nThen more', b'')
-        ]
-        helper = VCSHelper.get_helper('.')
+        # Old-style working copy, with `.svn` in every directory.
+        self.make_dirs('wc', '.svn')
+        self.make_dirs('wc', 'dir', '.svn')
+        cwd = self.make_dirs('wc', 'dir', 'subdir', '.svn')
+        helper = VCSHelper.get_helper(os.path.dirname(cwd))
         self.assertIsInstance(helper, SVNHelper)
-        self.assertEquals(helper.repo_base, '/dir/to/svn')
+        self.assertEqual(helper.repo_base, os.path.join(self.base, 'wc'))
+        self.assertFalse(mocked_Popen.called)
+
+    @patch('subprocess.Popen')
+    def test_get_helper_nearest_wins(self, mocked_Popen):
+        self.make_dirs('outer', '.svn')
+        self.make_dirs('outer', 'inner', '.git')
+        helper = VCSHelper.get_helper(os.path.join(self.base, 'outer', 'inner'))
+        self.assertIsInstance(helper, GitHelper)
+        self.assertEqual(helper.repo_base, os.path.join(self.base, 'outer', 'inner'))
+
+    @patch('subprocess.Popen')
+    def test_get_helper_cached(self, mocked_Popen):
+        self.make_dirs('repo', '.git')
+        cwd_a = self.make_dirs('repo', 'a')
+        cwd_b = self.make_dirs('repo', 'b')
+        helper = VCSHelper.get_helper(cwd_a)
+
+        with patch.object(VCSHelper, 'find_repo') as mocked_find_repo:
+            # Same directory - no need to look for the repo again.
+            self.assertIs(VCSHelper.get_helper(cwd_a), helper)
+            self.assertFalse(mocked_find_repo.called)
+
+        # Another directory in the same repo shares the helper.
+        self.assertIs(VCSHelper.get_helper(cwd_b), helper)
+
+        # The cache is invalidated if the repo disappears.
+        os.rmdir(os.path.join(self.base, 'repo', '.git'))
+        self.make_dirs('repo', '.bzr')
+        self.assertIsInstance(VCSHelper.get_helper(cwd_a), BzrHelper)
+        self.assertFalse(mocked_Popen.called)
+
+
+class test_CRLFConverter(TestCase):
+
+    def convert(self, chunks):
+        f = io.BytesIO()
+        converter = CRLFConverter(f)
+        for chunk in chunks:
+            converter.write(chunk)
+        converter.close()
+        return f.getvalue()
+
+    def test_single_chunk(self):
+        self.assertEqual(self.convert([b'a\r\nb\nc\r\n']), b'a\nb\nc\n')
+        self.assertEqual(self.convert([b'lone\rcr\r']), b'lone\rcr\r')
+
+    def test_crlf_split_across_chunks(self):
+        self.assertEqual(self.convert([b'a\r', b'\nb\r', b'', b'\n']), b'a\nb\n')
+        self.assertEqual(self.convert([b'a\r', b'b\r', b'\r', b'\n']), b'a\rb\r\n')
+        self.assertEqual(self.convert([b'a\r']), b'a\r')
+
+
+class SleepyHelper(VCSHelper):
+    """Helper whose "VCS" is Python, so commands can be made to hang."""
+
+    SLEEP_ARGS = ['-c', 'import sys, time; sys.stdout.write("start\\n"); sys.stdout.flush(); time.sleep(30)']
+
+    def __init__(self):
+        self.repo_base = os.getcwd()
+        self.vcs = sys.executable
+
+
+class test_VCSHelper_cancel(TestCase):
 
+    def test_vcs_command_timeout(self):
+        helper = SleepyHelper()
+        start = time.time()
+        with self.assertRaises(VCSTimeoutError):
+            helper.vcs_command(SleepyHelper.SLEEP_ARGS, VCSContext(timeout=0.2))
+        self.assertLess(time.time() - start, 5)
 
-class DummyProcess(object):
-    """Dummy process to return values from `communicate()`.
+    def test_vcs_command_cancelled(self):
+        helper = SleepyHelper()
+        cancel_token = CancelToken()
+        threading.Timer(0.2, cancel_token.cancel).start()
+        start = time.time()
+        with self.assertRaises(DiffCancelled):
+            helper.vcs_command(SleepyHelper.SLEEP_ARGS, VCSContext(cancel_token=cancel_token))
+        self.assertLess(time.time() - start, 5)
 
-    Set `ret_vals` to use.
-    """
-    def communicate(self, *args, **kwargs):
-        return self.ret_vals.pop(0)
+    def test_vcs_command_lines_cancelled(self):
+        helper = SleepyHelper()
+        cancel_token = CancelToken()
+        lines = helper.vcs_command_lines(SleepyHelper.SLEEP_ARGS, VCSContext(cancel_token=cancel_token))
+        self.assertEqual(next(lines), 'start\n')
+        cancel_token.cancel()
+        with self.assertRaises(DiffCancelled):
+            next(lines)
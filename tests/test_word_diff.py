@@ -0,0 +1,28 @@
+import sys
+from unittest import TestCase
+
+diffview = sys.modules["DiffView"]
+WordDiff = diffview.parser.word_diff.WordDiff
+
+
+class test_WordDiff(TestCase):
+
+    def regions(self, regions):
+        return [(r.diff_type, r.start_line, r.start_col, r.end_line, r.end_col) for r in regions]
+
+    def test_changed_words(self):
+        (old, new) = WordDiff(
+            [(10, 'x = compute(a, b)'), (11, 'return x')],
+            [(10, 'y = compute(a, c)'), (11, 'return x')]).get_regions()
+        self.assertEqual(self.regions(old), [('MOD', 10, 0, 10, 1), ('MOD', 10, 15, 10, 16)])
+        self.assertEqual(self.regions(new), [('MOD', 10, 0, 10, 1), ('MOD', 10, 15, 10, 16)])
+
+    def test_changes_split_by_line(self):
+        (old, new) = WordDiff([(3, 'one'), (4, 'two')], [(5, 'three four')]).get_regions()
+        self.assertEqual(self.regions(old), [('MOD', 3, 0, 3, 3), ('MOD', 4, 0, 4, 3)])
+        self.assertEqual(self.regions(new), [('MOD', 5, 0, 5, 10)])
+
+    def test_over_budget(self):
+        lines = [(1, ' '.join(['word'] * 100))]
+        self.assertIsNone(WordDiff(lines, lines, max_cost=1000).get_regions())
+        self.assertIsNotNone(WordDiff(lines, lines).get_regions())
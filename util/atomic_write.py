@@ -0,0 +1,37 @@
+import os
+import stat
+import tempfile
+
+
+def write_atomically(path, write_fn):
+    """Write a file by writing a temporary file in the same directory, then moving it into place.
+
+    Anything reading the file (e.g. another diff, maybe in another instance of Sublime Text) never sees it partly
+    written - just the old file or the new one.
+
+    Args:
+        path: The path of the file.  Its directory must exist.
+        write_fn: Function that writes the contents, given a path to write them to.
+    """
+    (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        write_fn(temp_path)
+        os.replace(temp_path, path)
+    except Exception:
+        remove_file(temp_path)
+        raise
+
+
+def remove_file(path):
+    """Remove a file, if it's there.
+
+    Args:
+        path: The path of the file.
+    """
+    try:
+        # Read-only files can't be removed on Windows.
+        os.chmod(path, stat.S_IWUSR | stat.S_IRUSR)
+        os.remove(path)
+    except OSError:
+        pass
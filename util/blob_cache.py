@@ -0,0 +1,164 @@
+import os
+import stat
+import time
+import shutil
+import tempfile
+import threading
+
+from .atomic_write import write_atomically, remove_file
+
+
+class BlobCache(object):
+    """On-disk cache of file contents at specific versions, shared between diffs.
+
+    Contents are stored under a key that uniquely identifies them (e.g. a Git blob ID), so a repeated diff against the
+    same version doesn't need to get the contents from the VCS again.  Each entry keeps the file's name, so views of it
+    get the right syntax.
+
+    Contents that can't be cached go in a per-diff session directory instead.  Session directories that haven't been
+    used for a while (see `touch_session`) are assumed to be abandoned, and are removed.
+    """
+
+    DEFAULT_MAX_SIZE = 200 * 1024 * 1024
+    SESSION_MAX_AGE = 24 * 60 * 60
+
+    # Total size of the contents in each blob dir, so `evict` only needs to look through them once it's over the
+    # maximum.  Counted the first time each dir is evicted from, then kept up to date as contents are stored.
+    _sizes = {}
+    _sizes_lock = threading.Lock()
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE, debug=False):
+        """Constructor.
+
+        Args:
+            cache_dir: The directory to keep the cache in.
+            max_size: The total size, in bytes, that cached contents are trimmed to by `evict`.
+        """
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.sessions_dir = os.path.join(cache_dir, 'sessions')
+        self.max_size = max_size
+        self.debug = debug
+
+    def get(self, key, filename):
+        """Get the cached contents of a file.
+
+        Args:
+            key: The key for the contents.
+            filename: The name of the file.
+
+        Returns:
+            The path of the cached file, or `None` if it isn't cached.
+        """
+        path = self._path(key, filename)
+        try:
+            # Mark the entry as recently used.
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def store(self, key, filename, write_fn):
+        """Add a file's contents to the cache.
+
+        Args:
+            key: The key for the contents.
+            filename: The name of the file.
+            write_fn: Function that writes the contents, given a path to write them to.
+
+        Returns:
+            The path of the cached file.
+        """
+        path = self._path(key, filename)
+        entry_dir = os.path.dirname(path)
+        if not os.path.exists(entry_dir):
+            os.makedirs(entry_dir)
+
+        def write(temp_path):
+            write_fn(temp_path)
+            # Contents for a key never change, so stop them being edited by accident.
+            os.chmod(temp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        write_atomically(path, write)
+
+        with BlobCache._sizes_lock:
+            if self.blob_dir in BlobCache._sizes:
+                try:
+                    BlobCache._sizes[self.blob_dir] += os.path.getsize(path)
+                except OSError:
+                    pass
+        return path
+
+    def evict(self):
+        """Remove the least recently used contents until the cache is within its maximum size."""
+        with BlobCache._sizes_lock:
+            total_size = BlobCache._sizes.get(self.blob_dir)
+            if total_size is not None and total_size <= self.max_size:
+                return
+            # Other instances of Sublime Text may have changed the cache too, so count the contents again.
+            BlobCache._sizes[self.blob_dir] = self._evict()
+
+    def _evict(self):
+        """Look through the contents, removing the least recently used, and return their total size afterwards."""
+        entries = []
+        total_size = 0
+        for (dirpath, _, filenames) in os.walk(self.blob_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total_size += st.st_size
+
+        entries.sort()
+        for (_, size, path) in entries:
+            if total_size <= self.max_size:
+                break
+            if self.debug:
+                print("** Evicting {} from the DiffView cache".format(path))
+            remove_file(path)
+            total_size -= size
+
+            # Tidy up the entry's directory, and its parent if that's now empty too.
+            entry_dir = os.path.dirname(path)
+            for empty_dir in [entry_dir, os.path.dirname(entry_dir)]:
+                try:
+                    os.rmdir(empty_dir)
+                except OSError:
+                    break
+        return total_size
+
+    def new_session_dir(self):
+        """Create a directory for contents that can't be cached, and clear out any abandoned ones.
+
+        Returns:
+            The path of the new directory.
+        """
+        if os.path.isdir(self.sessions_dir):
+            cutoff = time.time() - self.SESSION_MAX_AGE
+            for name in os.listdir(self.sessions_dir):
+                path = os.path.join(self.sessions_dir, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        if self.debug:
+                            print("** Removing abandoned DiffView session {}".format(path))
+                        shutil.rmtree(path, ignore_errors=True)
+                except OSError:
+                    pass
+        else:
+            os.makedirs(self.sessions_dir)
+        return tempfile.mkdtemp(dir=self.sessions_dir)
+
+    def touch_session(self, session_dir):
+        """Mark a session directory as in use, so it isn't taken to be abandoned while its diff is open.
+
+        Args:
+            session_dir: The directory, as returned by `new_session_dir`.
+        """
+        try:
+            os.utime(session_dir, None)
+        except OSError:
+            pass
+
+    def _path(self, key, filename):
+        return os.path.join(self.blob_dir, key[:2], key[2:], os.path.basename(filename))
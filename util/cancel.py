@@ -0,0 +1,73 @@
+import threading
+
+
+class DiffCancelled(Exception):
+    """Exception raised when a diff is cancelled while it's running."""
+    pass
+
+
+class CancelToken(object):
+    """Lets a running diff be cancelled from another thread.
+
+    Each diff has its own token.  VCS processes register with the token while they run, so cancelling it kills them
+    straight away rather than waiting for them to finish; the diff's own work checks the token between steps.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.cancelled = False
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        """Cancel the diff, killing any processes that are running for it."""
+        with self.lock:
+            self.cancelled = True
+            processes = list(self.processes)
+            self.processes.clear()
+        for process in processes:
+            kill_process(process)
+
+    def check(self):
+        """Stop the diff if it's been cancelled.
+
+        Raises:
+            `DiffCancelled` if the token has been cancelled.
+        """
+        if self.cancelled:
+            raise DiffCancelled
+
+    def register(self, process):
+        """Kill a process if the token is cancelled while it's running.
+
+        Args:
+            process: The `subprocess.Popen` object.  It's killed immediately if the token is already cancelled.
+        """
+        with self.lock:
+            if not self.cancelled:
+                self.processes.add(process)
+                return
+        kill_process(process)
+
+    def unregister(self, process):
+        """Stop watching a process, e.g. because it's finished.
+
+        Args:
+            process: The `subprocess.Popen` object.
+        """
+        with self.lock:
+            self.processes.discard(process)
+
+
+def kill_process(process):
+    """Kill a process, if it's still running.
+
+    Args:
+        process: The `subprocess.Popen` object.
+    """
+    try:
+        if process.poll() is None:
+            process.kill()
+    except OSError:
+        # Already exited.
+        pass
@@ -17,6 +17,9 @@ class Constants(object):
                         sublime.HIDE_ON_MINIMAP |
                         sublime.DRAW_EMPTY_AS_OVERWRITE |
                         sublime.DRAW_NO_FILL)
+    # Changed words within modified lines are filled in, to stand out from the outlined lines.
+    WORD_REGION_KEY = 'diffview-highlight-word'
+    WORD_REGION_FLAGS = sublime.HIDE_ON_MINIMAP
 
     SELECTED_CHANGE_KEY = 'diffview-selected-change'
     SELECTED_CHANGE_FLAGS = (sublime.DRAW_EMPTY |
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import zlib
+
+from .atomic_write import write_atomically, remove_file
+
+
+class DiffCache(object):
+    """On-disk cache of parsed diffs, so repeating a diff (e.g. after a restart) doesn't need to run it again.
+
+    Each entry holds a diff's changed files and hunks, as compressed JSON.  Entries are stored under a key from the VCS
+    helper, which includes the commits that the diff's versions resolved to, so an entry is never used once a branch has
+    moved on.  Diffs against the working copy also store the state of the working copy files, and are only used while
+    it's unchanged.
+    """
+
+    # Changes to the format of entries must change this, so old entries aren't used.
+    FORMAT_VERSION = 2
+    DEFAULT_MAX_ENTRIES = 50
+
+    def __init__(self, cache_dir, max_entries=DEFAULT_MAX_ENTRIES, debug=False):
+        """Constructor.
+
+        Args:
+            cache_dir: The directory to keep the cache in.
+            max_entries: [optional] The number of diffs to keep - the least recently used are removed.
+        """
+        self.diff_dir = os.path.join(cache_dir, 'diffs')
+        self.max_entries = max_entries
+        self.debug = debug
+
+    def get(self, key, state=None):
+        """Get a cached diff.
+
+        Args:
+            key: The key for the diff - a JSON-serializable value.
+            state: [optional] The current state of the diff's working copy files.  The entry is only used if it was
+                stored with the same state.
+
+        Returns:
+            The diff's data, as passed to `store`, or `None` if it isn't cached.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            # Mark the entry as recently used.
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, zlib.error):
+            return None
+
+        # JSON doesn't keep the difference between tuples and lists, so compare the state as it would be stored.
+        if entry.get('key') != self._normalize(key) or entry.get('state') != self._normalize(state):
+            if self.debug:
+                print("** Cached diff {} is out of date".format(path))
+            return None
+        return entry.get('data')
+
+    def store(self, key, data, state=None):
+        """Add a diff to the cache, replacing any older entry for it.
+
+        Args:
+            key: The key for the diff.
+            data: The diff's data - a JSON-serializable value.
+            state: [optional] The state of the diff's working copy files before it was run.
+        """
+        path = self._path(key)
+        if not os.path.exists(self.diff_dir):
+            os.makedirs(self.diff_dir)
+
+        entry = {'key': key, 'state': state, 'data': data}
+        content = zlib.compress(json.dumps(entry, separators=(',', ':')).encode('utf-8'))
+
+        def write(temp_path):
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+        write_atomically(path, write)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used diffs, keeping `max_entries`."""
+        try:
+            names = os.listdir(self.diff_dir)
+        except OSError:
+            return
+        entries = []
+        for name in names:
+            path = os.path.join(self.diff_dir, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+
+        entries.sort(reverse=True)
+        for (_, path) in entries[self.max_entries:]:
+            if self.debug:
+                print("** Evicting {} from the DiffView diff cache".format(path))
+            remove_file(path)
+
+    def _normalize(self, value):
+        return json.loads(json.dumps(value))
+
+    def _path(self, key):
+        key_hash = hashlib.sha1(json.dumps([self.FORMAT_VERSION, key]).encode('utf-8')).hexdigest()
+        return os.path.join(self.diff_dir, key_hash + '.json.z')
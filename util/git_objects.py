@@ -0,0 +1,753 @@
+from collections import OrderedDict
+from binascii import hexlify, unhexlify
+import threading
+import struct
+import mmap
+import zlib
+import re
+import os
+
+
+class UnsupportedRepoError(Exception):
+    """Exception raised when a repo's format can't be read in-process."""
+    pass
+
+
+class PathNotFoundError(Exception):
+    """Exception raised when a path doesn't exist in a commit."""
+    pass
+
+
+class LRUCache(object):
+    """A dictionary that drops its least recently used entries once their total size exceeds a limit."""
+
+    def __init__(self, max_size):
+        """Constructor.
+
+        Args:
+            max_size: The maximum total size of the entries.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """Get an entry, marking it as recently used.
+
+        Args:
+            key: The key.
+
+        Returns:
+            The value, or `None` if there's no entry for the key.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        """Add an entry.
+
+        Args:
+            key: The key.
+            value: The value.
+            size: The size of the value.  Values bigger than the cache aren't added.
+        """
+        if size > self.max_size or key in self.entries:
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            (_, (_, old_size)) = self.entries.popitem(last=False)
+            self.size -= old_size
+
+    def clear(self):
+        """Remove all entries."""
+        self.entries.clear()
+        self.size = 0
+
+
+class GitObjectStore(object):
+    """Reads objects straight from a Git repo's object database, without running Git.
+
+    Supports loose objects and version 2 pack indexes (with offset and ref deltas), for SHA-1 repos with file-based
+    refs.  Revisions can be full SHAs or ref names (e.g. `HEAD`, `master`, `origin/master`, `v1.0`) - anything else,
+    like `HEAD~1` or an abbreviated SHA, isn't resolved here.  In every case this can't handle, `read_blob` returns
+    `None` so the caller can ask Git instead.
+
+    Pack files are memory-mapped, so only the parts that are read get loaded.  Recently used delta bases and trees are
+    cached, since neighbouring files usually share them.
+    """
+
+    OBJ_COMMIT = 1
+    OBJ_TREE = 2
+    OBJ_BLOB = 3
+    OBJ_TAG = 4
+    OBJ_OFS_DELTA = 6
+    OBJ_REF_DELTA = 7
+    TYPE_NAMES = {OBJ_COMMIT: 'commit', OBJ_TREE: 'tree', OBJ_BLOB: 'blob', OBJ_TAG: 'tag'}
+
+    DELTA_CACHE_SIZE = 16 * 1024 * 1024
+    TREE_CACHE_SIZE = 4 * 1024 * 1024
+    MAX_SYMREF_DEPTH = 5
+    MAX_PEEL_DEPTH = 10
+
+    SHA_MATCH = re.compile('^[0-9a-fA-F]{40}$')
+    SHORT_SHA_MATCH = re.compile('^[0-9a-fA-F]{4,39}$')
+    # Ref names - anything with revision syntax (`~`, `^`, `:`, `@{`...) is left to Git.
+    REF_NAME_MATCH = re.compile(r'^(?!.*\.\.)(?!/)(?!.*@\{)[^\0-\x20~^:?*\[\\]+$')
+    # Config that changes the object or ref format to one this can't read.
+    UNSUPPORTED_CONFIG_MATCH = re.compile(
+        r'^\s*(objectformat\s*=\s*(?!sha1\s*$)|refstorage\s*=\s*(?!files\s*$))', re.IGNORECASE | re.MULTILINE)
+    # Refs that belong to a worktree, rather than being shared between all of a repo's worktrees.
+    PER_WORKTREE_REF_MATCH = re.compile('^(?!refs/)|^refs/(worktree|bisect|rewritten)/')
+
+    def __init__(self, git_dir):
+        """Constructor.
+
+        Args:
+            git_dir: The repo's Git directory (e.g. `<repo>/.git`, or `<repo>/.git/worktrees/<name>` for a worktree).
+
+        Raises:
+            `UnsupportedRepoError` if the repo can't be read in-process.
+        """
+        self.git_dir = git_dir
+        self.common_dir = git_dir
+        commondir_file = os.path.join(git_dir, 'commondir')
+        if os.path.isfile(commondir_file):
+            with open(commondir_file, 'r') as f:
+                self.common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+
+        try:
+            with open(os.path.join(self.common_dir, 'config'), 'r') as f:
+                config = f.read()
+        except (IOError, OSError):
+            config = ''
+        if self.UNSUPPORTED_CONFIG_MATCH.search(config):
+            raise UnsupportedRepoError("Unsupported object or ref format")
+
+        objects_dir = os.path.join(self.common_dir, 'objects')
+        if not os.path.isdir(objects_dir):
+            raise UnsupportedRepoError("No objects directory")
+        self.object_dirs = [objects_dir] + self._read_alternates(objects_dir)
+
+        self.packs = None
+        self.packs_stamp = None
+        self.packed_refs = None
+        self.packed_refs_stamp = None
+        self.delta_cache = LRUCache(self.DELTA_CACHE_SIZE)
+        self.tree_cache = LRUCache(self.TREE_CACHE_SIZE)
+        self.root_trees = {}
+        self.lock = threading.RLock()
+
+    def read_blob(self, rev, path):
+        """Get the contents of a file at a specific revision.
+
+        Args:
+            rev: The revision - a full SHA or a ref name.
+            path: The path of the file, relative to the repo base.
+
+        Returns:
+            The contents as bytes, or `None` if they can't be read in-process.
+
+        Raises:
+            `PathNotFoundError` if the file doesn't exist at the revision.
+        """
+        with self.lock:
+            try:
+                sha = self._get_blob_sha(rev, path)
+            except (IOError, OSError, ValueError, IndexError, struct.error, zlib.error):
+                # Damaged or unexpected data - let Git deal with it.
+                return None
+            if sha is None:
+                return None
+            return self._read_blob(sha)
+
+    def get_blob(self, sha):
+        """Get the contents of a blob, given its SHA.
+
+        Args:
+            sha: The blob's full SHA, as a hex string.
+
+        Returns:
+            The contents as bytes, or `None` if they can't be read in-process.
+        """
+        with self.lock:
+            try:
+                return self._read_blob(unhexlify(sha))
+            except (ValueError, TypeError):
+                return None
+
+    def get_size(self, sha):
+        """Get the size of an object, without reading all of its contents.
+
+        Args:
+            sha: The object's full SHA, as a hex string.
+
+        Returns:
+            The size in bytes, or `None` if it can't be found in-process.
+        """
+        with self.lock:
+            try:
+                return self._get_size(unhexlify(sha))
+            except (IOError, OSError, ValueError, IndexError, struct.error, zlib.error, TypeError):
+                return None
+
+    def close(self):
+        """Unmap the pack files, and empty the caches.  They're reloaded if the store is used again."""
+        with self.lock:
+            for pack in self.packs or []:
+                pack.close()
+            self.packs = None
+            self.delta_cache.clear()
+            self.tree_cache.clear()
+
+    def resolve_rev(self, rev):
+        """Find the commit a revision refers to.
+
+        Args:
+            rev: The revision - a full SHA or a ref name.
+
+        Returns:
+            The commit's SHA as a hex string, or `None` if the revision can't be resolved in-process.
+        """
+        with self.lock:
+            return self._resolve_rev(rev)
+
+    def _resolve_rev(self, rev):
+        if self.SHA_MATCH.match(rev):
+            return rev.lower()
+        if self.SHORT_SHA_MATCH.match(rev) or not self.REF_NAME_MATCH.match(rev):
+            # Abbreviated SHAs and revision expressions need Git's rules.
+            return None
+
+        # The same order Git uses to turn a short name into a ref.
+        if rev == 'HEAD' or rev.startswith('refs/'):
+            names = [rev]
+        else:
+            names = [rev, 'refs/' + rev, 'refs/tags/' + rev, 'refs/heads/' + rev, 'refs/remotes/' + rev,
+                     'refs/remotes/{}/HEAD'.format(rev)]
+        for name in names:
+            sha = self._read_ref(name, 0)
+            if sha is not None:
+                return sha
+        return None
+
+    def _get_blob_sha(self, rev, path):
+        commit_sha = self._resolve_rev(rev)
+        if commit_sha is None:
+            return None
+        tree_sha = self._get_root_tree(commit_sha)
+        if tree_sha is None:
+            return None
+
+        components = path.replace('\\', '/').split('/')
+        for (i, name) in enumerate(components):
+            entries = self._read_tree(tree_sha)
+            if entries is None:
+                return None
+            entry = entries.get(name.encode('utf-8'))
+            if entry is None:
+                raise PathNotFoundError(path)
+            (mode, sha) = entry
+            is_tree = (mode == b'40000')
+            if i < len(components) - 1:
+                if not is_tree:
+                    raise PathNotFoundError(path)
+                tree_sha = sha
+            elif is_tree or mode == b'160000':
+                # A directory or submodule, not a file.
+                return None
+            else:
+                return sha
+
+    def _get_root_tree(self, sha):
+        # Objects never change, so the tree for a commit (or tag) can be remembered for as long as the store lives.
+        if sha in self.root_trees:
+            return self.root_trees[sha]
+
+        # Peel tags until we reach the commit.
+        obj = self._read_object(unhexlify(sha))
+        for _ in range(self.MAX_PEEL_DEPTH):
+            if obj is None or obj[0] != 'tag':
+                break
+            obj = self._read_object(unhexlify(self._read_header_field(obj[1], b'object')))
+        if obj is None or obj[0] != 'commit':
+            return None
+        tree_sha = unhexlify(self._read_header_field(obj[1], b'tree'))
+        self.root_trees[sha] = tree_sha
+        return tree_sha
+
+    def _read_tree(self, sha):
+        entries = self.tree_cache.get(sha)
+        if entries is not None:
+            return entries
+        obj = self._read_object(sha)
+        if obj is None or obj[0] != 'tree':
+            return None
+
+        # Each entry is `<mode> <name>\0<20 byte SHA>`.
+        data = obj[1]
+        entries = {}
+        pos = 0
+        while pos < len(data):
+            space = data.index(b' ', pos)
+            nul = data.index(b'\0', space)
+            entries[data[space + 1:nul]] = (data[pos:space], data[nul + 1:nul + 21])
+            pos = nul + 21
+        self.tree_cache.put(sha, entries, len(data))
+        return entries
+
+    @staticmethod
+    def _read_header_field(data, field):
+        # Commit and tag headers are `<field> <value>` lines, ending at the first blank line.
+        prefix = field + b' '
+        for line in data.split(b'\n\n', 1)[0].split(b'\n'):
+            if line.startswith(prefix):
+                return line[len(prefix):].decode('ascii')
+        raise ValueError("No {} in object".format(field))
+
+    def _read_ref(self, name, depth):
+        if depth > self.MAX_SYMREF_DEPTH:
+            return None
+        ref_dir = self.git_dir if self.PER_WORKTREE_REF_MATCH.match(name) else self.common_dir
+        try:
+            with open(os.path.join(ref_dir, *name.split('/')), 'r') as f:
+                content = f.read().strip()
+        except (IOError, OSError):
+            # Not a loose ref (or it's a directory) - it may be packed.
+            return self._read_packed_refs().get(name)
+
+        if content.startswith('ref: '):
+            return self._read_ref(content[len('ref: '):].strip(), depth + 1)
+        if self.SHA_MATCH.match(content):
+            return content.lower()
+        return None
+
+    def _read_packed_refs(self):
+        path = os.path.join(self.common_dir, 'packed-refs')
+        try:
+            st = os.stat(path)
+        except OSError:
+            return {}
+        stamp = (st.st_mtime, st.st_size)
+        if stamp != self.packed_refs_stamp:
+            # Lines are `<sha> <ref>`, with `^<sha>` lines for peeled tags and a `#` header.
+            refs = {}
+            with open(path, 'r') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split(' ', 1)
+                    if len(parts) == 2 and self.SHA_MATCH.match(parts[0]):
+                        refs[parts[1]] = parts[0].lower()
+            self.packed_refs = refs
+            self.packed_refs_stamp = stamp
+        return self.packed_refs
+
+    def _read_blob(self, sha):
+        try:
+            obj = self._read_object(sha)
+        except (IOError, OSError, ValueError, IndexError, struct.error, zlib.error):
+            # Damaged or unexpected data - let Git deal with it.
+            return None
+        if obj is None or obj[0] != 'blob':
+            return None
+        return obj[1]
+
+    def _read_object(self, sha):
+        """Get an object's type name and contents, given its binary SHA - or `None` if it can't be found."""
+        for pack in self._get_packs():
+            offset = pack.find(sha)
+            if offset is not None:
+                return self._read_packed(pack, offset)
+
+        obj = self._read_loose(sha)
+        if obj is None and self._reload_packs():
+            # Git may have repacked since the packs were loaded.
+            for pack in self.packs:
+                offset = pack.find(sha)
+                if offset is not None:
+                    return self._read_packed(pack, offset)
+        return obj
+
+    def _get_size(self, sha):
+        for pack in self._get_packs():
+            offset = pack.find(sha)
+            if offset is not None:
+                (type_num, size, data_offset) = pack.read_header(offset)
+                if type_num == self.OBJ_OFS_DELTA:
+                    data_offset = pack.read_ofs_delta_base(data_offset)[1]
+                elif type_num == self.OBJ_REF_DELTA:
+                    data_offset += 20
+                else:
+                    return size
+                # The result size is the second number in the delta's header - just decompress enough for that.
+                header = pack.decompress(data_offset, size, 20)
+                return read_varint(header, read_varint(header, 0)[1])[0]
+
+        path = self._loose_path(sha)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            decompressor = zlib.decompressobj()
+            header = b''
+            while b'\0' not in header:
+                chunk = f.read(256)
+                if not chunk:
+                    raise ValueError("Loose object has no header")
+                header += decompressor.decompress(chunk, 64)
+        return int(header[:header.index(b'\0')].split(b' ')[1])
+
+    def _loose_path(self, sha):
+        hex_sha = hexlify(sha).decode('ascii')
+        for objects_dir in self.object_dirs:
+            path = os.path.join(objects_dir, hex_sha[:2], hex_sha[2:])
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _read_loose(self, sha):
+        path = self._loose_path(sha)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            raw = zlib.decompress(f.read())
+        # Header is `<type> <size>\0`.
+        nul = raw.index(b'\0')
+        (type_name, size) = raw[:nul].split(b' ')
+        data = raw[nul + 1:]
+        if len(data) != int(size):
+            raise ValueError("Loose object has the wrong size")
+        return (type_name.decode('ascii'), data)
+
+    def _read_packed(self, pack, offset):
+        # Follow the delta chain back to a full object (or a cached result), then apply the deltas in reverse.
+        chain = []
+        while True:
+            cached = self.delta_cache.get((pack.idx_path, offset))
+            if cached is not None:
+                (type_num, data) = cached
+                break
+
+            (type_num, size, data_offset) = pack.read_header(offset)
+            if type_num == self.OBJ_OFS_DELTA:
+                (base_offset, data_offset) = pack.read_ofs_delta_base(data_offset)
+                chain.append((pack, offset, data_offset, size))
+                offset = offset - base_offset
+            elif type_num == self.OBJ_REF_DELTA:
+                base_sha = pack.data[data_offset:data_offset + 20]
+                chain.append((pack, offset, data_offset + 20, size))
+                base_offset = pack.find(base_sha)
+                if base_offset is not None:
+                    offset = base_offset
+                else:
+                    base = self._read_object(base_sha)
+                    if base is None:
+                        return None
+                    type_num = self._type_num(base[0])
+                    data = base[1]
+                    break
+            elif type_num in self.TYPE_NAMES:
+                data = pack.decompress(data_offset, size)
+                if chain:
+                    self.delta_cache.put((pack.idx_path, offset), (type_num, data), len(data))
+                break
+            else:
+                raise ValueError("Unknown pack object type {}".format(type_num))
+
+        for (i, (delta_pack, delta_offset, data_offset, size)) in enumerate(reversed(chain)):
+            data = apply_delta(data, delta_pack.decompress(data_offset, size))
+            if i < len(chain) - 1:
+                # Intermediate results are bases for other objects too; the object itself may not be.
+                self.delta_cache.put((delta_pack.idx_path, delta_offset), (type_num, data), len(data))
+        return (self.TYPE_NAMES[type_num], data)
+
+    def _type_num(self, type_name):
+        for (type_num, name) in self.TYPE_NAMES.items():
+            if name == type_name:
+                return type_num
+        raise ValueError("Unknown object type {}".format(type_name))
+
+    def _get_packs(self):
+        if self.packs is None:
+            self._load_packs()
+        return self.packs
+
+    def _reload_packs(self):
+        """Reload the packs if any have been added or removed since they were loaded.  Returns whether they were."""
+        if self.packs is None or self._packs_stamp() == self.packs_stamp:
+            return False
+        self._load_packs()
+        return True
+
+    def _load_packs(self):
+        for pack in self.packs or []:
+            pack.close()
+        self.packs_stamp = self._packs_stamp()
+        self.packs = []
+        for objects_dir in self.object_dirs:
+            pack_dir = os.path.join(objects_dir, 'pack')
+            if not os.path.isdir(pack_dir):
+                continue
+            for name in sorted(os.listdir(pack_dir)):
+                pack_path = os.path.join(pack_dir, name[:-len('.idx')] + '.pack')
+                if name.endswith('.idx') and os.path.isfile(pack_path):
+                    try:
+                        self.packs.append(PackFile(os.path.join(pack_dir, name), pack_path))
+                    except (IOError, OSError, ValueError, UnsupportedRepoError):
+                        # Objects only in this pack will be read by Git instead.
+                        pass
+
+    def _packs_stamp(self):
+        stamp = []
+        for objects_dir in self.object_dirs:
+            try:
+                stamp.append(os.stat(os.path.join(objects_dir, 'pack')).st_mtime)
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    @staticmethod
+    def _read_alternates(objects_dir):
+        try:
+            with open(os.path.join(objects_dir, 'info', 'alternates'), 'r') as f:
+                lines = f.read().splitlines()
+        except (IOError, OSError):
+            return []
+        return [os.path.normpath(os.path.join(objects_dir, line.strip()))
+                for line in lines if line.strip() and not line.startswith('#')]
+
+
+class PackFile(object):
+    """A memory-mapped pack file and its (version 2) index."""
+
+    IDX_MAGIC = b'\xfftOc'
+
+    def __init__(self, idx_path, pack_path):
+        """Constructor.
+
+        Args:
+            idx_path: The path of the `.idx` file.
+            pack_path: The path of the `.pack` file.
+
+        Raises:
+            `UnsupportedRepoError` if the index isn't version 2.
+        """
+        self.idx_path = idx_path
+        self.pack_path = pack_path
+        self.idx = self._map(idx_path)
+        if self.idx[:4] != self.IDX_MAGIC or struct.unpack('>I', self.idx[4:8])[0] != 2:
+            self.idx.close()
+            raise UnsupportedRepoError("Unsupported pack index version")
+        self.fanout = struct.unpack('>256I', self.idx[8:8 + 256 * 4])
+        self.count = self.fanout[255]
+        self.sha_start = 8 + 256 * 4
+        self.offset_start = self.sha_start + self.count * (20 + 4)
+        self.large_offset_start = self.offset_start + self.count * 4
+        self._data = None
+
+    @property
+    def data(self):
+        """The pack's contents - mapped on first use."""
+        if self._data is None:
+            self._data = self._map(self.pack_path)
+        return self._data
+
+    def find(self, sha):
+        """Find an object in the pack.
+
+        Args:
+            sha: The object's binary SHA.
+
+        Returns:
+            The object's offset in the pack, or `None` if it isn't in this pack.
+        """
+        first = sha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.sha_start + mid * 20
+            mid_sha = self.idx[start:start + 20]
+            if mid_sha < sha:
+                lo = mid + 1
+            elif mid_sha > sha:
+                hi = mid
+            else:
+                start = self.offset_start + mid * 4
+                offset = struct.unpack('>I', self.idx[start:start + 4])[0]
+                if offset & 0x80000000:
+                    # Index into the table of 8 byte offsets, for packs over 2GB.
+                    start = self.large_offset_start + (offset & 0x7fffffff) * 8
+                    offset = struct.unpack('>Q', self.idx[start:start + 8])[0]
+                return offset
+        return None
+
+    def read_header(self, offset):
+        """Read an object's header.
+
+        Args:
+            offset: The object's offset in the pack.
+
+        Returns:
+            A tuple of `(type, size, data_offset)`.  For deltas, the size is the size of the delta itself.
+        """
+        data = self.data
+        byte = data[offset]
+        type_num = (byte >> 4) & 0x7
+        size = byte & 0x0f
+        shift = 4
+        offset += 1
+        while byte & 0x80:
+            byte = data[offset]
+            size |= (byte & 0x7f) << shift
+            shift += 7
+            offset += 1
+        return (type_num, size, offset)
+
+    def read_ofs_delta_base(self, offset):
+        """Read the (negative) base offset of an offset delta.
+
+        Args:
+            offset: The offset of the delta's data, as returned by `read_header`.
+
+        Returns:
+            A tuple of `(base_distance, data_offset)` - the base is `base_distance` bytes before the delta.
+        """
+        data = self.data
+        byte = data[offset]
+        distance = byte & 0x7f
+        offset += 1
+        while byte & 0x80:
+            byte = data[offset]
+            distance = ((distance + 1) << 7) | (byte & 0x7f)
+            offset += 1
+        return (distance, offset)
+
+    def decompress(self, offset, size, max_length=None):
+        """Decompress some data from the pack.
+
+        Args:
+            offset: The offset of the compressed data.
+            size: The size of the data once decompressed.
+            max_length: [optional] Stop once this many bytes have been decompressed.
+
+        Returns:
+            The decompressed data, as bytes.
+        """
+        data = self.data
+        decompressor = zlib.decompressobj()
+        chunks = []
+        length = 0
+        want = size if max_length is None else min(size, max_length)
+        # Compressed data is rarely much bigger than the original, so usually the first read is all that's needed.
+        read_size = want + 64
+        while not decompressor.eof and not (max_length is not None and length >= want):
+            chunk = data[offset:offset + read_size]
+            if not chunk:
+                raise ValueError("Pack data ended early")
+            if max_length is not None:
+                # Any input beyond what's needed for `want` bytes is left unused.
+                chunk = decompressor.decompress(chunk, want - length)
+            else:
+                chunk = decompressor.decompress(chunk)
+            chunks.append(chunk)
+            length += len(chunk)
+            offset += read_size
+            read_size = 64 * 1024
+        result = b''.join(chunks)
+        if len(result) != want:
+            raise ValueError("Pack object has the wrong size")
+        return result
+
+    def close(self):
+        """Unmap the files."""
+        self.idx.close()
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    @staticmethod
+    def _map(path):
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_varint(data, pos):
+    """Read a little-endian base-128 number, as used in delta headers.
+
+    Args:
+        data: The bytes to read from.
+        pos: The position to start reading at.
+
+    Returns:
+        A tuple of `(value, next_pos)`.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (value, pos)
+
+
+def apply_delta(base, delta):
+    """Apply a Git delta to its base object.
+
+    Args:
+        base: The base object's contents, as bytes.
+        delta: The delta, as bytes.
+
+    Returns:
+        The resulting object's contents, as bytes.
+    """
+    (base_size, pos) = read_varint(delta, 0)
+    (result_size, pos) = read_varint(delta, pos)
+    if len(base) != base_size:
+        raise ValueError("Delta base has the wrong size")
+
+    base_view = memoryview(base)
+    result = bytearray()
+    end = len(delta)
+    while pos < end:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            # Copy from the base - the low bits say which offset and size bytes follow.  Unrolled, as this is the
+            # hot loop when reading packed objects.
+            copy_offset = copy_size = 0
+            if op & 0x01:
+                copy_offset = delta[pos]
+                pos += 1
+            if op & 0x02:
+                copy_offset |= delta[pos] << 8
+                pos += 1
+            if op & 0x04:
+                copy_offset |= delta[pos] << 16
+                pos += 1
+            if op & 0x08:
+                copy_offset |= delta[pos] << 24
+                pos += 1
+            if op & 0x10:
+                copy_size = delta[pos]
+                pos += 1
+            if op & 0x20:
+                copy_size |= delta[pos] << 8
+                pos += 1
+            if op & 0x40:
+                copy_size |= delta[pos] << 16
+                pos += 1
+            result += base_view[copy_offset:copy_offset + (copy_size or 0x10000)]
+        elif op:
+            # Insert the next `op` bytes of the delta.
+            result += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError("Invalid delta opcode")
+
+    if len(result) != result_size:
+        raise ValueError("Delta result has the wrong size")
+    return bytes(result)
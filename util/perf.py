@@ -0,0 +1,146 @@
+import collections
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PerfRun(object):
+    """Timings and counters for one diff, to show where its time went.
+
+    Each diff has its own run.  Time is recorded in named spans (e.g. "fetch"), which can be entered many times and from
+    any thread - each span's total time and count are kept.  Spans can be nested, e.g. "stat" is part of "diff".
+    """
+
+    # The most recent runs, newest last.
+    history = collections.deque(maxlen=10)
+    history_lock = threading.Lock()
+
+    def __init__(self, description=None):
+        """Constructor.
+
+        Args:
+            description: [optional] What the run is for, e.g. the diff args.  Only runs with a description are kept in
+                `history`.
+        """
+        self.description = description
+        self.start_time = time.time()
+        self.spans = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.profile_path = None
+        self.lock = threading.Lock()
+        if description is not None:
+            with PerfRun.history_lock:
+                PerfRun.history.append(self)
+
+    @contextmanager
+    def span(self, name):
+        """Context manager that adds the time taken by its body to a span.
+
+        Args:
+            name: The name of the span.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        """Add some time to a span.
+
+        Args:
+            name: The name of the span.
+            seconds: The time to add.
+        """
+        with self.lock:
+            (total, count) = self.spans.get(name, (0.0, 0))
+            self.spans[name] = (total + seconds, count + 1)
+
+    def timed(self, name, iterable):
+        """Generator that adds the time taken to get each item from an iterable to a span.
+
+        Args:
+            name: The name of the span.
+            iterable: The iterable, e.g. a generator that runs a VCS command.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name, amount=1):
+        """Add to a counter.
+
+        Args:
+            name: The name of the counter.
+            amount: [optional] How much to add.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def profile(self, path):
+        """Context manager that profiles its body with `cProfile`, and writes the stats to a file.
+
+        Does nothing if `path` is `None`, or `cProfile` isn't available.
+
+        Args:
+            path: The path of the `.prof` file to write.
+        """
+        try:
+            import cProfile
+        except ImportError:
+            cProfile = None
+        if path is None or cProfile is None:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            profiler.dump_stats(path)
+            self.profile_path = path
+
+    def report(self):
+        """Describe the run.
+
+        Returns:
+            The report, as a list of lines.
+        """
+        with self.lock:
+            spans = list(self.spans.items())
+            counters = list(self.counters.items())
+        lines = ["{}  {}".format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start_time)), self.description or '')]
+        for (name, (total, count)) in spans:
+            lines.append("  {:24} {:10.3f} s  {:>8} x".format(name, total, count))
+        for (name, value) in counters:
+            lines.append("  {:24} {:>12,}".format(name, value))
+        if self.profile_path:
+            lines.append("  Profile: {}".format(self.profile_path))
+        return lines
+
+    @classmethod
+    def history_report(cls):
+        """Describe the most recent runs.
+
+        Returns:
+            The report, as a string - newest run first.
+        """
+        with cls.history_lock:
+            runs = list(cls.history)
+        if not runs:
+            return "No diffs have been run yet."
+        return "\n\n".join("\n".join(run.report()) for run in reversed(runs))
@@ -1,9 +1,17 @@
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 import subprocess
+import threading
+import fnmatch
+import hashlib
+import shlex
 import re
 import os
 
 from ..parser.file_diff import FileDiff
+from .cancel import CancelToken, kill_process
+from .perf import PerfRun
+from .git_objects import GitObjectStore, UnsupportedRepoError, PathNotFoundError
 
 
 class VCSHelper(object):
@@ -13,92 +21,154 @@ class VCSHelper(object):
     directory.
     """
     __metaclass__ = ABCMeta
-    SVN_BASE_MATCH = re.compile('Root Path:\s*([\:\\\\/\w\.\- ]*)')
+
+    # Helpers already found, keyed on the directory they were requested for.  Each value is `(marker, helper)` where
+    # `marker` is the VCS metadata file/directory that identified the repo.
+    _helpers = {}
 
     @classmethod
-    def get_helper(cls, cwd, debug=False):
+    def get_helper(cls, cwd):
         """Get the correct VCS helper for this codebase.
 
-        Checks for Git first, then Subversion.
+        Walks up from `cwd` looking for `.git`, `.svn` or `.bzr` metadata - the nearest one wins.  Helpers are cached,
+        so repeated diffs in the same repo reuse the same helper without looking at the filesystem again (beyond
+        checking that the metadata still exists).  Since diffs share helpers, each diff passes its own `VCSContext` to
+        the helper's methods.
 
         Args:
             cwd: The current directory.  Not necessarily the base of the VCS.
 
         Returns:
-            A `GitHelper` or `SVNHelper` if in a repo.
+            A `GitHelper`, `SVNHelper` or `BzrHelper` if in a repo.
 
         Raises:
             `NoVCSError` if the `cwd` isn't under version control.
         """
-        # Check for a Git repo first
-        try:
-            p = subprocess.Popen(
-                'git rev-parse --show-toplevel',
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                cwd=cwd)
-            out, err = p.communicate()
-            if not err:
-                return GitHelper(out.decode('utf-8').rstrip(), debug=debug)
-        except:
-            pass
+        cwd = os.path.abspath(cwd)
+        cached = cls._helpers.get(cwd)
+        if cached and os.path.exists(cached[0]):
+            helper = cached[1]
+        else:
+            (marker, helper_class, repo_base) = cls.find_repo(cwd)
+
+            # Share helpers between all directories in the same repo.
+            helper = None
+            for (other_marker, other_helper) in cls._helpers.values():
+                if other_marker == marker and isinstance(other_helper, helper_class):
+                    helper = other_helper
+                    break
+            if helper is None:
+                helper = helper_class(repo_base)
+            cls._helpers[cwd] = (marker, helper)
+        return helper
 
-        try:
-            # Now check for SVN
-            p = subprocess.Popen(
-                'svn info',
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                cwd=cwd)
-            out, err = p.communicate()
-            if not err:
-                match = VCSHelper.SVN_BASE_MATCH.search(out.decode('utf-8'))
-                if match:
-                    return SVNHelper(match.group(1).rstrip(), debug=debug)
-                else:
-                    print("Couldn't find SVN repo in:\n{}".format(out.decode('utf-8')))
-        except:
-            pass
+    @classmethod
+    def find_repo(cls, cwd):
+        """Find the repo containing a directory, without running any VCS commands.
 
-        try:
-        # Now check for Bzr
-            p = subprocess.Popen(
-                'bzr root',
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                cwd=cwd)
-            out, err = p.communicate()
-            if not err:
-                return BzrHelper(out.decode('utf-8').rstrip(), debug=debug)
-        except:
-            pass
+        Args:
+            cwd: The directory to start looking from.
 
-        # No VCS found
-        raise NoVCSError
+        Returns:
+            A tuple of `(marker, helper_class, repo_base)`.
+
+        Raises:
+            `NoVCSError` if the `cwd` isn't under version control.
+        """
+        path = cwd
+        while True:
+            # `.git` is a directory for normal repos, or a "gitfile" for worktrees and submodules.
+            marker = os.path.join(path, '.git')
+            if os.path.isdir(marker) or (os.path.isfile(marker) and read_gitfile(marker)):
+                return (marker, GitHelper, path)
+
+            # Old SVN working copies have `.svn` in every directory - the root is the highest one.
+            marker = os.path.join(path, '.svn')
+            if os.path.isdir(marker):
+                while os.path.isdir(os.path.join(os.path.dirname(path), '.svn')) and os.path.dirname(path) != path:
+                    path = os.path.dirname(path)
+                    marker = os.path.join(path, '.svn')
+                return (marker, SVNHelper, path)
+
+            marker = os.path.join(path, '.bzr')
+            if os.path.isdir(marker):
+                return (marker, BzrHelper, path)
+
+            parent = os.path.dirname(path)
+            if parent == path:
+                # No VCS found
+                raise NoVCSError
+            path = parent
 
     @abstractmethod
-    def get_changed_files(self, diff_args):
+    def get_changed_files(self, diff_args, paths=None, context=None):
         """Get a list of changed files.
 
         Args:
             diff_args: The diff args that define which files have changed.
+            paths: [optional] Only diff these files (relative to the repo base), e.g. to refresh them after they've
+                changed.
+            context: [optional] The `VCSContext` for the diff.
 
         Returns:
             An array of `FileDiff` objects representing the changed files.
         """
         pass
 
+    def iter_changed_files(self, diff_args, paths=None, context=None):
+        """Get the changed files one at a time, as soon as each is available.
+
+        Helpers that can stream their diff output override this; by default it's the same as `get_changed_files`.
+
+        Args:
+            diff_args: The diff args that define which files have changed.
+            paths: [optional] Only diff these files (relative to the repo base).
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            An iterator over `FileDiff` objects representing the changed files.
+        """
+        return iter(self.get_changed_files(diff_args, paths, context))
+
+    def get_diff_args(self, diff_args, paths=None):
+        """Get the args to pass to the VCS's diff command.
+
+        Args:
+            diff_args: The user's diff args, as a string.
+            paths: [optional] Only diff these files (relative to the repo base).
+
+        Returns:
+            The args, as a list.
+        """
+        args = self.split_args(diff_args)
+        if paths:
+            args += paths
+        return args
+
+    def is_in_diff(self, diff_args, filename):
+        """Whether a file is covered by the paths that the user's diff args limit the diff to.
+
+        Used before diffing a file on its own (see `get_diff_args`), which would otherwise show it even if it's outside
+        those paths.
+
+        Args:
+            diff_args: The user's diff args, as a string.
+            filename: The file, relative to the repo base.
+
+        Returns:
+            `True` if the file is covered, or the helper can't tell.
+        """
+        return True
+
     @abstractmethod
-    def get_file_versions(self, diff_args):
+    def get_file_versions(self, diff_args, context=None):
         """Get both the versions of the file.
 
         An empty string means that the file is the working copy version.
 
         Args:
             diff_args: The diff arguments.
+            context: [optional] The `VCSContext` for the diff.
 
         Returns:
             A tuple with the 'version' for the old and new file, suitable for passing in to `get_file_content`.
@@ -106,97 +176,726 @@ class VCSHelper(object):
         pass
 
     @abstractmethod
-    def get_file_content(self, filename, version):
+    def get_file_content(self, filename, version, context=None):
         """Get the contents of a file at a specific version.
 
         Args:
             filename: The file.
             version: The version.
+            context: [optional] The `VCSContext` for the diff.
 
         Returns:
             A string with the file's contents at the specified version.
         """
         pass
 
-    def vcs_command(self, args):
-        """Wrapper to run a VCS command.
+    def get_file_content_args(self, filename, version):
+        """Get the VCS args for outputting the contents of a file at a specific version.
+
+        Args:
+            filename: The file.
+            version: The version.
+
+        Returns:
+            The args, as a list.
+        """
+        raise NotImplementedError
+
+    def write_file_content(self, filename, version, path, context=None):
+        """Write the contents of a file at a specific version to disk.
+
+        The VCS output is copied to the file in chunks, with CRLF line endings converted to LF - the whole file is
+        never held in memory.
+
+        Args:
+            filename: The file.
+            version: The version.
+            path: The path to write the contents to.
+            context: [optional] The `VCSContext` for the diff.
+        """
+        context = context or VCSContext()
+        p = self.popen(self.get_file_content_args(filename, version), context,
+                       stdout=subprocess.PIPE,
+                       stderr=subprocess.DEVNULL)
+        try:
+            with self.watch_process(p, context), open(path, 'wb') as f:
+                converter = CRLFConverter(f)
+                size = 0
+                for chunk in iter(lambda: p.stdout.read(CRLFConverter.CHUNK_SIZE), b''):
+                    converter.write(chunk)
+                    size += len(chunk)
+                converter.close()
+            context.perf.count('bytes read from VCS', size)
+        finally:
+            if p.poll() is None:
+                p.kill()
+            p.stdout.close()
+            p.wait()
+
+    def write_version_content(self, changed_file, version, old, path, context=None):
+        """Write the contents of a changed file at a specific version to disk.
+
+        The contents must be the ones identified by `get_content_key`, since they're cached under that key.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+            version: The version, as returned by `get_file_versions`.
+            old: Whether this is the old version of the file.
+            path: The path to write the contents to.
+            context: [optional] The `VCSContext` for the diff.
+        """
+        filename = changed_file.old_filename if old else changed_file.filename
+        self.write_file_content(filename, version, path, context)
+
+    def get_diff_cache_key(self, diff_args, versions, context=None):
+        """Get a key that identifies a diff's result, for caching the parsed diff between sessions.
+
+        Args:
+            diff_args: The diff args.
+            versions: The versions, as returned by `get_file_versions`.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The key, as a list of strings - the same whenever the diff would have the same result (apart from changes to
+            working copy files - see `get_working_copy_state`).  `None` if the diff can't be cached - e.g. because its
+            versions can change.
+        """
+        return None
+
+    def get_working_copy_state(self, diff_args, context=None):
+        """Get the state of the working copy files in a diff, which a cached result of the diff is only valid for.
+
+        Args:
+            diff_args: The diff args.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            A JSON-serializable value that changes whenever the diff's working copy files (or which files are changed)
+            do.
+        """
+        return None
+
+    def get_content_key(self, changed_file, version, old):
+        """Get a key that uniquely identifies a changed file's contents at a specific version, for caching them.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+            version: The version, as returned by `get_file_versions`.
+            old: Whether this is the old version of the file.
+
+        Returns:
+            A key (a hex string), or `None` if the contents can't be cached - e.g. because the version can change.
+        """
+        return None
+
+    def get_file_size(self, changed_file, version, old, context=None):
+        """Get the size of a changed file at a specific version, without getting its contents.
+
+        Args:
+            changed_file: The `FileDiff` for the file.
+            version: The version, as returned by `get_file_versions`.
+            old: Whether this is the old version of the file.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The size in bytes, or `None` if it can't be found cheaply.
+        """
+        return None
+
+    def close(self):
+        """Release any long-lived resources (e.g. background processes) held by this helper.
+
+        The helper remains usable; resources are recreated if they're needed again.
+        """
+        pass
+
+    # Args passed to the VCS before every command, environment variables to set for it, and environment variables to
+    # remove.  Together these stop user configuration from changing (or slowing down) the VCS's output.
+    GLOBAL_ARGS = []
+    ENV = {}
+    UNSET_ENV = []
+
+    @staticmethod
+    def split_args(args):
+        """Split a string of user-provided arguments into a list suitable for `vcs_command`.
+
+        Args:
+            args: The arguments, as typed into a shell.
+
+        Returns:
+            The list of arguments.
+        """
+        return shlex.split(args, posix=(os.name != 'nt'))
+
+    def popen(self, args, context, **kwargs):
+        """Start a VCS process - the binary is run directly, not via a shell.
 
         Args:
             args: The args for the VCS command.
+            context: The `VCSContext` for the diff the process is for.
+            kwargs: Passed on to `subprocess.Popen`.
 
         Returns:
-            The command's output, as a string.
+            The `subprocess.Popen` object.
         """
-        # Using shell, just pass a string to subprocess.
-        cmd = " ".join([self.vcs] + args)
-        p = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            shell=True,
-            cwd=self.repo_base)
-        if self.debug:
+        env = os.environ.copy()
+        env.update(self.ENV)
+        for var in self.UNSET_ENV:
+            env.pop(var, None)
+
+        startupinfo = None
+        if os.name == 'nt':
+            # Don't pop up a console window for each command.
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        cmd = [self.vcs] + self.GLOBAL_ARGS + args
+        if context.debug:
             print("**** Running VCS command:\n%s" % cmd)
-        out, err = p.communicate()
-        if self.debug:
+        context.perf.count('VCS processes')
+        return subprocess.Popen(
+            cmd,
+            cwd=self.repo_base,
+            env=env,
+            startupinfo=startupinfo,
+            **kwargs)
+
+    @contextmanager
+    def watch_process(self, p, context, timeout=True):
+        """Context manager that kills a VCS process if the diff is cancelled, or the process takes too long.
+
+        Args:
+            p: The `subprocess.Popen` object.
+            context: The `VCSContext` for the diff - its cancel token and timeout are used.
+            timeout: Whether to apply the context's timeout to the process.
+
+        Raises:
+            `DiffCancelled` if the diff was cancelled, or `VCSTimeoutError` if the process was killed for taking too
+            long - once the body of the `with` statement has finished.
+        """
+        cancel_token = context.cancel_token
+        cancel_token.register(p)
+        timed_out = []
+        timer = None
+        if timeout and context.timeout:
+            def on_timeout():
+                timed_out.append(True)
+                kill_process(p)
+            timer = threading.Timer(context.timeout, on_timeout)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            yield
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cancel_token.unregister(p)
+
+        cancel_token.check()
+        if timed_out:
+            raise VCSTimeoutError("VCS command took longer than {} seconds: {}".format(
+                context.timeout, ' '.join(p.args)))
+
+    def vcs_command(self, args, context=None):
+        """Wrapper to run a VCS command.
+
+        Args:
+            args: The args for the VCS command, as a list.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The command's output, as a string.
+        """
+        context = context or VCSContext()
+        p = self.popen(args, context, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with self.watch_process(p, context):
+            out, err = p.communicate()
+        context.perf.count('bytes read from VCS', len(out))
+        if context.debug:
             print("** VCS command returns output:\n%s" % out)
             if err:
                 print("** VCS command returns error:\n%s" % err)
         return out.decode('utf-8', 'replace')
 
+    def vcs_command_lines(self, args, context=None):
+        """Wrapper to run a VCS command, and read its output incrementally.
+
+        Args:
+            args: The args for the VCS command, as a list.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            A generator of the command's output lines (including line endings), as strings.
+        """
+        context = context or VCSContext()
+        p = self.popen(args, context, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        size = 0
+        try:
+            # No timeout - how long this runs depends on how quickly the caller reads the output.
+            with self.watch_process(p, context, timeout=False):
+                for line in iter(p.stdout.readline, b''):
+                    size += len(line)
+                    yield line.decode('utf-8', 'replace')
+        finally:
+            context.perf.count('bytes read from VCS', size)
+            # Don't leave the process running if the caller stops reading early.
+            if p.poll() is None:
+                p.kill()
+            p.stdout.close()
+            p.wait()
+
+    def split_diff(self, lines, file_start):
+        """Split the lines of a multi-file diff into each file's section.
+
+        Args:
+            lines: An iterable of the diff's lines, e.g. from `vcs_command_lines`.
+            file_start: The prefix of the line that starts each file's section.
+
+        Returns:
+            A generator of strings, each the diff text for one file (including its header).  Each section is produced as
+            soon as the start of the next one is read.
+        """
+        section = []
+        for line in lines:
+            if line.startswith(file_start) and section:
+                yield ''.join(section)
+                section = []
+            if section or line.startswith(file_start):
+                section.append(line)
+        if section:
+            yield ''.join(section)
+
 
 class NoVCSError(Exception):
     """Exception raised when no VCS is found."""
     pass
 
 
+class VCSTimeoutError(Exception):
+    """Exception raised when a VCS command is killed for taking too long."""
+    pass
+
+
+class VCSContext(object):
+    """The settings and state for one diff's use of a VCS helper.
+
+    Helpers (and their long-lived processes) are shared by every diff in a repo, so anything that belongs to a single
+    diff is kept here instead, and passed to each helper call.
+    """
+
+    def __init__(self, debug=False, cancel_token=None, timeout=None, in_process=True, perf=None):
+        """Constructor.
+
+        Args:
+            debug: [optional] Whether to log debug output.
+            cancel_token: [optional] The `CancelToken` for the diff.  VCS commands are killed if it's cancelled.
+            timeout: [optional] The maximum time (in seconds) any VCS command may take.  No limit if `None`.
+            in_process: [optional] Whether to read the repo's data directly where possible, rather than running the
+                VCS.  Only Git supports this.
+            perf: [optional] The `PerfRun` for the diff.  VCS processes and the data read are counted in it.
+        """
+        self.debug = debug
+        self.cancel_token = cancel_token or CancelToken()
+        self.timeout = timeout
+        self.in_process = in_process
+        self.perf = perf or PerfRun()
+        # Whether the diff's changed files have been listed.
+        self.got_changed_files = False
+        # Commits that revisions resolved to, for this diff.
+        self.commits = {}
+
+
+class CRLFConverter(object):
+    """Writes bytes to a file in chunks, converting CRLF line endings to LF.
+
+    A CR at the end of one chunk is held back until the next chunk shows whether it's part of a CRLF.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, f):
+        """Constructor.
+
+        Args:
+            f: The file to write to, opened in binary mode.
+        """
+        self.f = f
+        self.pending_cr = False
+
+    def write(self, chunk):
+        """Write a chunk of bytes.
+
+        Args:
+            chunk: The bytes.
+        """
+        if not chunk:
+            return
+        if self.pending_cr:
+            if not chunk.startswith(b'\n'):
+                self.f.write(b'\r')
+            self.pending_cr = False
+        if chunk.endswith(b'\r'):
+            self.pending_cr = True
+            chunk = chunk[:-1]
+        self.f.write(chunk.replace(b'\r\n', b'\n'))
+
+    def close(self):
+        """Write anything held back.  Doesn't close the file."""
+        if self.pending_cr:
+            self.f.write(b'\r')
+            self.pending_cr = False
+
+
+def read_gitfile(path):
+    """Read the Git directory that a "gitfile" points to.
+
+    Git worktrees and submodules have a `.git` file, rather than a directory, containing `gitdir: <path>`.
+
+    Args:
+        path: The path of the `.git` file.
+
+    Returns:
+        The absolute path of the Git directory, or `None` if this isn't a valid gitfile.
+    """
+    try:
+        with open(path, 'r') as f:
+            content = f.read(4096)
+    except (IOError, OSError):
+        return None
+    if not content.startswith('gitdir:'):
+        return None
+    git_dir = content[len('gitdir:'):].strip()
+    git_dir = os.path.normpath(os.path.join(os.path.dirname(path), git_dir))
+    if not os.path.isdir(git_dir):
+        return None
+    return git_dir
+
+
 class GitHelper(VCSHelper):
     """VCSHelper implementation for Git repositories."""
 
-    STAT_CHANGED_FILE = re.compile('\s*([\w\.\-\/ ]+)\s*\|')
+    DIFF_FILE_START = 'diff --git '
+    DIFF_COMBINED_FILE_START = 'diff --cc '
+    # Where the new path can start in a `diff --git` header.
+    DIFF_NEW_PATH = re.compile(' "?b/')
+    # Escapes in quoted paths, other than octal ones.
+    C_ESCAPES = {'a': 7, 'b': 8, 't': 9, 'n': 10, 'v': 11, 'f': 12, 'r': 13, '"': 34, '\\': 92}
+    OCTAL_ESCAPE = re.compile('[0-3][0-7]{2}')
+    # Object ID for content that isn't in Git yet (i.e. in the working copy) or doesn't exist.
+    NULL_BLOB = '0' * 40
     DIFF_MATCH_MERGE_BASE = re.compile('(.*)\.\.\.(.*)')
     DIFF_MATCH = re.compile('(.*)\.\.(.*)')
 
-    def __init__(self, repo_base, debug=False):
+    # Never use a pager, colours or unusual quoting.
+    GLOBAL_ARGS = ['--no-pager', '-c', 'color.ui=never', '-c', 'core.quotepath=off']
+    # Never take the index lock just to refresh it - that slows things down and can conflict with other Git commands.
+    ENV = {'GIT_OPTIONAL_LOCKS': '0', 'GIT_PAGER': 'cat'}
+    UNSET_ENV = ['GIT_EXTERNAL_DIFF', 'GIT_DIFF_OPTS']
+    # Always produce a plain diff of the real content.
+    DIFF_ARGS = ['diff', '--no-ext-diff', '--no-color', '--no-textconv']
+
+    def __init__(self, repo_base):
         """Constructor
 
         Args:
             repo_base: The base directory of the repo.
         """
         self.repo_base = repo_base
-        self.got_changed_files = False
         self.vcs = 'git'
-        self.debug = debug
+        self.cat_file = GitCatFile(self)
+        self.cat_file_check = GitCatFile(self, check_only=True)
+        self.object_store = None
+        self.object_store_lock = threading.Lock()
+
+    # Merge bases of pairs of commits, which never change - shared by all diffs.
+    merge_bases = {}
+
+    def get_changed_files(self, diff_args, paths=None, context=None):
+        return list(self.iter_changed_files(diff_args, paths, context))
+
+    def iter_changed_files(self, diff_args, paths=None, context=None):
+        context = context or VCSContext()
+        if paths is None:
+            if context.got_changed_files:
+                return
+            context.got_changed_files = True
+
+        # Find the changed files first - this is quick and gives exact filenames, even if they need quoting in the diff.
+        args = self.get_diff_args(diff_args, paths)
+        with context.perf.span('stat'):
+            changed_files = self.get_changed_file_details(args, context)
+        if not changed_files:
+            return
+
+        # Then a single diff for the whole change set, split into sections on the `diff --git` lines.  Sections come in
+        # the same order as the files, but are matched to them by the paths in their headers: a file can have more than
+        # one section (a change between a symlink and a regular file is a deletion then an addition), and unmerged
+        # files get a combined `diff --cc` section, which isn't shown.
+        files_by_paths = {}
+        for (i, file_diff) in enumerate(changed_files):
+            if not file_diff.unmerged:
+                files_by_paths[(file_diff.old_filename, file_diff.filename)] = i
+        diff_lines = self.vcs_command_lines(
+            self.DIFF_ARGS + ['-U0', '-M', '--src-prefix=a/', '--dst-prefix=b/'] + args, context)
+        section_starts = (self.DIFF_FILE_START, self.DIFF_COMBINED_FILE_START)
+        (pending, pending_lines, next_file) = (None, [], 0)
+        # Whether the current lines are the header of another section for the pending file.
+        in_extra_header = False
+        for line in diff_lines:
+            if line.startswith(section_starts):
+                i = self.find_header_file(line, files_by_paths)
+                if pending is not None and i is not None and changed_files[i] is pending:
+                    # Keep the section's hunks, but not its header.
+                    in_extra_header = True
+                    continue
+                # Each file is produced as soon as its diff ends.
+                if pending is not None:
+                    pending.diff_text = ''.join(pending_lines)
+                    yield pending
+                    pending = None
+                if i is None or i < next_file:
+                    if context.debug:
+                        print("** Skipping diff section: {}".format(line.rstrip()))
+                    continue
+                # Files without a section (e.g. unmerged files) have nothing to wait for.
+                for file_diff in changed_files[next_file:i]:
+                    yield file_diff
+                (pending, pending_lines, next_file, in_extra_header) = (changed_files[i], [line], i + 1, False)
+            elif pending is not None:
+                if in_extra_header and line.startswith('@@'):
+                    in_extra_header = False
+                if not in_extra_header:
+                    pending_lines.append(line)
+
+        if pending is not None:
+            pending.diff_text = ''.join(pending_lines)
+            yield pending
+        for file_diff in changed_files[next_file:]:
+            yield file_diff
+
+    def find_header_file(self, header, files_by_paths):
+        """Find which file a section of the diff is for.
+
+        Args:
+            header: The first line of the section - `diff --git a/<old path> b/<new path>`.
+            files_by_paths: The index of each file in the diff, by its `(old_filename, filename)`.
+
+        Returns:
+            The index of the file, or `None` if the section isn't for any of them.
+        """
+        header = header.rstrip('\r\n')
+        if not header.startswith(self.DIFF_FILE_START):
+            return None
+        paths = header[len(self.DIFF_FILE_START):]
+
+        # Paths with unusual characters are quoted.  Unquoted ones can contain spaces (or even ` b/`), so try each place
+        # the new path could start.
+        if paths.startswith('"'):
+            (old_path, rest) = self.split_quoted_path(paths)
+            splits = [(old_path, rest[1:])] if old_path is not None and rest.startswith(' ') else []
+        else:
+            splits = [(paths[:match.start()], paths[match.start() + 1:])
+                      for match in self.DIFF_NEW_PATH.finditer(paths)]
+        for (old_path, new_path) in splits:
+            if new_path.startswith('"'):
+                (new_path, rest) = self.split_quoted_path(new_path)
+                if new_path is None or rest:
+                    continue
+            if old_path.startswith('a/') and new_path.startswith('b/'):
+                i = files_by_paths.get((old_path[2:], new_path[2:]))
+                if i is not None:
+                    return i
+        return None
 
-    def get_changed_files(self, diff_args):
+    @classmethod
+    def split_quoted_path(cls, text):
+        """Split a path that Git has quoted (as a C string, with UTF-8 bytes that may be octal escapes) from the start
+        of some text.
+
+        Args:
+            text: The text, starting with the opening quote.
+
+        Returns:
+            A tuple of `(path, rest)` - the unquoted path, and the text after the closing quote.  `(None, text)` if the
+            path isn't quoted correctly.
+        """
+        path = bytearray()
+        i = 1
+        while i < len(text):
+            c = text[i]
+            if c == '"':
+                return (path.decode('utf-8', 'replace'), text[i + 1:])
+            if c != '\\':
+                path.extend(c.encode('utf-8'))
+                i += 1
+            elif text[i + 1:i + 2] in cls.C_ESCAPES:
+                path.append(cls.C_ESCAPES[text[i + 1]])
+                i += 2
+            elif cls.OCTAL_ESCAPE.match(text, i + 1):
+                path.append(int(text[i + 1:i + 4], 8))
+                i += 4
+            else:
+                break
+        return (None, text)
+
+    def get_changed_file_details(self, args, context=None):
+        """Get the details of each changed file, without the diff itself.
+
+        Uses `git diff --raw --numstat -z`, which gives exact (NUL-terminated) filenames, the old and new blob IDs,
+        renames, and whether each file is binary.
+
+        Args:
+            args: The diff args that define which files have changed, as a list - see `get_diff_args`.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            A list of `FileDiff` objects, with empty diff text.
+        """
+        output = self.vcs_command(self.DIFF_ARGS + ['--raw', '--numstat', '-z', '-M', '--no-abbrev'] + args, context)
+        fields = output.split('\0')
         files = []
-        if not self.got_changed_files:
-            diff_stat = self.vcs_command(['diff', '--stat=9999', diff_args])
-            for line in diff_stat.split('\n'):
-                match = self.STAT_CHANGED_FILE.match(line)
-                if match:
-                    filename = match.group(1).rstrip()
-                    abs_filename = os.path.join(self.repo_base, filename)
-
-                    # Get the diff text for this file.
-                    diff_text = self.vcs_command(
-                        ['diff',
-                         diff_args,
-                         '-U0',
-                         '--',
-                         '"{}"'.format(filename)])
-                    files.append(FileDiff(filename, abs_filename, diff_text))
-        self.got_changed_files = True
+
+        # Raw output comes first - for each file:
+        # `:<old mode> <new mode> <old blob> <new blob> <status>\0<path>\0` or, for renames and copies,
+        # `:<old mode> <new mode> <old blob> <new blob> <status>\0<old path>\0<new path>\0`
+        files_by_name = {}
+        i = 0
+        while i < len(fields) and fields[i].startswith(':'):
+            (_, _, old_blob, new_blob, status) = fields[i][1:].split(' ')
+            if status[0] in 'RC':
+                (old_filename, filename) = fields[i + 1:i + 3]
+                i += 3
+            else:
+                old_filename = filename = fields[i + 1]
+                i += 2
+
+            # Unmerged files are also listed against one side of the merge, but only get a combined diff - keep one
+            # entry for them.
+            listed = files_by_name.get(filename)
+            if listed is not None and (listed.unmerged or status[0] == 'U'):
+                listed.unmerged = True
+                continue
+
+            file_diff = FileDiff(filename, os.path.join(self.repo_base, filename), '')
+            file_diff.old_filename = old_filename
+            file_diff.old_blob = old_blob if old_blob != self.NULL_BLOB else None
+            file_diff.new_blob = new_blob if new_blob != self.NULL_BLOB else None
+            file_diff.unmerged = (status[0] == 'U')
+            files_by_name[filename] = file_diff
+            files.append(file_diff)
+
+        # Then the numstat output, in the same order:
+        # `<added>\t<deleted>\t<path>\0` or, for renames and copies, `<added>\t<deleted>\t\0<old path>\0<new path>\0`
+        # The counts are `-` for binary files.
+        numstats = {}
+        while i < len(fields) and fields[i]:
+            (added, deleted, filename) = fields[i].split('\t', 2)
+            if filename:
+                i += 1
+            else:
+                filename = fields[i + 2]
+                i += 3
+            numstats[filename] = (added, deleted)
+
+        for file_diff in files:
+            (added, deleted) = numstats.get(file_diff.filename, ('-', '-'))
+            file_diff.binary = (added == '-')
+            file_diff.content_changed = file_diff.binary or (added, deleted) != ('0', '0')
+            if not file_diff.binary:
+                (file_diff.added_lines, file_diff.deleted_lines) = (int(added), int(deleted))
+
         return files
 
-    def get_file_versions(self, diff_args):
+    def get_diff_args(self, diff_args, paths=None):
+        args = self.split_args(diff_args)
+        if paths:
+            # The paths replace any the user gave, since Git would diff files matching either - callers check that the
+            # paths are covered by the user's with `is_in_diff`.
+            if '--' in args:
+                args = args[:args.index('--')]
+            args += ['--'] + paths
+        return args
+
+    def is_in_diff(self, diff_args, filename):
+        args = self.split_args(diff_args)
+        if '--' not in args:
+            return True
+        pathspecs = [self.parse_pathspec(pathspec) for pathspec in args[args.index('--') + 1:]]
+        if None in pathspecs:
+            # Magic that isn't handled here - don't add files that might be outside the diff.
+            return False
+        included = [p for p in pathspecs if not p[1]]
+        excluded = [p for p in pathspecs if p[1]]
+        return ((not included or any(self.pathspec_matches(p, filename) for p in included)) and
+                not any(self.pathspec_matches(p, filename) for p in excluded))
+
+    @classmethod
+    def parse_pathspec(cls, pathspec):
+        """Parse a Git pathspec, as given relative to the repo base.
+
+        Handles the `top`, `exclude`, `literal` and `icase` magic, in their long (`:(exclude)dir`) and short (`:!dir`)
+        forms.
+
+        Args:
+            pathspec: The pathspec.
+
+        Returns:
+            A tuple of `(pattern, exclude, literal, icase)`, or `None` if the pathspec uses other magic.
+        """
+        magic = set()
+        if pathspec.startswith(':('):
+            end = pathspec.find(')')
+            if end == -1:
+                return None
+            magic.update(word.strip() for word in pathspec[2:end].split(','))
+            pathspec = pathspec[end + 1:]
+        elif pathspec.startswith(':'):
+            pathspec = pathspec[1:]
+            while pathspec[:1] in ('/', '!', '^'):
+                magic.add('exclude' if pathspec[0] in '!^' else 'top')
+                pathspec = pathspec[1:]
+            if pathspec.startswith(':'):
+                pathspec = pathspec[1:]
+        if not magic <= set(['top', 'exclude', 'literal', 'icase']):
+            return None
+
+        # Commands run in the repo base, so `top` changes nothing.
+        while pathspec.startswith('./'):
+            pathspec = pathspec[2:]
+        pathspec = pathspec.rstrip('/')
+        if pathspec == '.':
+            pathspec = ''
+        return (pathspec, 'exclude' in magic, 'literal' in magic, 'icase' in magic)
+
+    @classmethod
+    def pathspec_matches(cls, pathspec, filename):
+        """Whether a parsed pathspec matches a file - itself, a directory it's in, or (for wildcards) a pattern.
+
+        Args:
+            pathspec: The pathspec, as returned by `parse_pathspec`.
+            filename: The file, relative to the repo base.
+        """
+        (pattern, _, literal, icase) = pathspec
+        if not pattern:
+            return True
+        if icase:
+            (pattern, filename) = (pattern.lower(), filename.lower())
+        if filename == pattern or filename.startswith(pattern + '/'):
+            return True
+        if literal or not any(c in pattern for c in '*?['):
+            return False
+        # Without the `glob` magic, wildcards match `/` too - so patterns match files in subdirectories.
+        parts = filename.split('/')
+        return any(fnmatch.fnmatchcase('/'.join(parts[:i]), pattern) for i in range(1, len(parts) + 1))
+
+    def get_file_versions(self, diff_args, context=None):
         # Merge base diff
         match = self.DIFF_MATCH_MERGE_BASE.match(diff_args)
         if match:
             base1 = match.group(1) or 'HEAD'
             base2 = match.group(2) or 'HEAD'
-            merge_base = self.vcs_command(['merge-base', base1, base2])
-            # merge_base comes back with a newline on the end - strip it.
-            return (merge_base.rstrip(), base2)
+            return (self.get_merge_base(base1, base2, context), base2)
 
         # Normal diff
         match = self.DIFF_MATCH.match(diff_args)
@@ -210,63 +909,394 @@ class GitHelper(VCSHelper):
         # HEAD to WC comparison
         return ('HEAD', '')
 
-    def get_file_content(self, filename, version):
-        git_args = ['show', '{}:"{}"'.format(version, filename)]
+    def get_merge_base(self, base1, base2, context=None):
+        """Find the best common ancestor of two revisions.
+
+        The result is remembered for the commits the revisions resolve to, when they can be resolved in-process.
+
+        Args:
+            base1: The first revision.
+            base2: The second revision.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The merge base's SHA.
+        """
+        object_store = self.get_object_store(context)
+        key = None
+        if object_store is not None:
+            key = (object_store.resolve_rev(base1), object_store.resolve_rev(base2))
+            if None in key:
+                key = None
+            elif key in GitHelper.merge_bases:
+                return GitHelper.merge_bases[key]
+
+        # The merge base comes back with a newline on the end - strip it.
+        merge_base = self.vcs_command(['merge-base', base1, base2], context).rstrip()
+        if key is not None and merge_base:
+            GitHelper.merge_bases[key] = merge_base
+        return merge_base
+
+    def get_diff_cache_key(self, diff_args, versions, context=None):
+        commits = []
+        for version in versions:
+            if version == '':
+                # The working copy - see `get_working_copy_state`.
+                commits.append('')
+                continue
+            commit = self.resolve_commit(version, context)
+            if commit is None:
+                return None
+            commits.append(commit)
+        return [self.vcs, self.repo_base, diff_args] + commits
+
+    def get_working_copy_state(self, diff_args, context=None):
+        # Which files are changed, and their blob IDs, come from Git (including any changes to the index).  Git doesn't
+        # hash working copy files, so use their modification times and sizes for those.
+        state = []
+        for changed_file in self.get_changed_file_details(self.get_diff_args(diff_args), context):
+            try:
+                st = os.stat(changed_file.abs_filename)
+                stamp = [st.st_mtime, st.st_size]
+            except OSError:
+                stamp = None
+            state.append([changed_file.filename, changed_file.old_filename, changed_file.old_blob,
+                          changed_file.new_blob, changed_file.content_changed, stamp])
+        return state
+
+    def resolve_commit(self, version, context=None):
+        """Find the commit a revision currently refers to.
+
+        Resolved in-process if possible, otherwise with `git rev-parse`.  Each revision is only resolved once per diff.
+
+        Args:
+            version: The revision, e.g. `HEAD~1`.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The commit's SHA, or `None` if the revision doesn't refer to a commit.
+        """
+        context = context or VCSContext()
+        if version not in context.commits:
+            object_store = self.get_object_store(context)
+            commit = object_store.resolve_rev(version) if object_store is not None else None
+            if commit is None:
+                commit = self.vcs_command(
+                    ['rev-parse', '--verify', '--quiet', version + '^{commit}'], context).strip() or None
+            context.commits[version] = commit
+        return context.commits[version]
+
+    def get_file_content(self, filename, version, context=None):
+        content = self.read_blob(filename, version, context)
+        if content is None:
+            content = self.cat_file.get_object('{}:{}'.format(version, filename), context)
+        if content is None:
+            # Missing in this version (e.g. the file was added or deleted).
+            return ''
+        return content.decode('utf-8', 'replace')
+
+    def write_file_content(self, filename, version, path, context=None):
+        content = self.read_blob(filename, version, context)
+        with open(path, 'wb') as f:
+            converter = CRLFConverter(f)
+            if content is None:
+                self.cat_file.write_object('{}:{}'.format(version, filename), converter.write, context)
+            else:
+                converter.write(content)
+            converter.close()
+
+    def write_version_content(self, changed_file, version, old, path, context=None):
+        # The contents are cached by blob ID, so read that blob rather than `<version>:<path>` - they differ when the
+        # diff is against the index (e.g. a plain `git diff` of a staged file).
+        blob = changed_file.old_blob if old else changed_file.new_blob
+        if blob is None:
+            VCSHelper.write_version_content(self, changed_file, version, old, path, context)
+            return
+
+        context = context or VCSContext()
+        object_store = self.get_object_store(context)
+        content = object_store.get_blob(blob) if object_store is not None else None
+        with open(path, 'wb') as f:
+            converter = CRLFConverter(f)
+            if content is None:
+                self.cat_file.write_object(blob, converter.write, context)
+            else:
+                context.perf.count('objects read in-process')
+                context.perf.count('bytes read in-process', len(content))
+                converter.write(content)
+            converter.close()
+
+    def read_blob(self, filename, version, context=None):
+        """Read the contents of a file at a specific version in-process, without running Git.
+
+        Args:
+            filename: The file.
+            version: The version.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The contents as bytes (empty if the file doesn't exist in this version), or `None` if they can't be read
+            in-process - use `git cat-file` instead.
+        """
+        context = context or VCSContext()
+        object_store = self.get_object_store(context)
+        if object_store is None:
+            return None
+
+        # The store only understands SHAs and ref names, so anything else (e.g. `HEAD~1`) is resolved with Git - once
+        # per diff, rather than once per file.
+        commit = self.resolve_commit(version, context)
+        if commit is None:
+            return None
+
         try:
-            content = self.vcs_command(git_args)
-        except UnicodeDecodeError:
-            content = "Unable to decode file..."
+            content = object_store.read_blob(commit, filename)
+        except PathNotFoundError:
+            return b''
+        if content is None:
+            if context.debug:
+                print("** Can't read {}:{} in-process - using git cat-file".format(version, filename))
+        else:
+            context.perf.count('objects read in-process')
+            context.perf.count('bytes read in-process', len(content))
         return content
 
+    def get_object_store(self, context=None):
+        """Get the in-process reader for the repo's objects.
+
+        Args:
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The `GitObjectStore`, or `None` if in-process reading is disabled or the repo isn't supported.
+        """
+        context = context or VCSContext()
+        if not context.in_process:
+            return None
+        # Diffs can run at the same time, so make sure they share one store.
+        with self.object_store_lock:
+            if self.object_store is None:
+                git_dir = os.path.join(self.repo_base, '.git')
+                if not os.path.isdir(git_dir):
+                    git_dir = read_gitfile(git_dir)
+                try:
+                    if git_dir is None:
+                        raise UnsupportedRepoError("No Git directory")
+                    self.object_store = GitObjectStore(git_dir)
+                except (UnsupportedRepoError, IOError, OSError) as e:
+                    if context.debug:
+                        print("** Not reading Git objects in-process: {}".format(e))
+                    # Don't try again.
+                    self.object_store = False
+        return self.object_store or None
+
+    def get_content_key(self, changed_file, version, old):
+        # Blob IDs are already content addresses.
+        return changed_file.old_blob if old else changed_file.new_blob
+
+    def get_file_size(self, changed_file, version, old, context=None):
+        blob = changed_file.old_blob if old else changed_file.new_blob
+        if blob is None:
+            return None
+        object_store = self.get_object_store(context)
+        if object_store is not None:
+            size = object_store.get_size(blob)
+            if size is not None:
+                return size
+        return self.cat_file_check.get_size(blob, context)
+
+    def close(self):
+        self.cat_file.close()
+        self.cat_file_check.close()
+        if self.object_store:
+            self.object_store.close()
+
+
+class GitCatFile(object):
+    """A long-lived `git cat-file --batch` process for retrieving objects from a Git repo.
+
+    The process is started on first use, and reused for every request until `close` is called.  Each request writes an
+    object name to the process's stdin, and reads back a header line and the sized object contents from its stdout.
+    The process is shared by all diffs in the repo, so each request is made with the `VCSContext` of the diff it's for.
+
+    With `check_only`, the process is `git cat-file --batch-check`, which only returns the header - use `get_size`.
+    """
+
+    OBJECT_TYPES = (b'blob', b'tree', b'commit', b'tag')
+
+    def __init__(self, git_helper, check_only=False):
+        """Constructor.
+
+        Args:
+            git_helper: The `GitHelper` for the repo.
+            check_only: Whether to only get objects' sizes, not their contents.
+        """
+        self.git_helper = git_helper
+        self.batch_option = '--batch-check' if check_only else '--batch'
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self, context):
+        """Start the `git cat-file` process, if it isn't already running.
+
+        Args:
+            context: The `VCSContext` for the diff that needs the process.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.process = self.git_helper.popen(
+                ['cat-file', self.batch_option],
+                context,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL)
+
+    def get_object(self, object_name, context=None):
+        """Get the contents of an object.
+
+        Args:
+            object_name: Anything `git cat-file` understands, e.g. a SHA or `<rev>:<path>`.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The object's contents as bytes, or `None` if the object doesn't exist.
+        """
+        chunks = []
+        if self._request(object_name, context, chunks.append) is None:
+            return None
+        return b''.join(chunks)
+
+    def write_object(self, object_name, write_fn, context=None):
+        """Output the contents of an object in chunks, without holding them all in memory.
+
+        Args:
+            object_name: Anything `git cat-file` understands, e.g. a SHA or `<rev>:<path>`.
+            write_fn: Function called with each chunk of the contents, as bytes.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The object's size in bytes, or `None` if the object doesn't exist (in which case `write_fn` isn't called).
+        """
+        return self._request(object_name, context, write_fn)
+
+    def get_size(self, object_name, context=None):
+        """Get the size of an object.
+
+        Args:
+            object_name: Anything `git cat-file` understands, e.g. a SHA or `<rev>:<path>`.
+            context: [optional] The `VCSContext` for the diff.
+
+        Returns:
+            The object's size in bytes, or `None` if the object doesn't exist.
+        """
+        return self._request(object_name, context)
+
+    def close(self):
+        """Stop the `git cat-file` process."""
+        with self.lock:
+            self._stop()
+
+    def _request(self, object_name, context, write_fn=None):
+        if '\n' in object_name:
+            # Can't be expressed in the batch protocol.
+            return None
+
+        context = context or VCSContext()
+        with self.lock:
+            self.start(context)
+            # The process outlives the diff, so only watch it for cancellation during each request.  No timeout - it
+            # only reads local objects, and starting a timer for every request would cost more than the requests.
+            process = self.process
+            cancel_token = context.cancel_token
+            context.perf.count('git cat-file requests')
+            cancel_token.register(process)
+            try:
+                self.process.stdin.write(object_name.encode('utf-8') + b'\n')
+                self.process.stdin.flush()
+
+                # Header is `<sha> <type> <size>`, or `<object_name> missing` (or `ambiguous`) - where the object name
+                # can contain spaces.
+                header = self.process.stdout.readline().rstrip(b'\n').rsplit(b' ', 2)
+                if len(header) != 3 or header[1] not in self.OBJECT_TYPES or not header[2].isdigit():
+                    return None
+                size = int(header[2])
+                if self.batch_option == '--batch-check':
+                    return size
+
+                remaining = size
+                while remaining > 0:
+                    chunk = self.process.stdout.read(min(remaining, CRLFConverter.CHUNK_SIZE))
+                    if not chunk:
+                        raise IOError("git cat-file output ended early")
+                    write_fn(chunk)
+                    remaining -= len(chunk)
+
+                # Contents are followed by a newline.
+                self.process.stdout.read(1)
+                context.perf.count('bytes read from VCS', size)
+            except (IOError, OSError, ValueError):
+                # The process has died; it will be restarted on the next request.
+                if context.debug:
+                    print("**** git cat-file {} in {} failed".format(self.batch_option, self.git_helper.repo_base))
+                self._stop()
+                cancel_token.check()
+                return None
+            finally:
+                cancel_token.unregister(process)
+            return size
+
+    def _stop(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
 
 class SVNHelper(VCSHelper):
     """VCSHelper implementation for SVN repositories."""
 
-    STATUS_CHANGED_FILE = re.compile('\s*[AM][\+CMLSKOTB\s]*([\w\.\-\/\\\\ ]+)')
+    DIFF_FILE_START = 'Index: '
+    DIFF_HAS_CHANGES = re.compile('^(@@ |Cannot display: )', re.MULTILINE)
     DUAL_REV_MATCH = re.compile('-r *(\d+):(\d+)')
     REV_MATCH = re.compile('-r *(\d+)')
     COMMIT_MATCH = re.compile('-c *(\d+)')
 
-    def __init__(self, repo_base, debug=False):
+    # Never prompt for input, and always use SVN's own diff rather than any configured `diff-cmd`.
+    GLOBAL_ARGS = ['--non-interactive']
+    DIFF_ARGS = ['diff', '--internal-diff']
+
+    def __init__(self, repo_base):
         self.repo_base = repo_base
-        self.got_changed_files = False
         self.vcs = 'svn'
-        self.debug = debug
 
-    def get_changed_files(self, diff_args):
-        files = []
-        if not self.got_changed_files:
-            if self.DUAL_REV_MATCH.match(diff_args):
-                # Comparison between 2 revisions
-                status_text = self.vcs_command(['diff', diff_args, '--summarize'])
-            elif self.REV_MATCH.match(diff_args):
-                # Can only compare this against HEAD
-                status_text = self.vcs_command(['diff', diff_args + ':HEAD', '--summarize'])
-            elif self.COMMIT_MATCH.match(diff_args):
-                # Commit match
-                status_text = self.vcs_command(['diff', diff_args, '--summarize'])
-            else:
-                # Show uncommitted changes
-                status_text = self.vcs_command(['status', diff_args])
-            for line in status_text.split('\n'):
-                match = self.STATUS_CHANGED_FILE.match(line)
-                if match:
-                    filename = match.group(1).rstrip()
-                    abs_filename = os.path.join(self.repo_base, filename)
-
-                    # Don't add directories to the list
-                    if not os.path.isdir(abs_filename):
-                        # Get the diff text for this file.
-                        diff_text = self.vcs_command(
-                            ['diff',
-                             diff_args,
-                             '"{}"'.format(filename)])
-                        files.append(FileDiff(filename, abs_filename, diff_text))
-
-        self.got_changed_files = True
-        return files
+    def get_changed_files(self, diff_args, paths=None, context=None):
+        return list(self.iter_changed_files(diff_args, paths, context))
 
-    def get_file_versions(self, diff_args):
+    def iter_changed_files(self, diff_args, paths=None, context=None):
+        context = context or VCSContext()
+        if paths is None:
+            if context.got_changed_files:
+                return
+            context.got_changed_files = True
+
+        if self.REV_MATCH.match(diff_args) and not self.DUAL_REV_MATCH.match(diff_args):
+            # Can only compare this against HEAD
+            diff_args += ':HEAD'
+
+        # A single diff for the whole change set, split into files on the `Index: ` lines.
+        diff_lines = self.vcs_command_lines(self.DIFF_ARGS + self.get_diff_args(diff_args, paths), context)
+        for file_diff_text in self.split_diff(diff_lines, self.DIFF_FILE_START):
+            # Skip sections with only property changes - e.g. for directories.
+            if self.DIFF_HAS_CHANGES.search(file_diff_text):
+                filename = file_diff_text[len(self.DIFF_FILE_START):].split('\n', 1)[0].rstrip()
+                abs_filename = os.path.join(self.repo_base, filename)
+                yield FileDiff(filename, abs_filename, file_diff_text)
+
+    def get_file_versions(self, diff_args, context=None):
         # Diff between two versions?
         match = self.DUAL_REV_MATCH.match(diff_args)
         if match:
@@ -287,9 +1317,21 @@ class SVNHelper(VCSHelper):
         # Compare HEAD against WC
         return ('-r HEAD', '')
 
-    def get_file_content(self, filename, version):
+    def get_content_key(self, changed_file, version, old):
+        # Only numbered revisions are fixed - not e.g. HEAD.
+        match = self.REV_MATCH.match(version)
+        if not match:
+            return None
+        filename = changed_file.old_filename if old else changed_file.filename
+        key = '\0'.join([self.repo_base, match.group(1), filename])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get_file_content_args(self, filename, version):
+        return ['cat'] + self.split_args(version) + [filename]
+
+    def get_file_content(self, filename, version, context=None):
         try:
-            content = self.vcs_command(['cat', version, '"{}"'.format(filename)])
+            content = self.vcs_command(self.get_file_content_args(filename, version), context)
         except UnicodeDecodeError:
             content = "Unable to decode file..."
         return content
@@ -298,41 +1340,45 @@ class SVNHelper(VCSHelper):
 class BzrHelper(VCSHelper):
     """VCSHelper implementation for Bzr repositories."""
 
-    STAT_CHANGED_FILE = re.compile('\s*([\w\.\-\/ ]+)\s*\|')
+    DIFF_FILE_START = '=== '
+    DIFF_FILE_HEADER = re.compile("=== [\\w ]+ file '(.*?)'(?: => '(.*)')?")
     DIFF_MATCH = re.compile('(.*)\.\.(.*)')
 
-    def __init__(self, repo_base, debug=False):
+    # Ignore user-defined command aliases (which may add arbitrary options), and don't draw progress bars.
+    GLOBAL_ARGS = ['--no-aliases']
+    ENV = {'BZR_PROGRESS_BAR': 'none'}
+
+    def __init__(self, repo_base):
         """Constructor
 
         Args:
             repo_base: The base directory of the repo.
         """
         self.repo_base = repo_base
-        self.got_changed_files = False
         self.vcs = 'bzr'
-        self.debug = debug
 
-    def get_changed_files(self, diff_args):
-        files = []
-        if not self.got_changed_files:
-            diff = self.vcs_command(['diff', diff_args])
-            diff_stat = str(self.DiffStat(diff))
-            for line in diff_stat.split('\n'):
-                match = self.STAT_CHANGED_FILE.match(line)
-                if match:
-                    filename = match.group(1).rstrip()
-                    abs_filename = os.path.join(self.repo_base, filename)
-
-                    # Get the diff text for this file.
-                    diff_text = self.vcs_command(
-                        ['diff',
-                         diff_args,
-                         '"{}"'.format(filename)])
-                    files.append(FileDiff(filename, abs_filename, diff_text))
-        self.got_changed_files = True
-        return files
+    def get_changed_files(self, diff_args, paths=None, context=None):
+        return list(self.iter_changed_files(diff_args, paths, context))
 
-    def get_file_versions(self, diff_args):
+    def iter_changed_files(self, diff_args, paths=None, context=None):
+        context = context or VCSContext()
+        if paths is None:
+            if context.got_changed_files:
+                return
+            context.got_changed_files = True
+
+        # A single diff for the whole change set, split into files on the `=== ` lines.
+        diff_lines = self.vcs_command_lines(['diff'] + self.get_diff_args(diff_args, paths), context)
+        for file_diff_text in self.split_diff(diff_lines, self.DIFF_FILE_START):
+            # Directories have headers like `=== added directory 'dir'` - skip them.
+            match = self.DIFF_FILE_HEADER.match(file_diff_text)
+            if match:
+                # Use the new name for renamed files.
+                filename = match.group(2) or match.group(1)
+                abs_filename = os.path.join(self.repo_base, filename)
+                yield FileDiff(filename, abs_filename, file_diff_text)
+
+    def get_file_versions(self, diff_args, context=None):
         # Normal diff
         match = self.DIFF_MATCH.match(diff_args)
         if match:
@@ -345,125 +1391,12 @@ class BzrHelper(VCSHelper):
         # Last revision to WC comparison
         return ('last:1', '')
 
-    def get_file_content(self, filename, version):
-        bzr_args = ['cat', '-r {}'.format(version), filename]
+    def get_file_content_args(self, filename, version):
+        return ['cat', '-r', version, filename]
+
+    def get_file_content(self, filename, version, context=None):
         try:
-            content = self.vcs_command(bzr_args)
+            content = self.vcs_command(self.get_file_content_args(filename, version), context)
         except UnicodeDecodeError:
             content = "Unable to decode file..."
         return content
-
-    class DiffStat(object):
-        def __init__(self, lines):
-            self.maxname = 0
-            self.maxtotal = 0
-            self.total_adds = 0
-            self.total_removes = 0
-            self.stats = {}
-            self.files = []
-            self.__parse(lines.split('\n'))
-
-        def __parse(self, lines):
-            adds = 0
-            removes = 0
-            current = None
-
-            # This regex is supposed to take into account the timestamp at the end
-            # of the filename, so we can exclude it when outputting the filename
-            filename_re = re.compile(r'^(---|\+\+\+) (.*?)\s+[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2} \+[0-9]{4}$')
-
-            for line in lines:
-                if line.startswith('+') and not line.startswith('+++ '):
-                    adds += 1
-                elif line.startswith('-') and not line.startswith('--- '):
-                    removes += 1
-                elif line.startswith('=== '):
-                    self.__add_stats(current, adds, removes)
-
-                    adds = 0
-                    removes = 0
-                    context = 0
-                    current = None
-                else:
-                    match = filename_re.match(line)
-
-                    if match and \
-                    ((match.group(1) == '---' and current is None) or \
-                        (match.group(1) == '+++' and current == '/dev/null')):
-                        current = match.group(2)
-
-            self.__add_stats(current, adds, removes)
-
-        class Filestat:
-            def __init__(self):
-                self.adds = 0
-                self.removes = 0
-                self.total = 0
-
-        def __add_stats(self, file, adds, removes):
-            if file is None:
-                return
-            if file in self.stats:
-                fstat = self.stats[file]
-            else:
-                self.files.append(file)
-                fstat = self.Filestat()
-
-            fstat.adds += adds
-            fstat.removes += removes
-            fstat.total += adds + removes
-            self.stats[file] = fstat
-
-            self.maxname = max(self.maxname, len(file))
-            self.maxtotal = max(self.maxtotal, fstat.total)
-            self.total_adds += adds
-            self.total_removes += removes
-
-        def __str__(self):
-            if self.total_adds == self.total_removes == 0:
-                return ' 0 files changed'
-
-            # Work out widths
-            width = 78 - 5
-            countwidth = len(str(self.maxtotal))
-            graphwidth = width - countwidth - self.maxname
-            factor = 1
-
-            # The graph width can be <= 0 if there is a modified file with a
-            # filename longer than 'width'. Use a minimum of 10.
-            if graphwidth < 10:
-                graphwidth = 10
-
-            while (self.maxtotal / factor) > graphwidth:
-                factor += 1
-
-            s = ""
-
-            for file in self.files:
-                fstat = self.stats[file]
-
-                s += ' %-*s | %*.d ' % (self.maxname, file, countwidth, fstat.total)
-
-                # If diffstat runs out of room it doesn't print anything, which
-                # isn't very useful, so always print at least one + or 1
-                if fstat.adds > 0:
-                    adds = '+' * max(int(fstat.adds / factor), 1)
-                    s += adds
-
-                if fstat.removes > 0:
-                    removes = '-' * max(int(fstat.removes / factor), 1)
-                    s += removes
-
-                s += '\n'
-
-            if self.stats:
-                noun = 'files' if len(self.stats) > 1 else 'file'
-
-                s += ' %d %s changed, %d %s(+), %d %s(-)' % (
-                        len(self.stats), noun,
-                        self.total_adds,
-                        'insertions' if self.total_adds != 1 else 'insertion',
-                        self.total_removes,
-                        'deletions' if self.total_removes != 1 else 'deletion')
-
-            return s